@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import boto3
+import pytest
+
+from moto import mock_s3, mock_sqs
+
+BASELINES = Path(__file__).parent / "baselines"
+DEFAULT_STORAGE = "file://./.benchmarks"
+
+BUCKET_NAME = "benchmarks"
+QUEUE_NAME = "benchmarks"
+REGION_NAME = "us-east-1"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """
+    Saves and compares runs in benchmarks/baselines, unless --benchmark-storage
+    says otherwise
+    """
+    if getattr(config.option, "benchmark_storage", None) == DEFAULT_STORAGE:
+        config.option.benchmark_storage = f"file://{BASELINES}"
+
+
+@pytest.fixture
+def bucket():
+    with mock_s3():
+        s3_client = boto3.client("s3", region_name=REGION_NAME)
+        s3_client.create_bucket(Bucket=BUCKET_NAME)
+        yield BUCKET_NAME
+
+
+@pytest.fixture
+def queue_name():
+    with mock_sqs():
+        boto3.client("sqs", region_name=REGION_NAME).create_queue(QueueName=QUEUE_NAME)
+        yield QUEUE_NAME
+
+
+def bulk_results(size: int, error_every: int = 10) -> list:
+    """
+    Synthetic bulk API results, one in every error_every failing
+    """
+    return [
+        {
+            "success": index % error_every != 0,
+            "created": True,
+            "id": f"001{index:015d}",
+            "errors": []
+            if index % error_every
+            else [{"statusCode": "REQUIRED_FIELD_MISSING", "message": "Name"}],
+        }
+        for index in range(size)
+    ]
+
+
+def bulk_data(size: int) -> list:
+    return [
+        {"External_Id__c": str(index), "Name": f"Account {index}"}
+        for index in range(size)
+    ]
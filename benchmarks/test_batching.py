@@ -0,0 +1,35 @@
+import pytest
+
+from kicksaw_integration_utils.batching import iter_slices
+from kicksaw_integration_utils.utils import batch_collection
+
+pytest.importorskip("pytest_benchmark")
+
+RECORDS = [{"Id": str(index)} for index in range(1_000_000)]
+
+
+def islice_batches(iterable, size):
+    # what batch_collection did for every input
+    import itertools
+
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+@pytest.mark.parametrize("size", [10, 10_000])
+def test_islice(benchmark, size):
+    benchmark(lambda: sum(len(batch) for batch in islice_batches(RECORDS, size)))
+
+
+@pytest.mark.parametrize("size", [10, 10_000])
+def test_batch_collection(benchmark, size):
+    benchmark(lambda: sum(len(batch) for batch in batch_collection(RECORDS, size)))
+
+
+@pytest.mark.parametrize("size", [10, 10_000])
+def test_iter_slices(benchmark, size):
+    benchmark(lambda: sum(len(batch) for batch in iter_slices(RECORDS, size)))
@@ -0,0 +1,47 @@
+import random
+
+from urllib.parse import urlparse
+
+import pytest
+
+from kicksaw_integration_utils.domains import registered_domains
+from kicksaw_integration_utils.utils import extract_domain
+
+pytest.importorskip("pytest_benchmark")
+
+URLS = 1_000_000
+
+
+@pytest.fixture(scope="module")
+def urls():
+    random.seed(0)
+    suffixes = ["com", "co.uk", "com.au", "io", "de"]
+    websites = [
+        f"https://www.shop{index}.company{index}.{random.choice(suffixes)}/about"
+        for index in range(50_000)
+    ]
+    return [random.choice(websites) for _ in range(URLS)]
+
+
+def last_two_labels(url):
+    # what extract_domain(url, remove_subdomains=True) used to do
+    parsed = urlparse(url.replace("www.", "")).netloc
+    return ".".join(parsed.split(".")[-2:])
+
+
+def test_last_two_labels(benchmark, urls):
+    benchmark.pedantic(lambda: [last_two_labels(url) for url in urls], rounds=3)
+
+
+def test_extract_domain(benchmark, urls):
+    def run():
+        extract_domain.cache_clear()
+        return [extract_domain(url, remove_subdomains=True) for url in urls]
+
+    benchmark.pedantic(run, rounds=3)
+
+
+def test_registered_domains(benchmark, urls):
+    hosts = [urlparse(url).netloc for url in urls]
+
+    benchmark.pedantic(registered_domains, args=(hosts,), rounds=3)
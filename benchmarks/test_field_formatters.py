@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from kicksaw_integration_utils.field_formatters import (
+    convert_column_to_iso_date,
+    convert_to_iso_date,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+ROWS = 200_000
+
+
+def make_column(distinct: int):
+    random.seed(0)
+    dates = [
+        f"{random.randint(1950, 2030)}/{random.randint(1, 12):02d}/{random.randint(1, 31):02d}"
+        for _ in range(distinct)
+    ]
+    return [random.choice(dates) for _ in range(ROWS)]
+
+
+@pytest.fixture(params=[1_000, ROWS], ids=["repetitive", "distinct"])
+def column(request):
+    return make_column(request.param)
+
+
+def test_scalar(benchmark, column):
+    benchmark(lambda: [convert_to_iso_date(value) for value in column])
+
+
+def test_column(benchmark, column):
+    benchmark(convert_column_to_iso_date, column)
+
+
+def test_series(benchmark, column):
+    pd = pytest.importorskip("pandas")
+    series = pd.Series(column)
+
+    benchmark(convert_column_to_iso_date, series)
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from kicksaw_integration_utils.field_mapping import (
+    compile_column_mapping,
+    compile_mapping,
+)
+from kicksaw_integration_utils.field_formatters import convert_to_iso_date
+from kicksaw_integration_utils.utils import extract_domain
+
+pytest.importorskip("pytest_benchmark")
+
+ROWS = 1_000_000
+
+MAPPING = {
+    "fields": {
+        "Name": "name",
+        "Website": {"source": "url", "formatters": ["extract_domain"]},
+        "Birthdate": {"source": "dob", "formatters": ["iso_date"]},
+        "Industry": {
+            "source": "sector",
+            "lookup": {"tech": "Technology", "mining": "Mining"},
+            "default": "Other",
+        },
+        "LeadSource": {"constant": "Integration"},
+    }
+}
+
+
+@pytest.fixture(scope="module")
+def rows():
+    random.seed(0)
+    return [
+        {
+            "name": f"Account {index}",
+            "url": f"https://www.company{random.randint(0, 5000)}.com",
+            "dob": f"{random.randint(1950, 2005)}/{random.randint(1, 12):02d}/01",
+            "sector": random.choice(["tech", "mining", ""]),
+        }
+        for index in range(ROWS)
+    ]
+
+
+def handwritten(row):
+    return {
+        "Name": row.get("name"),
+        "Website": extract_domain(row["url"]) if row.get("url") is not None else None,
+        "Birthdate": convert_to_iso_date(row["dob"])
+        if row.get("dob") is not None
+        else None,
+        "Industry": {"tech": "Technology", "mining": "Mining"}.get(row.get("sector"))
+        or "Other",
+        "LeadSource": "Integration",
+    }
+
+
+def test_handwritten_rows(benchmark, rows):
+    benchmark.pedantic(lambda: [handwritten(row) for row in rows], rounds=3)
+
+
+def test_compiled_rows(benchmark, rows):
+    mapper = compile_mapping(MAPPING)
+
+    benchmark.pedantic(lambda: list(mapper.map_rows(rows)), rounds=3)
+
+
+def test_compiled_columns(benchmark, rows):
+    mapper = compile_column_mapping(MAPPING)
+    columns = {name: [row[name] for row in rows] for name in rows[0]}
+
+    benchmark.pedantic(mapper, args=(columns,), rounds=3)
+
+
+def test_compiled_data_frame(benchmark, rows):
+    pd = pytest.importorskip("pandas")
+    mapper = compile_column_mapping(MAPPING)
+    data_frame = pd.DataFrame(rows)
+
+    benchmark.pedantic(mapper, args=(data_frame,), rounds=3)
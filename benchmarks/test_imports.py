@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+# what a Lambda pays for on a cold start, before the handler runs
+MODULES = [
+    "kicksaw_integration_utils",
+    "kicksaw_integration_utils.utils",
+    "kicksaw_integration_utils.field_mapping",
+    "kicksaw_integration_utils.s3_helpers",
+    "kicksaw_integration_utils.orchestrator",
+    "kicksaw_integration_utils.aws.sqs",
+    "kicksaw_integration_utils.salesforce_client",
+]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import(benchmark, module):
+    # a fresh interpreter every round, so nothing's imported already
+    benchmark.pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", f"import {module}"],),
+        kwargs=dict(check=True),
+        rounds=5,
+    )
+
+
+def test_python_startup(benchmark):
+    # the floor the imports above are measured against
+    benchmark.pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", "pass"],),
+        kwargs=dict(check=True),
+        rounds=5,
+    )
@@ -0,0 +1,52 @@
+import pytest
+
+from kicksaw_integration_utils import instrumentation
+
+pytest.importorskip("pytest_benchmark")
+
+CALLS = 100_000
+
+
+def work():
+    return None
+
+
+def test_uninstrumented(benchmark):
+    def run():
+        for _ in range(CALLS):
+            work()
+
+    benchmark(run)
+
+
+def test_disabled_span(benchmark):
+    def run():
+        for _ in range(CALLS):
+            with instrumentation.span("work"):
+                work()
+
+    benchmark(run)
+
+
+def test_disabled_count(benchmark):
+    def run():
+        for _ in range(CALLS):
+            work()
+            instrumentation.count("work", operation="work")
+
+    benchmark(run)
+
+
+def test_enabled_span(benchmark):
+    instrumentation.enable(instrumentation.Exporter())
+    try:
+
+        def run():
+            for _ in range(CALLS):
+                with instrumentation.span("work"):
+                    work()
+            instrumentation.flush()
+
+        benchmark(run)
+    finally:
+        instrumentation.disable()
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from kicksaw_integration_utils.s3_helpers import download_file, move_file, upload_file
+
+pytest.importorskip("pytest_benchmark")
+
+SIZES = [1024, 1024 * 1024, 16 * 1024 * 1024]
+
+
+@pytest.fixture
+def local_file(tmp_path, request):
+    path = tmp_path / "upload.bin"
+    path.write_bytes(os.urandom(request.param))
+    return path
+
+
+@pytest.mark.parametrize("local_file", SIZES, indirect=True)
+def test_upload_file(benchmark, bucket, local_file):
+    benchmark(upload_file, local_file, bucket, "origin/upload.bin")
+
+
+@pytest.mark.parametrize("local_file", SIZES, indirect=True)
+def test_download_file(benchmark, bucket, local_file, tmp_path):
+    upload_file(local_file, bucket, "origin/download.bin")
+    downloads = tmp_path / "downloads"
+    path = benchmark(download_file, "origin/download.bin", bucket, downloads)
+    assert os.path.getsize(path) == os.path.getsize(local_file)
+
+
+@pytest.mark.parametrize("local_file", SIZES[:2], indirect=True)
+def test_move_file(benchmark, bucket, local_file):
+    def setup():
+        upload_file(local_file, bucket, "origin/move.bin")
+
+    benchmark.pedantic(
+        move_file,
+        args=("origin/move.bin", "archive/move.bin", bucket),
+        setup=setup,
+        rounds=5,
+    )
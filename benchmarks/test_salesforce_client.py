@@ -0,0 +1,27 @@
+import pytest
+
+from simple_mockforce import mock_salesforce
+from simple_mockforce.virtual import virtual_salesforce
+
+from kicksaw_integration_utils.salesforce_client import SfClient
+
+from benchmarks.conftest import bulk_data
+
+pytest.importorskip("pytest_benchmark")
+
+
+# mockforce matches upserts against every record it holds, so this measures
+# the client's batching and parsing more than anything at larger volumes
+@pytest.mark.parametrize("size", [1_000, 5_000])
+@mock_salesforce
+def test_bulk_upsert(benchmark, size):
+    salesforce = SfClient("username", "password", "security_token", "na")
+    data = bulk_data(size)
+    results = benchmark.pedantic(
+        salesforce.bulk.Account.upsert,
+        args=(data, "External_Id__c"),
+        # an empty org every round
+        setup=virtual_salesforce.provision,
+        rounds=3,
+    )
+    assert len(results) == size
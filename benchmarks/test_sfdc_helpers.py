@@ -0,0 +1,35 @@
+import pytest
+
+from kicksaw_integration_utils.csv_helpers import create_error_report
+from kicksaw_integration_utils.sfdc_helpers import parse_bulk_upsert_results
+
+from benchmarks.conftest import bulk_data, bulk_results
+
+pytest.importorskip("pytest_benchmark")
+
+SIZES = [10_000, 100_000]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_parse_bulk_upsert_results(benchmark, size):
+    results, data = bulk_results(size), bulk_data(size)
+    successes, errors = benchmark(
+        parse_bulk_upsert_results, results, data, "Account", "External_Id__c"
+    )
+    assert len(successes) + len(errors) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_create_error_report(benchmark, size, tmp_path):
+    # every result fails, so the report has size rows
+    results, data = bulk_results(size, error_every=1), bulk_data(size)
+    _, errors = parse_bulk_upsert_results(results, data, "Account", "External_Id__c")
+    report_path = tmp_path / "error-report.csv"
+
+    def setup():
+        if report_path.exists():
+            report_path.unlink()
+
+    benchmark.pedantic(
+        create_error_report, args=(errors, report_path), setup=setup, rounds=5
+    )
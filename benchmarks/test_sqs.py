@@ -0,0 +1,73 @@
+import pytest
+
+from pydantic import BaseModel
+
+from kicksaw_integration_utils.aws import SQSQueue
+
+from benchmarks.conftest import REGION_NAME
+
+pytest.importorskip("pytest_benchmark")
+
+# moto's receive slows down with the number of messages in the queue, so this
+# stops short of the volumes the real thing handles
+VOLUMES = [10, 100, 500]
+
+
+class Message(BaseModel):
+    number: int
+    message: str
+
+
+def get_queue(queue_name: str) -> SQSQueue:
+    return SQSQueue.from_name(queue_name, Message, region_name=REGION_NAME)
+
+
+def get_messages(volume: int):
+    return [Message(number=i, message=f"Message #{i}" * 10) for i in range(volume)]
+
+
+def purge(queue: SQSQueue):
+    queue._queue.purge()
+
+
+@pytest.mark.parametrize("volume", VOLUMES)
+def test_send_messages(benchmark, queue_name, volume):
+    queue = get_queue(queue_name)
+    messages = get_messages(volume)
+
+    def setup():
+        purge(queue)
+        return (messages,), dict()
+
+    results = benchmark.pedantic(queue.send_messages, setup=setup, rounds=3)
+    assert all(results)
+
+
+@pytest.mark.parametrize("volume", VOLUMES)
+def test_receive_messages(benchmark, queue_name, volume):
+    queue = get_queue(queue_name)
+    messages = get_messages(volume)
+    received = list()
+
+    def receive():
+        handles, batch = queue.receive_messages(max_messages=volume)
+        received.append(len(batch))
+        queue.delete_messages(handles)
+
+    benchmark.pedantic(
+        receive, setup=lambda: queue.send_messages(messages) and None, rounds=3
+    )
+    assert set(received) == {volume}
+
+
+@pytest.mark.parametrize("volume", VOLUMES)
+def test_delete_messages(benchmark, queue_name, volume):
+    queue = get_queue(queue_name)
+    messages = get_messages(volume)
+
+    def setup():
+        queue.send_messages(messages)
+        handles, _ = queue.receive_messages(max_messages=volume)
+        return (handles,), dict()
+
+    benchmark.pedantic(queue.delete_messages, setup=setup, rounds=3)
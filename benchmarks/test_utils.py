@@ -0,0 +1,52 @@
+import tracemalloc
+
+import pytest
+
+from kicksaw_integration_utils.utils import iter_dedupe
+
+pytest.importorskip("pytest_benchmark")
+
+ELEMENTS = 500_000
+UNIQUE = 250_000
+
+
+def elements():
+    return (
+        {"id": f"a0{index % UNIQUE:08d}", "value": index} for index in range(ELEMENTS)
+    )
+
+
+def consume(**kwargs):
+    count = 0
+    for _ in iter_dedupe(elements(), "id", **kwargs):
+        count += 1
+    return count
+
+
+def peak_memory(**kwargs) -> int:
+    tracemalloc.start()
+    try:
+        consume(**kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"mode": "memory"},
+        {"mode": "memory", "last_wins": True},
+        {"mode": "disk"},
+        {"mode": "disk", "last_wins": True},
+        {"mode": "bloom", "capacity": UNIQUE, "error_rate": 0.001},
+    ],
+    ids=["memory", "memory-last-wins", "disk", "disk-last-wins", "bloom"],
+)
+def test_iter_dedupe(benchmark, kwargs):
+    benchmark.extra_info["peak_memory_mb"] = round(peak_memory(**kwargs) / 2**20, 1)
+
+    count = benchmark.pedantic(consume, kwargs=kwargs, rounds=3)
+
+    if kwargs["mode"] != "bloom":
+        assert count == UNIQUE
@@ -5,5 +5,31 @@ __all__ = [
     "SalesforceClient",
 ]
 
-from kicksaw_integration_utils.orchestrator import Orchestrator
-from kicksaw_integration_utils.salesforce_client import SfClient as SalesforceClient
+import importlib
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from kicksaw_integration_utils.orchestrator import Orchestrator
+    from kicksaw_integration_utils.salesforce_client import SfClient as SalesforceClient
+
+# exported name -> (module, name in the module). They're imported on first
+# access, so that importing a light module, e.g., utils, doesn't pull in
+# simple_salesforce, requests and boto3 through the orchestrator
+_LAZY_EXPORTS = {
+    "Orchestrator": ("kicksaw_integration_utils.orchestrator", "Orchestrator"),
+    "SalesforceClient": ("kicksaw_integration_utils.salesforce_client", "SfClient"),
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _LAZY_EXPORTS[name]
+    value = getattr(importlib.import_module(module_name), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
@@ -2,4 +2,17 @@ __all__ = [
     "SQSQueue",
 ]
 
-from .sqs import SQSQueue
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .sqs import SQSQueue
+
+
+def __getattr__(name: str):
+    # imported on first access, like the package's own exports
+    if name == "SQSQueue":
+        from .sqs import SQSQueue
+
+        globals()[name] = SQSQueue
+        return SQSQueue
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
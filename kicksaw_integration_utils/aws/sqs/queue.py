@@ -1,18 +1,42 @@
 from __future__ import annotations
 
+import functools
 import logging
+import threading
 import warnings
 
-from typing import Generic, List, Optional, Type, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, List, Optional, Type, TypeVar, Union
 
-import boto3
+from pydantic import BaseModel, ValidationError
 
-from pydantic import BaseModel
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.batching import batch_by_size, iter_slices
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter
+from kicksaw_integration_utils.governor import TokenBucket
+from kicksaw_integration_utils.idempotency import Claim, IdempotencyStore
 
 logger = logging.getLogger(__name__)
 
 PydanticModel = TypeVar("PydanticModel", bound=BaseModel)
 
+# SQS rejects batches whose message bodies add up to more than 256 KiB
+MAX_BATCH_BYTES = 256 * 1024
+
+GroupId = Union[str, Callable[[PydanticModel], str]]
+
+
+class RedriveResult(BaseModel):
+    """
+    What SQSQueue.redrive_messages did with the messages it received
+    """
+
+    received: int = 0
+    matched: int = 0
+    moved: int = 0
+    skipped: int = 0
+    failed: int = 0
+
 
 class SQSQueue(Generic[PydanticModel]):
     """
@@ -38,6 +62,8 @@ class SQSQueue(Generic[PydanticModel]):
     send_messages
     receive_messages
     delete_messages
+    process_messages
+    redrive_messages
 
     Examples
     --------
@@ -52,6 +78,12 @@ class SQSQueue(Generic[PydanticModel]):
     >>> handles, messages = queue.receive_messages()
     >>> queue.delete_messages(handles)
 
+    Send to a FIFO queue, in order within each patient's messages, and process
+    the messages of different patients in parallel
+
+    >>> queue.send_messages(messages, group_id=lambda message: message.patient_id)
+    >>> queue.process_messages(callback, max_workers=8)
+
     """
 
     def __init__(
@@ -75,6 +107,8 @@ class SQSQueue(Generic[PydanticModel]):
             For example, region_name.
 
         """
+        import boto3
+
         self._sqs = boto3.resource("sqs", **kwargs)
         self._queue = self._sqs.Queue(url)
         self._message_model = message_model
@@ -114,6 +148,8 @@ class SQSQueue(Generic[PydanticModel]):
         queue_kwargs = {"QueueName": name}
         if account_id is not None:
             queue_kwargs["QueueOwnerAWSAccountId"] = account_id
+        import boto3
+
         sqs = boto3.resource("sqs", **kwargs)
         queue = sqs.get_queue_by_name(**queue_kwargs)
         return cls(url=queue.url, message_model=message_model, **kwargs)
@@ -126,13 +162,22 @@ class SQSQueue(Generic[PydanticModel]):
     def name(self) -> str:
         return self.url.split("/")[-1]
 
+    @property
+    def fifo(self) -> bool:
+        return self.name.endswith(".fifo")
+
     def __repr__(self) -> str:
         return (
             f"SQSQueue(url='{self.name}', "
             f"message_model={self._message_model.__name__})"
         )
 
-    def send_message(self, message: PydanticModel) -> str:
+    def send_message(
+        self,
+        message: PydanticModel,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+    ) -> str:
         """
         Send single message to the queue.
 
@@ -140,6 +185,11 @@ class SQSQueue(Generic[PydanticModel]):
         ----------
         message : pydantic.BaseModel
             Message.
+        group_id : str, optional
+            Message group id, required by FIFO queues.
+        deduplication_id : str, optional
+            Message deduplication id, for FIFO queues without content-based
+            deduplication.
 
         Returns
         -------
@@ -149,7 +199,10 @@ class SQSQueue(Generic[PydanticModel]):
 
         """
         logger.debug("Sending message %s to %s", message, self.name)
-        response = self._queue.send_message(MessageBody=message.json())
+        response = self._queue.send_message(
+            **self._entry(message.json(), group_id, deduplication_id)
+        )
+        instrumentation.count("sqs.api_calls", queue=self.name, operation="SendMessage")
         message_id: str = response.get("MessageId")
         logger.debug(
             "Successfully sent message %s to %s, SQS Id: %s",
@@ -206,7 +259,13 @@ class SQSQueue(Generic[PydanticModel]):
         """
         return self.delete_messages(handles=[handle])[0]
 
-    def send_messages(self, messages: List[PydanticModel]) -> List[bool]:
+    def send_messages(
+        self,
+        messages: List[PydanticModel],
+        limiter: AdaptiveLimiter = None,
+        group_id: Optional[GroupId] = None,
+        deduplication_id: Optional[Callable[[PydanticModel], str]] = None,
+    ) -> List[bool]:
         """
         Send multiple messages to the queue.
 
@@ -214,6 +273,15 @@ class SQSQueue(Generic[PydanticModel]):
         ----------
         messages : List[pydantic.BaseModel]
             List of messages.
+        limiter : AdaptiveLimiter, optional
+            Sends batches in parallel, as many at a time as the limiter allows.
+            By default batches are sent one at a time.
+        group_id : str or Callable[[pydantic.BaseModel], str], optional
+            Message group id of every message, or a function of the message
+            returning it. Required by FIFO queues.
+        deduplication_id : Callable[[pydantic.BaseModel], str], optional
+            Function of the message returning its deduplication id, for FIFO
+            queues without content-based deduplication.
 
         Returns
         -------
@@ -225,47 +293,46 @@ class SQSQueue(Generic[PydanticModel]):
         AssertionError
             Number of results doesn't match number of messages sent.
 
+        Notes
+        -----
+        Batches hold up to 10 messages, and fewer when their bodies would add up
+        to more than the 256 KiB SQS accepts per batch.
+
+        FIFO queues keep the order of the messages of a group. Given a limiter,
+        a batch is only sent once the batches before it that share a message
+        group are, so batches of other groups still go in parallel.
+
         """
         logger.debug(
-            "Sending %d messages to %s in batches of 10",
+            "Sending %d messages to %s in batches of up to 10",
             len(messages),
             self.name,
         )
 
-        results: List[bool] = []
-        for i in range(0, len(messages), 10):
-            batch = messages[i : i + 10]
-            logger.debug(
-                "Sending batch of %d messages to %s",
-                len(batch),
-                self.name,
-            )
-            response = self._queue.send_messages(
-                Entries=[
-                    {"Id": f"{i+j}", "MessageBody": message.json()}
-                    for j, message in enumerate(batch)
-                ]
-            )
-
-            # Parse response
-            batch_results = sorted(
-                [
-                    *[
-                        {"id": int(entry["Id"]), "success": True}
-                        for entry in response.get("Successful", [])
-                    ],
-                    *[
-                        {"id": int(entry["Id"]), "success": False}
-                        for entry in response.get("Failed", [])
-                    ],
-                ],
-                key=lambda x: x["id"],
-            )
-            assert len(batch_results) == len(batch), (
-                f"this is a bug, AWS returned {len(batch_results):,d} responses, "
-                f"{len(batch):,d} messages were sent"
+        entries = list()
+        for message in messages:
+            entries.append(
+                self._entry(
+                    message.json(),
+                    group_id(message) if callable(group_id) else group_id,
+                    deduplication_id(message) if deduplication_id else None,
+                )
             )
-            results.extend([value["success"] for value in batch_results])
+        batches = batch_by_size(
+            range(len(entries)),
+            MAX_BATCH_BYTES,
+            max_count=10,
+            size=lambda i: len(entries[i]["MessageBody"].encode("utf-8")),
+        )
+        if limiter is None:
+            batch_results = [self._send_batch(entries, batch) for batch in batches]
+        elif not self.fifo:
+            send_batch = functools.partial(limiter.call, self._send_batch, entries)
+            with ThreadPoolExecutor(max_workers=limiter.max_limit) as pool:
+                batch_results = list(pool.map(send_batch, batches))
+        else:
+            batch_results = self._send_batches_in_order(entries, batches, limiter)
+        results: List[bool] = [result for batch in batch_results for result in batch]
 
         for message, result in zip(messages, results):
             if not result:
@@ -277,6 +344,94 @@ class SQSQueue(Generic[PydanticModel]):
 
         return results
 
+    def _entry(
+        self,
+        body: str,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+    ) -> dict:
+        assert group_id or not self.fifo, f"{self.name} needs a group_id, it's FIFO"
+        entry = {"MessageBody": body}
+        if group_id is not None:
+            entry["MessageGroupId"] = group_id
+        if deduplication_id is not None:
+            entry["MessageDeduplicationId"] = deduplication_id
+        return entry
+
+    def _send_batches_in_order(
+        self, entries: List[dict], batches: List[List[int]], limiter: AdaptiveLimiter
+    ) -> List[List[bool]]:
+        # the pool starts batches in the order they're submitted, so the batches
+        # one waits for are already running, never stuck behind it
+        def send_batch(waits_for: List[Future], batch: List[int]) -> List[bool]:
+            for future in waits_for:
+                future.result()
+            return limiter.call(self._send_batch, entries, batch)
+
+        last_sent: Dict[str, Future] = dict()
+        futures: List[Future] = list()
+        with ThreadPoolExecutor(max_workers=limiter.max_limit) as pool:
+            for batch in batches:
+                groups = {entries[i]["MessageGroupId"] for i in batch}
+                waits_for = [last_sent[group] for group in groups if group in last_sent]
+                future = pool.submit(send_batch, waits_for, batch)
+                last_sent.update(dict.fromkeys(groups, future))
+                futures.append(future)
+        return [future.result() for future in futures]
+
+    def _send_batch(self, entries: List[dict], batch: List[int]) -> List[bool]:
+        logger.debug(
+            "Sending batch of %d messages to %s",
+            len(batch),
+            self.name,
+        )
+        with instrumentation.span(
+            "sqs.send_batch", queue=self.name, messages=len(batch)
+        ):
+            response = self._queue.send_messages(
+                Entries=[{"Id": f"{i}", **entries[i]} for i in batch]
+            )
+        if instrumentation.is_enabled():
+            self._count_batch(response, "SendMessageBatch", "sqs.messages_sent")
+            instrumentation.count(
+                "sqs.bytes_sent",
+                sum(len(entries[i]["MessageBody"].encode("utf-8")) for i in batch),
+                unit="Bytes",
+                queue=self.name,
+            )
+
+        # Parse response
+        batch_results = sorted(
+            [
+                *[
+                    {"id": int(entry["Id"]), "success": True}
+                    for entry in response.get("Successful", [])
+                ],
+                *[
+                    {"id": int(entry["Id"]), "success": False}
+                    for entry in response.get("Failed", [])
+                ],
+            ],
+            key=lambda x: x["id"],
+        )
+        assert len(batch_results) == len(batch), (
+            f"this is a bug, AWS returned {len(batch_results):,d} responses, "
+            f"{len(batch):,d} messages were sent"
+        )
+        return [value["success"] for value in batch_results]
+
+    def _count_batch(self, response: dict, operation: str, metric: str):
+        instrumentation.count("sqs.api_calls", queue=self.name, operation=operation)
+        instrumentation.count(
+            metric, len(response.get("Successful", [])), queue=self.name
+        )
+        instrumentation.count(
+            "sqs.batch_entry_failures",
+            len(response.get("Failed", [])),
+            queue=self.name,
+            operation=operation,
+        )
+
     def receive_messages(
         self,
         max_messages: int = 10_000,
@@ -342,6 +497,12 @@ class SQSQueue(Generic[PydanticModel]):
                 WaitTimeSeconds=wait_time_seconds,
             )
             logger.debug("Received %d messages from the queue", len(response))
+            instrumentation.count(
+                "sqs.api_calls", queue=self.name, operation="ReceiveMessage"
+            )
+            instrumentation.count(
+                "sqs.messages_received", len(response), queue=self.name
+            )
             for message in response:
                 handles.append(message.receipt_handle)
                 messages.append(self._message_model.parse_raw(message.body))
@@ -393,19 +554,25 @@ class SQSQueue(Generic[PydanticModel]):
         )
 
         results: List[bool] = []
-        for i in range(0, len(handles), 10):
-            batch = handles[i : i + 10]
+        for batch in iter_slices(handles, 10):
             logger.debug(
                 "Deleting batch of %d messages from %s",
                 len(batch),
                 self.name,
             )
-            response = self._queue.delete_messages(
-                Entries=[
-                    {"Id": f"{i+j}", "ReceiptHandle": handle}
-                    for j, handle in enumerate(batch)
-                ]
-            )
+            with instrumentation.span(
+                "sqs.delete_batch", queue=self.name, messages=len(batch)
+            ):
+                response = self._queue.delete_messages(
+                    Entries=[
+                        {"Id": f"{batch.start + j}", "ReceiptHandle": handle}
+                        for j, handle in enumerate(batch)
+                    ]
+                )
+            if instrumentation.is_enabled():
+                self._count_batch(
+                    response, "DeleteMessageBatch", "sqs.messages_deleted"
+                )
 
             # Parse response
             batch_results = sorted(
@@ -428,3 +595,431 @@ class SQSQueue(Generic[PydanticModel]):
             results.extend([value["success"] for value in batch_results])
 
         return results
+
+    def release_messages(self, handles: List[str]) -> List[bool]:
+        """
+        Make received messages visible again right away, rather than once their
+        visibility timeout runs out.
+
+        Parameters
+        ----------
+        handles : List[str]
+            Message handles.
+            See .receive_messages method.
+
+        Returns
+        -------
+        List[bool]
+            List of results (True for success, False for failure).
+
+        """
+        results: List[bool] = []
+        for batch in iter_slices(handles, 10):
+            response = self._queue.change_message_visibility_batch(
+                Entries=[
+                    {
+                        "Id": f"{batch.start + j}",
+                        "ReceiptHandle": handle,
+                        "VisibilityTimeout": 0,
+                    }
+                    for j, handle in enumerate(batch)
+                ]
+            )
+            if instrumentation.is_enabled():
+                self._count_batch(
+                    response, "ChangeMessageVisibilityBatch", "sqs.messages_released"
+                )
+            failed = {int(entry["Id"]) for entry in response.get("Failed", [])}
+            results.extend(batch.start + j not in failed for j in range(len(batch)))
+        return results
+
+    def process_messages(
+        self,
+        callback: Callable[[PydanticModel], None],
+        max_messages: int = 10_000,
+        wait_time_seconds: int = 0,
+        idempotency_store: Optional[IdempotencyStore] = None,
+        max_workers: Optional[int] = None,
+    ) -> tuple[int, int, int]:
+        """
+        Receive messages and call back on each of them, deleting the ones that
+        were processed.
+
+        Messages are received in batches of up to 10, and each batch is processed
+        and deleted before the next one is received, until either max_messages
+        are received or the queue is empty. With max_workers, that many threads
+        each receive and process batches that way.
+
+        Parameters
+        ----------
+        callback : Callable[[pydantic.BaseModel], None]
+            Called with each message. Messages it raises on are left in the queue,
+            to be received again once their visibility timeout runs out.
+        max_messages : int, optional
+            Maximum number of messages to receive.
+            By default 10,000.
+        wait_time_seconds : int, optional
+            See .receive_messages method.
+        idempotency_store : IdempotencyStore, optional
+            Remembers processed message ids, so messages that SQS delivers more
+            than once are only processed once. Duplicates are deleted without
+            calling back. Messages still being processed elsewhere are left in
+            the queue, in case that fails.
+        max_workers : int, optional
+            Number of threads receiving and processing batches at once. By
+            default messages are processed one at a time.
+
+        Returns
+        -------
+        processed : int
+            Number of messages processed.
+        skipped : int
+            Number of duplicate messages skipped.
+        failed : int
+            Number of messages left in the queue: the ones the callback raised
+            on or that are still being processed elsewhere, and the ones behind
+            those in their message group.
+
+        Notes
+        -----
+        The messages of a FIFO queue's message group are processed in order, one
+        at a time, and the first one the callback raises on stops its group: the
+        ones after it are left in the queue with it, so they're received again
+        in order. Every message of a standard queue is a group of its own.
+
+        SQS doesn't hand out a FIFO message group's messages while some of them
+        are in flight, so the threads never process the same group at once. A
+        thread stops once a receive comes back empty, e.g., when every group
+        left is held by another thread.
+
+        """
+        processed, skipped, failed = 0, 0, 0
+        received = 0
+        lock = threading.Lock()
+        process_group = functools.partial(
+            self._process_group,
+            callback=callback,
+            idempotency_store=idempotency_store,
+        )
+
+        def take(count: int) -> int:
+            nonlocal received
+            with lock:
+                count = min(count, max_messages - received)
+                received += count
+            return count
+
+        def work():
+            nonlocal received, processed, skipped, failed
+            while True:
+                count = take(10)
+                if count == 0:
+                    return
+                response = self._queue.receive_messages(
+                    MaxNumberOfMessages=count,
+                    WaitTimeSeconds=wait_time_seconds,
+                    AttributeNames=["MessageGroupId"],
+                )
+                logger.debug("Received %d messages from the queue", len(response))
+                instrumentation.count(
+                    "sqs.api_calls", queue=self.name, operation="ReceiveMessage"
+                )
+                instrumentation.count(
+                    "sqs.messages_received", len(response), queue=self.name
+                )
+                with lock:
+                    # what wasn't received is left for the other threads
+                    received -= count - len(response)
+                if len(response) == 0:
+                    logger.debug("%s has no messages left", self.name)
+                    return
+
+                groups: Dict[str, list] = dict()
+                for message in response:
+                    attributes = message.attributes or dict()
+                    group = attributes.get("MessageGroupId", message.message_id)
+                    groups.setdefault(group, list()).append(message)
+
+                outcomes = [process_group(group) for group in groups.values()]
+                handles = [
+                    handle for group_handles, *_ in outcomes for handle in group_handles
+                ]
+                if handles:
+                    self.delete_messages(handles)
+                with lock:
+                    for _, group_processed, group_skipped, group_failed in outcomes:
+                        processed += group_processed
+                        skipped += group_skipped
+                        failed += group_failed
+
+        if max_workers is None:
+            work()
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(work) for _ in range(max_workers)]
+            for future in futures:
+                future.result()
+
+        return processed, skipped, failed
+
+    def _process_group(
+        self,
+        messages: list,
+        callback: Callable[[PydanticModel], None],
+        idempotency_store: Optional[IdempotencyStore] = None,
+    ) -> tuple[List[str], int, int, int]:
+        processed, skipped = 0, 0
+        handles: List[str] = []
+        for position, message in enumerate(messages):
+            key = message.message_id
+            claim = idempotency_store.claim(key) if idempotency_store else None
+            if claim == Claim.IN_PROGRESS:
+                # whoever holds it may yet fail, so it's left to be received again
+                logger.info(
+                    "Message %s from %s is still being processed elsewhere",
+                    key,
+                    self.name,
+                )
+                return handles, processed, skipped, len(messages) - position
+            if claim == Claim.COMPLETED:
+                logger.info("Skipping duplicate message %s from %s", key, self.name)
+                skipped += 1
+                handles.append(message.receipt_handle)
+                continue
+            try:
+                with instrumentation.span("sqs.process_message", queue=self.name):
+                    callback(self._message_model.parse_raw(message.body))
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to process message %s from %s", key, self.name)
+                if idempotency_store:
+                    idempotency_store.release(key)
+                return handles, processed, skipped, len(messages) - position
+            if idempotency_store:
+                idempotency_store.complete(key)
+            processed += 1
+            handles.append(message.receipt_handle)
+        return handles, processed, skipped, 0
+
+    def redrive_messages(
+        self,
+        target: SQSQueue,
+        predicate: Optional[Callable[[PydanticModel], bool]] = None,
+        max_messages: int = 100_000,
+        max_workers: int = 4,
+        rate: Optional[float] = None,
+        dry_run: bool = False,
+        wait_time_seconds: int = 0,
+        visibility_timeout: Optional[int] = None,
+    ) -> RedriveResult:
+        """
+        Move messages from this queue to target, e.g., from a dead-letter queue
+        back to its source queue once the outage that filled it is over.
+
+        max_workers threads each receive batches of up to 10 messages, send the
+        ones that match to target in batches, then delete from this queue the
+        ones target confirmed receiving, until either max_messages are received
+        or the queue is empty. Message bodies and attributes are sent as they
+        were received, not re-serialized.
+
+        Parameters
+        ----------
+        target : SQSQueue
+            Queue to move the messages to.
+        predicate : Callable[[pydantic.BaseModel], bool], optional
+            Called with each message parsed with this queue's message model. Only
+            the messages it returns True for are moved. By default every message
+            is moved, unparsed.
+        max_messages : int, optional
+            Maximum number of messages to receive.
+            By default 100,000.
+        max_workers : int, optional
+            Number of threads receiving and moving messages.
+            By default 4.
+        rate : float, optional
+            Maximum number of messages moved per second, across threads. A
+            thread waits for its share before receiving, so messages don't sit
+            in flight while it does. Unlimited by default.
+        dry_run : bool, optional
+            Only count the messages that would be moved, without sending or
+            deleting anything. The messages are released once counted.
+        wait_time_seconds : int, optional
+            See .receive_messages method.
+        visibility_timeout : int, optional
+            Seconds received messages stay hidden from other consumers. Defaults
+            to the queue's.
+
+        Returns
+        -------
+        RedriveResult
+            Numbers of messages received, matched, moved, skipped (didn't match
+            or couldn't be parsed) and failed (target didn't accept them).
+
+        Notes
+        -----
+        A message is only deleted once target confirmed receiving it, so one
+        that fails to move stays here, and a failure in between sending and
+        deleting leaves a duplicate rather than losing a message. Messages that
+        are skipped or counted by a dry run are held until the end of the run,
+        so no thread receives them twice, then released (see .release_messages).
+        Messages that failed to move stay in flight until their visibility
+        timeout runs out, so they're retried later rather than right away.
+
+        The group ids of a FIFO queue's messages are kept, and their message ids
+        are used as deduplication ids when target is FIFO as well. Messages of a
+        standard queue have no group id, so they can't be moved to a FIFO one.
+
+        """
+        assert self.fifo or not target.fifo, (
+            f"Can't move messages from {self.name} to {target.name}, they have "
+            "no group id and it's FIFO"
+        )
+        result = RedriveResult()
+        lock = threading.Lock()
+        receiving = threading.Lock()
+        # messages to release once the run is over
+        held: List[str] = []
+        bucket = TokenBucket(rate) if rate else None
+        receive_kwargs = {
+            "WaitTimeSeconds": wait_time_seconds,
+            "AttributeNames": ["MessageGroupId"],
+            "MessageAttributeNames": ["All"],
+        }
+        if visibility_timeout is not None:
+            receive_kwargs["VisibilityTimeout"] = visibility_timeout
+
+        def receive(count: int) -> list:
+            return self._queue.receive_messages(
+                MaxNumberOfMessages=count, **receive_kwargs
+            )
+
+        def take(count: int) -> int:
+            with lock:
+                count = min(count, max_messages - result.received)
+                result.received += count
+            return count
+
+        def redrive_batch(response: list) -> tuple[int, int, int, int]:
+            matched = list()
+            for message in response:
+                if predicate is None:
+                    matched.append(message)
+                    continue
+                try:
+                    parsed = self._message_model.parse_raw(message.body)
+                except (ValidationError, ValueError):
+                    logger.warning(
+                        "Skipping message %s from %s, it can't be parsed",
+                        message.message_id,
+                        self.name,
+                    )
+                    continue
+                if predicate(parsed):
+                    matched.append(message)
+            skipped = len(response) - len(matched)
+            if skipped or dry_run:
+                matched_ids = {message.message_id for message in matched}
+                with lock:
+                    held.extend(
+                        message.receipt_handle
+                        for message in response
+                        if dry_run or message.message_id not in matched_ids
+                    )
+            if dry_run or not matched:
+                return len(matched), 0, skipped, 0
+
+            entries = list()
+            for message in matched:
+                attributes = message.attributes or dict()
+                entry = target._entry(
+                    message.body,
+                    attributes.get("MessageGroupId") if target.fifo else None,
+                    message.message_id if target.fifo else None,
+                )
+                if message.message_attributes:
+                    entry["MessageAttributes"] = message.message_attributes
+                entries.append(entry)
+            batches = batch_by_size(
+                range(len(entries)),
+                MAX_BATCH_BYTES,
+                max_count=10,
+                size=lambda i: len(entries[i]["MessageBody"].encode("utf-8")),
+            )
+            handles: List[str] = []
+            for batch in batches:
+                sent = target._send_batch(entries, batch)
+                handles.extend(
+                    matched[i].receipt_handle for i, ok in zip(batch, sent) if ok
+                )
+            if handles:
+                deleted = self.delete_messages(handles)
+                if not all(deleted):
+                    logger.warning(
+                        "%d messages moved to %s couldn't be deleted from %s",
+                        deleted.count(False),
+                        target.name,
+                        self.name,
+                    )
+            return len(matched), len(handles), skipped, len(matched) - len(handles)
+
+        def work():
+            while True:
+                count = take(10)
+                if count == 0:
+                    return
+                if bucket and not dry_run:
+                    # waiting for tokens once messages are received would eat
+                    # into their visibility timeout. One thread at a time waits,
+                    # so threads don't line up for tokens there are no messages for
+                    with receiving:
+                        bucket.acquire(count)
+                        response = receive(count)
+                else:
+                    response = receive(count)
+                instrumentation.count(
+                    "sqs.api_calls", queue=self.name, operation="ReceiveMessage"
+                )
+                instrumentation.count(
+                    "sqs.messages_received", len(response), queue=self.name
+                )
+                with lock:
+                    # what wasn't received is left for the other threads
+                    result.received -= count - len(response)
+                if len(response) == 0:
+                    if bucket and not dry_run:
+                        bucket.refund(count)
+                    logger.debug("%s has no messages left", self.name)
+                    return
+                with instrumentation.span(
+                    "sqs.redrive_batch", queue=self.name, messages=len(response)
+                ):
+                    matched, moved, skipped, failed = redrive_batch(response)
+                if bucket and not dry_run:
+                    bucket.refund(count - matched)
+                instrumentation.count("sqs.messages_redriven", moved, queue=self.name)
+                with lock:
+                    result.matched += matched
+                    result.moved += moved
+                    result.skipped += skipped
+                    result.failed += failed
+
+        logger.info(
+            "%s messages from %s to %s",
+            "Counting" if dry_run else "Moving",
+            self.name,
+            target.name,
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(work) for _ in range(max_workers)]
+            for future in futures:
+                future.result()
+        finally:
+            if held:
+                released = self.release_messages(held)
+                if not all(released):
+                    logger.warning(
+                        "%d messages couldn't be released from %s",
+                        released.count(False),
+                        self.name,
+                    )
+        return result
@@ -0,0 +1,327 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import queue
+import threading
+import time
+
+from collections.abc import Sequence
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+
+_DONE = object()
+
+
+class SequenceView(Sequence):
+    """
+    A read-only window onto part of a sequence, e.g., a list, without copying it
+
+    Slicing a view returns another view onto the same sequence
+    """
+
+    __slots__ = ("sequence", "start", "stop")
+
+    def __init__(self, sequence: Sequence, start: int = 0, stop: int = None) -> None:
+        start, stop, _ = slice(start, stop).indices(len(sequence))
+        if isinstance(sequence, SequenceView):
+            start, stop = sequence.start + start, sequence.start + stop
+            sequence = sequence.sequence
+        self.sequence = sequence
+        self.start = start
+        self.stop = max(start, stop)
+
+    @classmethod
+    def _of(cls, sequence: Sequence, start: int, stop: int) -> "SequenceView":
+        # skips __init__'s bounds checks, for callers that already did them
+        view = cls.__new__(cls)
+        view.sequence, view.start, view.stop = sequence, start, stop
+        return view
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return SequenceView(self, start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SequenceView index out of range")
+        return self.sequence[self.start + index]
+
+    def __iter__(self) -> Iterator:
+        return map(self.sequence.__getitem__, range(self.start, self.stop))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"SequenceView({list(self)!r})"
+
+
+def iter_slices(sequence: Sequence, size: int) -> Iterator[Sequence]:
+    """
+    batch_collection for sequences, without copying: yields SequenceViews of at
+    most size elements
+
+    memoryviews, ranges and numpy arrays are sliced natively, since their slices
+    are views already
+    """
+    assert size > 0, "size must be positive"
+    native = isinstance(sequence, (memoryview, range)) or hasattr(
+        sequence, "__array_interface__"
+    )
+    offset, stop = 0, len(sequence)
+    if isinstance(sequence, SequenceView):
+        offset, stop, sequence = sequence.start, sequence.stop, sequence.sequence
+    for start in range(offset, stop, size):
+        if native:
+            yield sequence[start : start + size]
+        else:
+            yield SequenceView._of(sequence, start, min(start + size, stop))
+
+
+def batch_by_weight(
+    iterable: Iterable,
+    max_weight: float,
+    weight: Callable[[Any], float],
+    max_count: int = None,
+) -> Iterator[list]:
+    """
+    Batches elements so that the weights in a batch add up to at most max_weight,
+    with at most max_count elements
+
+    An element that's heavier than max_weight on its own gets a batch of its own
+    """
+    batch = list()
+    batch_weight = 0
+    for element in iterable:
+        element_weight = weight(element)
+        if batch and (
+            batch_weight + element_weight > max_weight
+            or (max_count and len(batch) >= max_count)
+        ):
+            yield batch
+            batch = list()
+            batch_weight = 0
+        batch.append(element)
+        batch_weight += element_weight
+    if batch:
+        yield batch
+
+
+def _weightless(element) -> int:
+    return 0
+
+
+def batch_by_group(
+    iterable: Iterable,
+    key: Callable[[Any], Hashable],
+    max_count: int,
+    max_weight: float = None,
+    weight: Callable[[Any], float] = None,
+) -> List[list]:
+    """
+    Batches elements so that the elements with the same key end up in the same
+    batch, with at most max_count elements, and at most max_weight per batch when
+    weight is given. Elements whose key is None can go in any batch
+
+    Groups are packed largest first, each into the batch with the fewest
+    elements if it fits there, so there are about as few batches as there can
+    be. A group too big for a batch of its own is split over consecutive
+    batches. A group's elements keep their order
+    """
+    assert max_count > 0, "max_count must be positive"
+    if weight is None:
+        weight = _weightless
+    if max_weight is None:
+        max_weight = math.inf
+
+    groups = dict()
+    loose = list()
+    for element in iterable:
+        group_key = key(element)
+        if group_key is None:
+            loose.append([element])
+        else:
+            groups.setdefault(group_key, list()).append(element)
+
+    sized = [
+        (len(group), sum(map(weight, group)), group)
+        for group in itertools.chain(groups.values(), loose)
+    ]
+    # sorted is stable, so groups of the same size stay in the order they came
+    sized.sort(key=lambda sized_group: sized_group[0], reverse=True)
+
+    batches = list()
+    batch_weights = list()
+    roomiest = list()  # (elements, index) of every batch, fewest elements first
+    for count, group_weight, group in sized:
+        if count > max_count or group_weight > max_weight:
+            for part in batch_by_weight(group, max_weight, weight, max_count):
+                batches.append(part)
+                batch_weights.append(sum(map(weight, part)))
+                heapq.heappush(roomiest, (len(part), len(batches) - 1))
+            continue
+
+        if roomiest:
+            batch_count, index = roomiest[0]
+            if (
+                batch_count + count <= max_count
+                and batch_weights[index] + group_weight <= max_weight
+            ):
+                batches[index] += group
+                batch_weights[index] += group_weight
+                heapq.heapreplace(roomiest, (batch_count + count, index))
+                continue
+
+        batches.append(list(group))
+        batch_weights.append(group_weight)
+        heapq.heappush(roomiest, (count, len(batches) - 1))
+    return batches
+
+
+def json_size(element) -> int:
+    """
+    The size in bytes of element as (ascii) json, plus two for the ", " that
+    separates it from the next element of an array
+    """
+    return len(json.dumps(element, default=str)) + 2
+
+
+def batch_by_size(
+    iterable: Iterable,
+    max_bytes: int,
+    max_count: int = None,
+    size: Callable[[Any], int] = json_size,
+) -> Iterator[list]:
+    """
+    batch_by_weight, weighing elements by their size in bytes, for APIs that
+    limit the size of a request. By default elements are sized as json
+    """
+    return batch_by_weight(iterable, max_bytes, size, max_count)
+
+
+def batch_by_time(
+    iterable: Iterable, max_count: int, max_seconds: float
+) -> Iterator[list]:
+    """
+    Batches a stream by count and time: a batch is yielded once it has max_count
+    elements, or max_seconds after its first element came in, whichever's first
+
+    The stream is read on a background thread, so a partial batch goes out on
+    time even if the stream goes quiet. Errors raised by the stream are raised
+    here, after the batch that came before them
+    """
+    assert max_count > 0, "max_count must be positive"
+    buffer = queue.Queue(maxsize=max_count)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for element in iterable:
+                if not put((element, None)):
+                    return
+        except Exception as error:  # pylint: disable=broad-except
+            put((_DONE, error))
+        else:
+            put((_DONE, None))
+
+    threading.Thread(target=read, daemon=True).start()
+
+    batch = list()
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                element, error = buffer.get(timeout=timeout)
+            except queue.Empty:
+                yield batch
+                batch, deadline = list(), None
+                continue
+
+            if element is _DONE:
+                if batch:
+                    yield batch
+                if error is not None:
+                    raise error
+                return
+
+            batch.append(element)
+            if deadline is None:
+                deadline = time.monotonic() + max_seconds
+            if len(batch) >= max_count:
+                yield batch
+                batch, deadline = list(), None
+    finally:
+        stop.set()
+
+
+async def abatch(
+    aiterable: AsyncIterable, size: int, max_seconds: Optional[float] = None
+) -> AsyncIterator[List]:
+    """
+    Batches an async iterable by count and, when max_seconds is given, by time,
+    like batch_by_time
+    """
+    assert size > 0, "size must be positive"
+    loop = asyncio.get_event_loop()
+    iterator = aiterable.__aiter__()
+    pending = None
+    batch = list()
+    deadline = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # the next element is still on its way; it'll start the next batch
+                yield batch
+                batch, deadline = list(), None
+                continue
+
+            task, pending = pending, None
+            try:
+                element = task.result()
+            except StopAsyncIteration:
+                if batch:
+                    yield batch
+                return
+
+            batch.append(element)
+            if deadline is None and max_seconds is not None:
+                deadline = loop.time() + max_seconds
+            if len(batch) >= size:
+                yield batch
+                batch, deadline = list(), None
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Dict, List
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.s3_helpers import get_s3_client
+
+HASH_BYTES = 8
+
+
+def record_hash(record: dict) -> bytes:
+    """
+    A compact hash of a record's content, the same whatever order its keys are in
+    """
+    content = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=HASH_BYTES).digest()
+
+
+class HashStore:
+    """
+    Base class for where the hashes of the records last pushed are kept
+    """
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Returns the hashes of the keys that have one
+        """
+        raise NotImplementedError
+
+    def put_many(self, hashes: Dict[str, bytes]):
+        raise NotImplementedError
+
+    def save(self):
+        """
+        Persists the hashes, for stores that don't as they go
+        """
+
+
+class SQLiteHashStore(HashStore):
+    """
+    Keeps hashes in a local sqlite database, 8 bytes per record plus its key
+    """
+
+    # sqlite limits the number of parameters of a query to 999 in older versions
+    query_size = 500
+
+    def __init__(self, path: Path = None) -> None:
+        if not path:
+            path = Path(os.getenv("TEMP", gettempdir())) / "record-hashes.sqlite3"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS record_hashes "
+                "(key TEXT PRIMARY KEY, hash BLOB NOT NULL) WITHOUT ROWID"
+            )
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        hashes = dict()
+        with self.lock:
+            for start in range(0, len(keys), self.query_size):
+                chunk = keys[start : start + self.query_size]
+                placeholders = ", ".join("?" * len(chunk))
+                hashes.update(
+                    self.connection.execute(
+                        "SELECT key, hash FROM record_hashes "
+                        f"WHERE key IN ({placeholders})",
+                        chunk,
+                    )
+                )
+        return hashes
+
+    def put_many(self, hashes: Dict[str, bytes]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO record_hashes VALUES (?, ?)", hashes.items()
+            )
+
+
+class S3HashStore(SQLiteHashStore):
+    """
+    A SQLiteHashStore whose database is a snapshot kept in S3, downloaded when
+    the store is created and uploaded by save
+
+    Runs that use the same snapshot at the same time, e.g., shards, each
+    upload their own copy, so the last one wins. The records only the others
+    pushed are simply pushed again next time
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        s3_object_key: str = "record-hashes.sqlite3",
+        path: Path = None,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.s3_object_key = s3_object_key
+        if not path:
+            path = (
+                Path(os.getenv("TEMP", gettempdir()))
+                / "record-hashes"
+                / Path(s3_object_key).name
+            )
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        s3_client = get_s3_client()
+        try:
+            response = s3_client.get_object(Bucket=bucket_name, Key=s3_object_key)
+        except s3_client.exceptions.NoSuchKey:
+            # the first run starts from scratch, and a stale local copy mustn't
+            # be taken for it
+            if os.path.isfile(path):
+                os.remove(path)
+        else:
+            with open(path, "wb") as snapshot:
+                shutil.copyfileobj(response["Body"], snapshot)
+        super().__init__(path)
+
+    def save(self):
+        with self.lock:
+            self.connection.commit()
+            get_s3_client().upload_file(
+                str(self.path), self.bucket_name, self.s3_object_key
+            )
+
+
+class ChangeDetector:
+    """
+    Filters out the records that haven't changed since they were last pushed
+
+    Records are told apart by their object and upsert key value, and compared
+    by record_hash. Pass the results of every push to record, so that the
+    records that went through are left out next time; the ones that failed
+    are kept in
+    """
+
+    def __init__(self, store: HashStore) -> None:
+        self.store = store
+
+    @staticmethod
+    def _key(record: dict, salesforce_object: str, upsert_key: str) -> str:
+        return f"{salesforce_object}/{upsert_key}/{record[upsert_key]}"
+
+    def changed(self, data: list, salesforce_object: str, upsert_key: str) -> list:
+        """
+        Returns the records of data that are new or changed
+        """
+        keys = [self._key(record, salesforce_object, upsert_key) for record in data]
+        hashes = self.store.get_many(keys)
+        changed = [
+            record
+            for record, key in zip(data, keys)
+            if hashes.get(key) != record_hash(record)
+        ]
+        instrumentation.count(
+            "change_detection.unchanged_records",
+            len(data) - len(changed),
+            object=salesforce_object,
+        )
+        return changed
+
+    def record(
+        self, results: list, data: list, salesforce_object: str, upsert_key: str
+    ):
+        """
+        Stores the hashes of the records that were pushed successfully
+        """
+        self.store.put_many(
+            {
+                self._key(record, salesforce_object, upsert_key): record_hash(record)
+                for result, record in zip(results, data)
+                if result.get("success")
+            }
+        )
+
+    def save(self):
+        self.store.save()
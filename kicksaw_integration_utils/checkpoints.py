@@ -0,0 +1,110 @@
+import json
+import os
+
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Optional
+
+from pydantic import BaseModel
+
+from kicksaw_integration_utils.s3_helpers import get_s3_client
+
+
+class Checkpoint(BaseModel):
+    """
+    How far an Orchestrator got through its file
+
+    rows_read rows of the file have been pushed and logged, and the error report
+    holds error_count errors, uploaded in report_parts parts
+    """
+
+    s3_object_key: str
+    rows_read: int = 0
+    batches_pushed: int = 0
+    error_count: int = 0
+    timestamp: str
+    error_report_file_name: str
+    report_parts: int = 0
+
+
+class CheckpointStore:
+    """
+    Base class for where checkpoints are kept, one per s3 object key
+    """
+
+    def load(self, s3_object_key: str) -> Optional[Checkpoint]:
+        raise NotImplementedError
+
+    def save(self, checkpoint: Checkpoint):
+        raise NotImplementedError
+
+    def clear(self, s3_object_key: str):
+        raise NotImplementedError
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """
+    Keeps checkpoints as json files in a local folder
+
+    Mostly a stand-in for S3CheckpointStore when running locally; /tmp doesn't
+    survive across Lambda invocations
+    """
+
+    def __init__(self, folder: Path = None) -> None:
+        if not folder:
+            folder = Path(os.getenv("TEMP", gettempdir())) / "checkpoints"
+        self.folder = Path(folder)
+
+    def _path(self, s3_object_key: str) -> Path:
+        return self.folder / f"{s3_object_key}.json"
+
+    def load(self, s3_object_key: str) -> Optional[Checkpoint]:
+        path = self._path(s3_object_key)
+        if not os.path.isfile(path):
+            return None
+        return Checkpoint.parse_file(path)
+
+    def save(self, checkpoint: Checkpoint):
+        path = self._path(checkpoint.s3_object_key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(checkpoint.json())
+
+    def clear(self, s3_object_key: str):
+        path = self._path(s3_object_key)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class S3CheckpointStore(CheckpointStore):
+    """
+    Keeps checkpoints as json objects in S3, under <prefix>/<s3_object_key>.json
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = "checkpoints") -> None:
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _s3_key(self, s3_object_key: str) -> str:
+        return (Path(self.prefix) / f"{s3_object_key}.json").as_posix()
+
+    def load(self, s3_object_key: str) -> Optional[Checkpoint]:
+        s3_client = get_s3_client()
+        try:
+            response = s3_client.get_object(
+                Bucket=self.bucket_name, Key=self._s3_key(s3_object_key)
+            )
+        except s3_client.exceptions.NoSuchKey:
+            return None
+        return Checkpoint.parse_obj(json.loads(response["Body"].read()))
+
+    def save(self, checkpoint: Checkpoint):
+        get_s3_client().put_object(
+            Body=checkpoint.json(),
+            Bucket=self.bucket_name,
+            Key=self._s3_key(checkpoint.s3_object_key),
+        )
+
+    def clear(self, s3_object_key: str):
+        get_s3_client().delete_object(
+            Bucket=self.bucket_name, Key=self._s3_key(s3_object_key)
+        )
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from typing import Any, Callable
+
+from kicksaw_integration_utils import instrumentation
+
+# found in the errors (or error codes) services send when they want fewer
+# requests, as opposed to when a request is wrong
+THROTTLE_MARKERS = (
+    "Throttl",  # ThrottlingException, RequestThrottled, ...
+    "SlowDown",
+    "TooManyRequests",
+    "REQUEST_LIMIT_EXCEEDED",
+    "UNABLE_TO_LOCK_ROW",
+)
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Whether error means the service is overwhelmed, rather than the request bad
+    """
+    description = f"{type(error).__name__}: {error}"
+    return any(marker in description for marker in THROTTLE_MARKERS)
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of calls in flight, adjusting the limit AIMD style
+    (additive increase, multiplicative decrease) like TCP's congestion control
+
+    Every call that goes well grows the limit by 1 / limit, i.e., by one once a
+    limit's worth of calls went well. A call that's throttled, or that takes
+    more than latency_tolerance times as long as the fastest recent call (the
+    service is queueing them up), multiplies the limit by backoff. Only calls
+    started after the last cut can cut it again, so a burst of failures from
+    the same wave of calls counts once
+
+    Other errors neither grow nor cut the limit. Pass latency_tolerance=None to
+    only back off when throttled
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        name: str = "default",
+    ) -> None:
+        assert (
+            1 <= min_limit <= initial_limit <= max_limit
+        ), "expected min <= initial <= max limit"
+        assert 0 < backoff < 1, "backoff must be between 0 and 1"
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.name = name
+        self.in_flight = 0
+        self.fastest = None
+        self.cut_at = float("-inf")
+        self.condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Waits for room under the limit, returning when the call started, for release
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def _is_slow(self, latency: float) -> bool:
+        # the baseline creeps up 1% a call, so it follows a service that got
+        # slower for good
+        if self.fastest is None:
+            self.fastest = latency
+        self.fastest = min(latency, self.fastest * 1.01)
+        if self.latency_tolerance is None:
+            return False
+        return latency > self.fastest * self.latency_tolerance
+
+    def release(
+        self,
+        started_at: float,
+        throttled: bool = False,
+        failed: bool = False,
+        timed: bool = True,
+    ):
+        """
+        Frees the slot taken by acquire, and adjusts the limit to how the call went
+
+        Pass timed=False for calls whose latency says nothing about the load on
+        the service, e.g., of very different sizes. They're not compared to the
+        others, so only throttling cuts the limit
+        """
+        latency = time.monotonic() - started_at
+        with self.condition:
+            self.in_flight -= 1
+            slow = not throttled and not failed and timed and self._is_slow(latency)
+            if throttled or slow:
+                if started_at >= self.cut_at:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.cut_at = time.monotonic()
+                    instrumentation.count(
+                        "concurrency.backoffs",
+                        limiter=self.name,
+                        reason="throttled" if throttled else "latency",
+                    )
+            elif not failed:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def call(
+        self,
+        func: Callable,
+        *args,
+        throttled: Callable[[Any], bool] = None,
+        timed: bool = True,
+        **kwargs,
+    ):
+        """
+        Calls func once there's room, then adjusts the limit to how it went
+
+        Errors count as throttling when is_throttling_error says so. throttled,
+        when given, tells the same from func's result, e.g., bulk results with
+        UNABLE_TO_LOCK_ROW errors. timed is passed on to release
+        """
+        started_at = self.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            throttled_error = is_throttling_error(error)
+            self.release(
+                started_at, throttled=throttled_error, failed=True, timed=timed
+            )
+            raise
+        throttled_result = bool(throttled and throttled(result))
+        self.release(started_at, throttled=throttled_result, timed=timed)
+        return result
@@ -1,7 +1,20 @@
+import codecs
 import csv
+import io
 import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Callable, IO, Iterator, List, Tuple, Type, Union
+
+from pydantic import BaseModel, ValidationError
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.s3_helpers import get_s3_client
+from kicksaw_integration_utils.utils import batch_collection
+
+CsvSource = Union[Path, str, IO]
 
 
 def create_error_report(
@@ -33,11 +46,125 @@ def create_error_report(
 
     Path(report_path.parent).mkdir(parents=True, exist_ok=True)
 
-    with open(report_path, mode="a", newline="") as file:
-        writer = csv.writer(
-            file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL
-        )
-        for row in csv_rows:
-            writer.writerow(row)
+    with instrumentation.span("csv.create_error_report", errors=errors_count):
+        with open(report_path, mode="a", newline="") as file:
+            writer = csv.writer(
+                file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL
+            )
+            for row in csv_rows:
+                writer.writerow(row)
+    instrumentation.count("csv.error_rows_written", errors_count)
 
     return errors_count
+
+
+def open_s3_csv(s3_object_key: str, bucket_name: str, encoding="utf-8-sig") -> IO:
+    """
+    Opens a csv in S3 as a text stream, without downloading it first
+    """
+    body = get_s3_client().get_object(Bucket=bucket_name, Key=s3_object_key)["Body"]
+    if isinstance(body, io.IOBase):
+        return io.TextIOWrapper(body, encoding=encoding, newline="")
+    return codecs.getreader(encoding)(body)
+
+
+def iter_csv_rows(source: CsvSource, encoding="utf-8-sig") -> Iterator[dict]:
+    """
+    Lazily reads the rows of a csv as dicts, from a local path or an open text
+    stream (e.g., open_s3_csv)
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, newline="", encoding=encoding) as file:
+            yield from csv.DictReader(file)
+    else:
+        yield from csv.DictReader(source)
+
+
+def _process_rows(
+    rows: List[dict],
+    first_row_number: int,
+    model: Type[BaseModel] = None,
+    mapper: Callable[[dict], dict] = None,
+) -> Tuple[list, list]:
+    records = list()
+    errors = list()
+    for row_number, row in enumerate(rows, start=first_row_number):
+        try:
+            record = mapper(row) if mapper else row
+            if model:
+                record = model.parse_obj(record).dict()
+            records.append(record)
+        except (ValidationError, ValueError, KeyError) as reason:
+            errors.append(
+                {"row_number": row_number, "message": str(reason), "object_json": row}
+            )
+    return records, errors
+
+
+def read_csv_batches(
+    source: CsvSource,
+    batch_size: int = 10000,
+    model: Type[BaseModel] = None,
+    mapper: Callable[[dict], dict] = None,
+    max_workers: int = None,
+    chunk_size: int = 1000,
+) -> Iterator[Tuple[list, list]]:
+    """
+    Streams a csv as batches ready for the bulk API, never holding more than a
+    few batches in memory
+
+    Every row goes through mapper (a function of the row) and/or model (parsed
+    with model.parse_obj and dumped with .dict(), so fields aliased to the csv
+    headers come out under their Salesforce names). Rows that fail are left out
+    of the batches and returned alongside them
+
+    Yields (records, errors), each batch having batch_size records except the
+    last, and errors looking like
+        {"row_number": 1, "message": "...", "object_json": {...}}
+    row_number being 1 for the first row after the header
+
+    Parameters:
+        source: A local path, or an open text stream such as open_s3_csv's
+        batch_size: The number of records in a batch
+        model: The pydantic model to validate rows against
+        mapper: A function that turns a row into a record
+        max_workers: Validates chunks of rows on that many processes. model and
+            mapper must then be picklable. Rows are processed in-line by default
+        chunk_size: The number of rows handed to a process at a time
+    """
+    chunks = batch_collection(iter_csv_rows(source), chunk_size)
+    numbered_chunks = (
+        (rows, 1 + index * chunk_size) for index, rows in enumerate(chunks)
+    )
+
+    def process_in_line():
+        for rows, first_row_number in numbered_chunks:
+            yield _process_rows(rows, first_row_number, model, mapper)
+
+    def process_in_pool():
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            in_flight = deque()
+            for rows, first_row_number in numbered_chunks:
+                in_flight.append(
+                    pool.submit(_process_rows, rows, first_row_number, model, mapper)
+                )
+                if len(in_flight) >= max_workers * 2:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    processed = process_in_pool() if max_workers else process_in_line()
+
+    batch = list()
+    errors = list()
+    for records, chunk_errors in processed:
+        instrumentation.count("csv.rows_read", len(records) + len(chunk_errors))
+        instrumentation.count("csv.invalid_rows", len(chunk_errors))
+        batch += records
+        errors += chunk_errors
+        while len(batch) >= batch_size:
+            yield batch[:batch_size], errors
+            batch = batch[batch_size:]
+            errors = list()
+    if batch or errors:
+        yield batch, errors
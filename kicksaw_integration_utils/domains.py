@@ -0,0 +1,141 @@
+import functools
+
+from importlib import resources
+from typing import Iterable, List, Optional
+
+PRIVATE_DOMAINS_MARKER = "===BEGIN PRIVATE DOMAINS==="
+
+# marks the end of a rule in the trie. Labels can't be empty, so it can't clash
+_RULE = ""
+
+
+def _to_ascii(label: str) -> Optional[str]:
+    try:
+        return label.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+
+class PublicSuffixList:
+    """
+    The public suffix list (https://publicsuffix.org) as a trie of labels, read
+    right to left, e.g., co.uk -> {"uk": {"co": {"": True}}}
+
+    A public suffix is something anyone can register names under, like com, co.uk
+    or kawasaki.jp. The registered domain is the suffix plus one label
+
+    Only the ICANN section is used by default. The private section adds suffixes
+    like github.io, where every subdomain belongs to someone different
+    """
+
+    def __init__(self, rules: str, include_private: bool = False) -> None:
+        self.root = dict()
+        for line in rules.splitlines():
+            line = line.strip()
+            if PRIVATE_DOMAINS_MARKER in line and not include_private:
+                break
+            if not line or line.startswith("//"):
+                continue
+            # rules end at the first whitespace
+            rule = line.split()[0].lower()
+            self._add_rule(rule)
+            ascii_rule = ".".join(
+                _to_ascii(label) or label for label in rule.split(".")
+            )
+            if ascii_rule != rule:
+                self._add_rule(ascii_rule)
+
+    def _add_rule(self, rule: str):
+        node = self.root
+        labels = rule.split(".")
+        for label in reversed(labels[1:]):
+            node = node.setdefault(label, dict())
+        # exceptions (!www.ck) live next to the wildcard they carve out of
+        node.setdefault(labels[0], dict())[_RULE] = True
+
+    def public_suffix_length(self, labels: List[str]) -> int:
+        """
+        How many of the (lowercased) labels, counting from the right, make up the
+        public suffix. Unlisted TLDs count as suffixes, per the list's "*" rule
+        """
+        node = self.root
+        length = 1
+        for depth, label in enumerate(reversed(labels), start=1):
+            if f"!{label}" in node:
+                return depth - 1
+            child = node.get(label)
+            if _RULE in node.get("*", ()):
+                length = depth
+            if child is None:
+                break
+            if _RULE in child:
+                length = depth
+            node = child
+        return length
+
+    def public_suffix(self, host: str) -> Optional[str]:
+        """
+        e.g., www.example.co.uk -> co.uk
+        """
+        labels = _split_host(host)
+        if not labels:
+            return None
+        return ".".join(labels[-self.public_suffix_length(labels) :])
+
+    def registered_domain(self, host: str) -> Optional[str]:
+        """
+        e.g., www.example.co.uk -> example.co.uk
+
+        None when the host is a public suffix itself, e.g., co.uk
+        """
+        labels = _split_host(host)
+        if not labels:
+            return None
+        length = self.public_suffix_length(labels) + 1
+        if length > len(labels):
+            return None
+        return ".".join(labels[-length:])
+
+
+def _split_host(host: str) -> List[str]:
+    if not host:
+        return list()
+    labels = host.lower().rstrip(".").split(".")
+    if "" in labels:
+        return list()
+    return labels
+
+
+@functools.lru_cache(maxsize=None)
+def get_public_suffix_list(include_private: bool = False) -> PublicSuffixList:
+    """
+    The copy of the public suffix list bundled with this package, parsed once.
+    Nothing is downloaded; update data/public_suffix_list.dat to refresh it
+    """
+    rules = resources.read_text(
+        "kicksaw_integration_utils.data", "public_suffix_list.dat", encoding="utf-8"
+    )
+    return PublicSuffixList(rules, include_private=include_private)
+
+
+@functools.lru_cache(maxsize=2**16)
+def registered_domain(host: str, include_private: bool = False) -> Optional[str]:
+    """
+    The registered domain of a host, per the bundled public suffix list
+        e.g., blog.example.co.uk -> example.co.uk
+
+    None if the host is empty or a public suffix itself. Results are cached
+    """
+    return get_public_suffix_list(include_private).registered_domain(host)
+
+
+def registered_domains(
+    hosts: Iterable[str], include_private: bool = False
+) -> List[Optional[str]]:
+    """
+    registered_domain for many hosts, resolving each distinct host once
+    """
+    hosts = list(hosts)
+    suffix_list = get_public_suffix_list(include_private)
+    lookup = {host: suffix_list.registered_domain(host) for host in set(hosts)}
+    return [lookup[host] for host in hosts]
@@ -1,4 +1,21 @@
 import datetime
+import functools
+import sys
+
+from typing import Any, Callable, Optional
+
+
+@functools.lru_cache(maxsize=None)
+def _pandas():
+    """
+    pandas, or None if it isn't installed. It takes longer to import than the
+    rest of this package, so it's only imported once a column is formatted
+    """
+    try:
+        import pandas  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return pandas
 
 
 def convert_to_iso_date(date):
@@ -25,3 +42,111 @@ def convert_to_iso_date(date):
         except ValueError:
             return None
     return None
+
+
+def _is_missing(value) -> bool:
+    # NaN and NaT are the only values that aren't equal to themselves
+    return value is None or value != value  # pylint: disable=comparison-with-itself
+
+
+def to_text(value) -> Optional[str]:
+    """
+    What formatters are given for a value: None for missing values (None, NaN),
+    and str(value) for values that aren't strings
+    """
+    if isinstance(value, str):
+        return value
+    if _is_missing(value):
+        return None
+    return str(value)
+
+
+def _format_value(value, formatter: Callable[[str], Any]):
+    value = to_text(value)
+    if value is None:
+        return None
+    return formatter(value)
+
+
+def wrap_like(values, formatted):
+    """
+    Returns formatted (an object ndarray or a list) in the same kind of container
+    values came in
+    """
+    # values can only be a Series or an ndarray if their module was imported
+    pd = sys.modules.get("pandas")
+    np = sys.modules.get("numpy")
+    if pd is not None and isinstance(values, pd.Series):
+        return pd.Series(formatted, index=values.index, name=values.name, dtype=object)
+    if np is not None and isinstance(values, np.ndarray):
+        return np.asarray(formatted, dtype=object)
+    return list(formatted)
+
+
+def _format_unique_values(values, format_uniques: Callable):
+    """
+    Formats each distinct value once, then spreads the results back out
+    """
+    pd = _pandas()
+    if pd is not None:
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        formatted = np.empty(len(uniques) + 1, dtype=object)
+        formatted[:-1] = format_uniques(uniques)
+        formatted[-1] = None
+        # missing values get code -1, i.e., the trailing None
+        return wrap_like(values, formatted[codes])
+
+    uniques = list(dict.fromkeys(values))
+    lookup = dict(zip(uniques, format_uniques(uniques)))
+    return wrap_like(values, [lookup[value] for value in values])
+
+
+def format_column(values, formatter: Callable[[str], Any]):
+    """
+    Applies a scalar formatter to a whole column, calling it once per distinct value
+
+    values can be a list, a numpy array or a pandas Series, and the result comes
+    back as the same type. Missing values (None, NaN) format to None, and values
+    that aren't strings are formatted as str(value)
+    """
+    return _format_unique_values(
+        values, lambda uniques: [_format_value(value, formatter) for value in uniques]
+    )
+
+
+def _iso_dates_for_uniques(uniques) -> list:
+    """
+    Vectorized convert_to_iso_date over an array of distinct values
+    """
+    pd = _pandas()
+    values = pd.Series(uniques, dtype=object).astype(str)
+    digits = values.str.replace(r"\D", "", regex=True)
+    candidates = digits.where(digits.str.len() == 8)
+    parsed = pd.to_datetime(candidates, format="%Y%m%d", errors="coerce")
+    dates = parsed.dt.strftime("%Y-%m-%d").astype(object).where(parsed.notna(), None)
+
+    # pandas can't represent years before 1677 or after 2262, and str.isdigit
+    # counts a few non-ascii characters as digits that \D doesn't. Leave those
+    # few to the scalar formatter, so both always agree
+    unsettled = (candidates.notna() & parsed.isna()) | values.str.contains(
+        r"[^\x00-\x7f]", regex=True
+    )
+    if unsettled.any():
+        dates[unsettled] = values[unsettled].map(convert_to_iso_date)
+    return dates.tolist()
+
+
+def convert_column_to_iso_date(values):
+    """
+    convert_to_iso_date for a whole column
+        e.g. ['20220101', None, '2022/01/01'] => ['2022-01-01', None, '2022-01-01']
+
+    values can be a list, a numpy array or a pandas Series, and the result comes
+    back as the same type. Each distinct value is only converted once, and when
+    pandas is installed the digit stripping and date validation are vectorized
+    """
+    if _pandas() is None:
+        return format_column(values, convert_to_iso_date)
+    return _format_unique_values(values, _iso_dates_for_uniques)
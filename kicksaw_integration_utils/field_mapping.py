@@ -0,0 +1,260 @@
+import functools
+import sys
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel, root_validator, validator
+
+from kicksaw_integration_utils.field_formatters import (
+    convert_column_to_iso_date,
+    convert_to_iso_date,
+    format_column,
+    to_text,
+    wrap_like,
+)
+from kicksaw_integration_utils.utils import extract_domain
+
+FORMATTERS: Dict[str, Callable[[Any], Any]] = {
+    "iso_date": convert_to_iso_date,
+    "extract_domain": extract_domain,
+    "extract_root_domain": functools.partial(extract_domain, remove_subdomains=True),
+    "strip": str.strip,
+    "lower": str.lower,
+    "upper": str.upper,
+}
+
+# formatters with a faster, whole-column version; the rest go through format_column
+COLUMN_FORMATTERS: Dict[str, Callable] = {
+    "iso_date": convert_column_to_iso_date,
+}
+
+
+def register_formatter(
+    name: str, formatter: Callable[[Any], Any], column_formatter: Callable = None
+):
+    """
+    Makes a formatter available to field mappings by name
+
+    column_formatter optionally does the same over a whole column (see
+    field_formatters.format_column)
+    """
+    FORMATTERS[name] = formatter
+    if column_formatter:
+        COLUMN_FORMATTERS[name] = column_formatter
+
+
+class FieldSpec(BaseModel):
+    """
+    How to get one target field out of a source row
+
+    The source value goes through the formatters in order, then lookup, and
+    falls back to default if it ends up None or empty. Formatters and lookup are
+    skipped once the value is None. Use constant instead of source for a value
+    that's the same on every record
+    """
+
+    source: Optional[str] = None
+    constant: Any = None
+    formatters: List[str] = list()
+    lookup: Optional[Dict[Any, Any]] = None
+    default: Any = None
+
+    @validator("formatters", each_item=True)
+    def formatter_exists(cls, name):
+        assert name in FORMATTERS, f"unknown formatter {name}"
+        return name
+
+    @root_validator(skip_on_failure=True)
+    def source_or_constant(cls, values):
+        has_source = values.get("source") is not None
+        has_constant = values.get("constant") is not None
+        assert has_source != has_constant, "give exactly one of source or constant"
+        return values
+
+
+class FieldMapping(BaseModel):
+    """
+    Target field name -> FieldSpec. A plain string is shorthand for a rename
+
+        FieldMapping.parse_obj(
+            {
+                "fields": {
+                    "Name": "name",
+                    "Website": {"source": "url", "formatters": ["extract_domain"]},
+                    "Birthdate": {"source": "dob", "formatters": ["iso_date"]},
+                    "Industry": {"source": "sector", "lookup": {"tech": "Technology"}},
+                    "LeadSource": {"constant": "Integration"},
+                }
+            }
+        )
+    """
+
+    fields: Dict[str, FieldSpec]
+
+    @validator("fields", pre=True)
+    def expand_renames(cls, fields):
+        return {
+            target: {"source": spec} if isinstance(spec, str) else spec
+            for target, spec in fields.items()
+        }
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and value == "")
+
+
+def _generate_row_mapper(mapping: FieldMapping) -> Callable[[dict], dict]:
+    """
+    Writes the mapping out as the source of a single function, and compiles it.
+    Every spec option becomes straight-line code, so nothing about the mapping is
+    looked up per row
+    """
+    namespace = dict(to_text=to_text)
+    lines = ["def map_row(row):"]
+    for index, (target, spec) in enumerate(mapping.fields.items()):
+        value = f"v{index}"
+        if spec.source is not None:
+            lines.append(f"    {value} = row.get({spec.source!r})")
+        else:
+            namespace[f"constant{index}"] = spec.constant
+            lines.append(f"    {value} = constant{index}")
+
+        # formatters get values the way format_column gives them: as strings,
+        # with NaN as None
+        for step_index, formatter in enumerate(spec.formatters):
+            name = f"step{index}_{step_index}"
+            namespace[name] = FORMATTERS[formatter]
+            lines.append(f"    if {value} is not None:")
+            lines.append(f"        if not isinstance({value}, str):")
+            lines.append(f"            {value} = to_text({value})")
+            lines.append(f"        if {value} is not None:")
+            lines.append(f"            {value} = {name}({value})")
+        if spec.lookup is not None:
+            namespace[f"lookup{index}"] = spec.lookup.get
+            lines.append(f"    if {value} is not None:")
+            lines.append(f"        {value} = lookup{index}({value})")
+
+        if spec.default is not None:
+            namespace[f"default{index}"] = spec.default
+            lines.append(f"    if {value} is None or {value} == '':")
+            lines.append(f"        {value} = default{index}")
+
+    record = ", ".join(
+        f"{target!r}: v{index}" for index, target in enumerate(mapping.fields)
+    )
+    lines.append(f"    return {{{record}}}")
+
+    exec("\n".join(lines), namespace)  # pylint: disable=exec-used
+    return namespace["map_row"]
+
+
+class RowMapper:
+    """
+    A FieldMapping compiled into a function of a row (dict) that returns the
+    record. Compiled once, when created
+
+    Can be pickled, so it works as read_csv_batches' mapper with max_workers
+    """
+
+    def __init__(self, mapping: FieldMapping) -> None:
+        self.mapping = mapping
+        self.map_row = _generate_row_mapper(mapping)
+
+    def __call__(self, row: dict) -> dict:
+        return self.map_row(row)
+
+    def __reduce__(self):
+        return RowMapper, (self.mapping,)
+
+    def map_rows(self, rows: Iterable[dict]) -> Iterator[dict]:
+        return map(self.map_row, rows)
+
+
+def _fill_default(column, default):
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(column, pd.Series):
+        return column.mask(column.isna() | (column == ""), default)
+    return wrap_like(
+        column, [default if _is_blank(value) else value for value in column]
+    )
+
+
+def _lookup_column(column, lookup: dict):
+    return wrap_like(
+        column, [None if value is None else lookup.get(value) for value in column]
+    )
+
+
+def _column_steps(spec: FieldSpec) -> List[Callable]:
+    steps = list()
+    for name in spec.formatters:
+        if name in COLUMN_FORMATTERS:
+            steps.append(COLUMN_FORMATTERS[name])
+        else:
+            steps.append(functools.partial(format_column, formatter=FORMATTERS[name]))
+    if spec.lookup is not None:
+        steps.append(functools.partial(_lookup_column, lookup=spec.lookup))
+    return steps
+
+
+class ColumnMapper:
+    """
+    A FieldMapping compiled into a transform of whole columns
+
+    Takes a dict of source column name -> column (list, numpy array or pandas
+    Series), or a pandas DataFrame, and returns the target columns the same way.
+    Formatters run once per distinct value of a column (see field_formatters)
+    """
+
+    def __init__(self, mapping: FieldMapping) -> None:
+        self.mapping = mapping
+        self.fields = [
+            (target, spec, _column_steps(spec))
+            for target, spec in mapping.fields.items()
+        ]
+
+    def __call__(self, columns):
+        # a DataFrame means pandas was imported already, so no need to import it
+        pd = sys.modules.get("pandas")
+        is_data_frame = pd is not None and isinstance(columns, pd.DataFrame)
+        if is_data_frame:
+            length = len(columns)
+        else:
+            length = len(next(iter(columns.values()))) if columns else 0
+
+        mapped = dict()
+        for target, spec, steps in self.fields:
+            if spec.source is None:
+                column = [spec.constant] * length
+            elif spec.source in columns:
+                column = columns[spec.source]
+            else:
+                column = [None] * length
+
+            for step in steps:
+                column = step(column)
+            if spec.default is not None:
+                column = _fill_default(column, spec.default)
+            mapped[target] = column
+
+        if is_data_frame:
+            return pd.DataFrame(mapped, index=columns.index)
+        return mapped
+
+
+def compile_mapping(mapping) -> RowMapper:
+    """
+    Compiles a FieldMapping (or a dict of one) into a RowMapper
+    """
+    if not isinstance(mapping, FieldMapping):
+        mapping = FieldMapping.parse_obj(mapping)
+    return RowMapper(mapping)
+
+
+def compile_column_mapping(mapping) -> ColumnMapper:
+    """
+    Compiles a FieldMapping (or a dict of one) into a ColumnMapper
+    """
+    if not isinstance(mapping, FieldMapping):
+        mapping = FieldMapping.parse_obj(mapping)
+    return ColumnMapper(mapping)
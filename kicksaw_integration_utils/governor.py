@@ -0,0 +1,386 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Dict, Tuple
+
+from pydantic import BaseModel
+
+from kicksaw_integration_utils import instrumentation
+
+LIMIT_INFO_HEADER = "Sforce-Limit-Info"
+LIMIT_EXCEEDED = "REQUEST_LIMIT_EXCEEDED"
+# the message Salesforce sends when the org is out of API calls for the day, as
+# opposed to too many long-running requests at once
+DAILY_LIMIT_EXCEEDED = "TotalRequests Limit exceeded"
+
+
+def parse_limit_info(header: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parses a Sforce-Limit-Info header into name -> (used, limit)
+        e.g. 'api-usage=25/15000, per-app-api-usage=17/250(appName=an-app)'
+        => {'api-usage': (25, 15000), 'per-app-api-usage': (17, 250)}
+    """
+    usage = dict()
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        used, _, limit = value.partition("(")[0].partition("/")
+        if name and used.strip().isdigit() and limit.strip().isdigit():
+            usage[name] = (int(used), int(limit))
+    return usage
+
+
+class TokenBucket:
+    """
+    Lets rate calls per second through on average, in bursts of up to capacity
+    calls, across threads
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        assert rate > 0, "rate must be positive"
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        assert rate > 0, "rate must be positive"
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens, waiting for them if there aren't enough. Returns the
+        seconds waited
+
+        Tokens are reserved before waiting, so threads are let through in the
+        order they asked
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, tokens: float):
+        """
+        Gives back tokens that were acquired but not used
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class ApiUsage(BaseModel):
+    """
+    The org's API usage as of observed_at, per the last Sforce-Limit-Info
+    header seen, and until when calls are paused
+    """
+
+    used: int = 0
+    limit: int = 0
+    observed_at: float = 0
+    paused_until: float = 0
+
+    @property
+    def fraction(self) -> float:
+        return self.used / self.limit if self.limit else 0
+
+    def merge(self, other: "ApiUsage") -> "ApiUsage":
+        newest = self if self.observed_at >= other.observed_at else other
+        return ApiUsage(
+            used=newest.used,
+            limit=newest.limit,
+            observed_at=newest.observed_at,
+            paused_until=max(self.paused_until, other.paused_until),
+        )
+
+
+class GovernorStore:
+    """
+    Base class for sharing ApiUsage between processes, e.g., every Lambda
+    that talks to the same org
+    """
+
+    def merge(self, key: str, usage: ApiUsage) -> ApiUsage:
+        """
+        Merges usage into what's stored under key, returning the result
+        """
+        raise NotImplementedError
+
+
+class SQLiteGovernorStore(GovernorStore):
+    """
+    Shares usage through a local sqlite database, between every process on the
+    machine
+    """
+
+    def __init__(self, path: Path = None) -> None:
+        if not path:
+            path = Path(os.getenv("TEMP", gettempdir())) / "governor.sqlite3"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS governor (key TEXT PRIMARY KEY, "
+                "used INTEGER, api_limit INTEGER, observed_at REAL, paused_until REAL)"
+            )
+
+    def merge(self, key: str, usage: ApiUsage) -> ApiUsage:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    "SELECT used, api_limit, observed_at, paused_until "
+                    "FROM governor WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row:
+                    stored = ApiUsage(
+                        used=row[0],
+                        limit=row[1],
+                        observed_at=row[2],
+                        paused_until=row[3],
+                    )
+                    usage = stored.merge(usage)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO governor VALUES (?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        usage.used,
+                        usage.limit,
+                        usage.observed_at,
+                        usage.paused_until,
+                    ),
+                )
+            finally:
+                self.connection.execute("COMMIT")
+        return usage
+
+
+class DynamoDBGovernorStore(GovernorStore):
+    """
+    Shares usage through a DynamoDB table, between every Lambda
+
+    The table's partition key is a string named key_attribute
+    """
+
+    def __init__(
+        self, table_name: str, key_attribute: str = "governor_key", client=None
+    ) -> None:
+        self.table_name = table_name
+        self.key_attribute = key_attribute
+        if not client:
+            import boto3
+
+            client = boto3.client("dynamodb")
+        self.client = client
+
+    def _update_if_newer(
+        self, key: str, attribute: str, expression: str, values: dict, **kwargs
+    ):
+        # conditional, so a slower process can't overwrite newer numbers
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={self.key_attribute: {"S": key}},
+                UpdateExpression=f"SET {expression}",
+                ConditionExpression=(
+                    f"attribute_not_exists({attribute}) OR {attribute} < :{attribute}"
+                ),
+                ExpressionAttributeValues=values,
+                **kwargs,
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def merge(self, key: str, usage: ApiUsage) -> ApiUsage:
+        if usage.observed_at:
+            self._update_if_newer(
+                key,
+                "observed_at",
+                "used = :used, #limit = :limit, observed_at = :observed_at",
+                {
+                    ":used": {"N": str(usage.used)},
+                    ":limit": {"N": str(usage.limit)},
+                    ":observed_at": {"N": repr(usage.observed_at)},
+                },
+                # limit is a reserved word
+                ExpressionAttributeNames={"#limit": "limit"},
+            )
+        if usage.paused_until:
+            self._update_if_newer(
+                key,
+                "paused_until",
+                "paused_until = :paused_until",
+                {":paused_until": {"N": repr(usage.paused_until)}},
+            )
+
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={self.key_attribute: {"S": key}},
+            ConsistentRead=True,
+        ).get("Item", dict())
+        stored = ApiUsage(
+            **{
+                name: float(item[name]["N"])
+                for name in ApiUsage.__fields__
+                if name in item
+            }
+        )
+        return usage.merge(stored)
+
+    def create_table(self):
+        """
+        Creates the table (on demand billing), e.g., for tests
+        """
+        self.client.create_table(
+            TableName=self.table_name,
+            KeySchema=[{"AttributeName": self.key_attribute, "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": self.key_attribute, "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        self.client.get_waiter("table_exists").wait(TableName=self.table_name)
+
+
+class SalesforceGovernor:
+    """
+    Throttles the calls a process makes to Salesforce, and slows down as the
+    org's daily API limit gets close
+
+    Every call takes a token from a bucket refilled at rate calls per second.
+    Salesforce reports the org's usage in the Sforce-Limit-Info header of its
+    responses; past soft_limit (a fraction of the daily limit) the rate drops
+    linearly, down to min_rate at hard_limit.
+
+    REQUEST_LIMIT_EXCEEDED responses are handled too: when the org is out of
+    calls for the day, the rate drops to min_rate and the response is returned
+    as is, since retrying only burns what's left. When too many long-running
+    requests are in flight, calls are paused for about pause_seconds and the
+    request is retried, up to max_retries times.
+
+    With a store, processes share the usage they see and any pause, checking
+    the store at most every sync_interval seconds. store_key tells orgs apart
+    """
+
+    def __init__(
+        self,
+        rate: float = 25.0,
+        burst: float = None,
+        soft_limit: float = 0.8,
+        hard_limit: float = 0.95,
+        min_rate: float = 0.5,
+        pause_seconds: float = 5.0,
+        max_retries: int = 5,
+        store: GovernorStore = None,
+        store_key: str = "salesforce",
+        sync_interval: float = 5.0,
+    ) -> None:
+        assert 0 < soft_limit < hard_limit <= 1, "expected 0 < soft < hard limit <= 1"
+        assert 0 < min_rate <= rate, "expected 0 < min_rate <= rate"
+        self.rate = rate
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.min_rate = min_rate
+        self.pause_seconds = pause_seconds
+        self.max_retries = max_retries
+        self.store = store
+        self.store_key = store_key
+        self.sync_interval = sync_interval
+        self.bucket = TokenBucket(rate, burst)
+        self.usage = ApiUsage()
+        self.synced_at = None
+        self.lock = threading.Lock()
+
+    def effective_rate(self) -> float:
+        """
+        The rate allowed at the current usage
+        """
+        fraction = self.usage.fraction
+        if fraction <= self.soft_limit:
+            return self.rate
+        if fraction >= self.hard_limit:
+            return self.min_rate
+        headroom = (self.hard_limit - fraction) / (self.hard_limit - self.soft_limit)
+        return max(self.min_rate, self.rate * headroom)
+
+    def _update(self, usage: ApiUsage):
+        with self.lock:
+            self.usage = self.usage.merge(usage)
+            self.bucket.set_rate(self.effective_rate())
+
+    def sync(self, force: bool = False):
+        """
+        Shares usage with other processes through the store, if there is one
+        """
+        if self.store is None:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if (
+                not force
+                and self.synced_at is not None
+                and now - self.synced_at < self.sync_interval
+            ):
+                return
+            self.synced_at = now
+            usage = self.usage
+        self._update(self.store.merge(self.store_key, usage))
+
+    def acquire(self):
+        """
+        Waits until a call can be made
+        """
+        self.sync()
+        pause = self.usage.paused_until - time.time()
+        if pause > 0:
+            instrumentation.count("salesforce.throttled", reason="paused")
+            time.sleep(pause)
+        waited = self.bucket.acquire()
+        if waited:
+            instrumentation.count("salesforce.throttled", reason="rate")
+            instrumentation.observe("salesforce.throttle_wait", waited * 1000)
+
+    def observe(self, response) -> bool:
+        """
+        Records the usage reported by a response, returning whether the request
+        should be retried
+        """
+        limits = parse_limit_info(response.headers.get(LIMIT_INFO_HEADER))
+        if "api-usage" in limits:
+            used, limit = limits["api-usage"]
+            self._update(ApiUsage(used=used, limit=limit, observed_at=time.time()))
+
+        if response.status_code != 403 or LIMIT_EXCEEDED not in response.text:
+            return False
+
+        if DAILY_LIMIT_EXCEEDED in response.text:
+            limit = self.usage.limit or 1
+            self._update(ApiUsage(used=limit, limit=limit, observed_at=time.time()))
+            self.sync(force=True)
+            return False
+
+        # jittered, so paused processes don't all come back at the same time
+        pause = self.pause_seconds * random.uniform(1, 1.5)
+        self._update(ApiUsage(paused_until=time.time() + pause))
+        self.sync(force=True)
+        return True
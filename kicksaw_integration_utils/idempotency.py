@@ -0,0 +1,293 @@
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from tempfile import gettempdir
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# a Lambda runs for 15 minutes at most, and SQS/S3 retries come after that
+DEFAULT_LEASE_SECONDS = 15 * 60
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+class Claim(str, Enum):
+    """
+    What claim found: the key is now this caller's, someone else is still
+    processing it, or it was already processed
+
+    Only CLAIMED is truthy, so `if store.claim(key):` reads as before
+    """
+
+    CLAIMED = "claimed"
+    IN_PROGRESS = IN_PROGRESS
+    COMPLETED = COMPLETED
+
+    def __bool__(self) -> bool:
+        return self is Claim.CLAIMED
+
+
+class InProgressError(Exception):
+    """
+    Raised for a delivery whose key someone else is still processing, so that it
+    gets retried later instead of being dropped: the other worker may yet die
+    without completing it
+    """
+
+
+def get_s3_idempotency_key(
+    bucket_name: str, s3_object_key: str, etag: str = None, version_id: str = None
+) -> str:
+    """
+    Identifies a version of an s3 object, e.g., s3://bucket/origin/a_file.csv#etag
+
+    Uploading the same content again gives the same key (the ETag is a hash of
+    the content), so a file that's re-sent as is counts as a duplicate
+    """
+    key = f"s3://{bucket_name}/{s3_object_key}"
+    if version_id:
+        key += f"?versionId={version_id}"
+    if etag:
+        key += f"#{etag.strip(chr(34))}"
+    return key
+
+
+class IdempotencyStore:
+    """
+    Base class for remembering which deliveries (s3 objects, SQS messages, ...)
+    were already processed, so that duplicates can be skipped
+
+        claim = store.claim(key)
+        if claim == Claim.IN_PROGRESS:
+            raise InProgressError(key)  # i.e., retry later
+        if claim:
+            try:
+                process()
+            except Exception:
+                store.release(key)
+                raise
+            store.complete(key)
+
+    Only a COMPLETED key is a duplicate that can be dropped. claim holds the key for lease_seconds, in case whoever claimed it dies
+    without releasing it. Once completed, a key is remembered for ttl seconds
+    """
+
+    def __init__(
+        self, ttl: int = DEFAULT_TTL, lease_seconds: int = DEFAULT_LEASE_SECONDS
+    ):
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+
+    def claim(self, key: str) -> Claim:
+        """
+        Marks key as in progress, returning Claim.CLAIMED, unless it's already in
+        progress or completed, which is returned instead
+        """
+        raise NotImplementedError
+
+    def complete(self, key: str):
+        """
+        Marks key as processed, for ttl seconds
+        """
+        raise NotImplementedError
+
+    def release(self, key: str):
+        """
+        Forgets key, so the next delivery gets processed
+        """
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    Keeps the max_size most recently claimed keys in memory
+
+    Only catches duplicates that reach the same process, e.g., the same warm
+    Lambda container, but costs nothing
+    """
+
+    def __init__(self, max_size: int = 100_000, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_size = max_size
+        self.keys = OrderedDict()  # key -> (status, expires at)
+        self.lock = threading.Lock()
+
+    def claim(self, key: str) -> Claim:
+        now = time.time()
+        with self.lock:
+            entry = self.keys.get(key)
+            if entry is not None and entry[1] > now:
+                self.keys.move_to_end(key)
+                return Claim(entry[0])
+            self.keys[key] = (IN_PROGRESS, now + self.lease_seconds)
+            self.keys.move_to_end(key)
+            while len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+            return Claim.CLAIMED
+
+    def complete(self, key: str):
+        with self.lock:
+            self.keys[key] = (COMPLETED, time.time() + self.ttl)
+            self.keys.move_to_end(key)
+
+    def release(self, key: str):
+        with self.lock:
+            self.keys.pop(key, None)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Keeps keys in a local sqlite database, shared by every process on the machine
+    """
+
+    def __init__(self, path: Path = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        if not path:
+            path = Path(os.getenv("TEMP", gettempdir())) / "idempotency.sqlite3"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency "
+                "(key TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        self.purge()
+
+    def claim(self, key: str) -> Claim:
+        now = time.time()
+        with self.lock:
+            # one write transaction, so other processes can't claim in between
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "DELETE FROM idempotency WHERE key = ? AND expires_at <= ?",
+                    (key, now),
+                )
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO idempotency VALUES (?, ?, ?)",
+                    (key, IN_PROGRESS, now + self.lease_seconds),
+                )
+                if cursor.rowcount == 1:
+                    return Claim.CLAIMED
+                (status,) = self.connection.execute(
+                    "SELECT status FROM idempotency WHERE key = ?", (key,)
+                ).fetchone()
+                return Claim(status)
+            finally:
+                self.connection.execute("COMMIT")
+
+    def complete(self, key: str):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?)",
+                (key, COMPLETED, time.time() + self.ttl),
+            )
+
+    def release(self, key: str):
+        with self.lock:
+            self.connection.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+
+    def purge(self):
+        """
+        Deletes expired keys
+        """
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),)
+            )
+
+
+class DynamoDBIdempotencyStore(IdempotencyStore):
+    """
+    Keeps keys in a DynamoDB table (or anything that speaks its API), shared by
+    every Lambda
+
+    The table's partition key is a string named key_attribute. Enable TTL on the
+    expires_at attribute to have DynamoDB delete expired keys; it does so lazily,
+    so expires_at is checked on claim as well
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        key_attribute: str = "idempotency_key",
+        client=None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.table_name = table_name
+        self.key_attribute = key_attribute
+        if not client:
+            import boto3
+
+            client = boto3.client("dynamodb")
+        self.client = client
+
+    def _put(self, key: str, status: str, expires_at: float, **kwargs):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                self.key_attribute: {"S": key},
+                "status": {"S": status},
+                "expires_at": {"N": str(int(expires_at))},
+            },
+            **kwargs,
+        )
+
+    def claim(self, key: str) -> Claim:
+        now = time.time()
+        try:
+            self._put(
+                key,
+                IN_PROGRESS,
+                now + self.lease_seconds,
+                ConditionExpression="attribute_not_exists(#key) OR expires_at <= :now",
+                ExpressionAttributeNames={"#key": self.key_attribute},
+                ExpressionAttributeValues={":now": {"N": str(int(now))}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            item = self.client.get_item(
+                TableName=self.table_name,
+                Key={self.key_attribute: {"S": key}},
+                ConsistentRead=True,
+            ).get("Item")
+            # released in between: leave it to the next delivery, to be safe
+            if not item:
+                return Claim.IN_PROGRESS
+            return Claim(item["status"]["S"])
+        return Claim.CLAIMED
+
+    def complete(self, key: str):
+        self._put(key, COMPLETED, time.time() + self.ttl)
+
+    def release(self, key: str):
+        self.client.delete_item(
+            TableName=self.table_name, Key={self.key_attribute: {"S": key}}
+        )
+
+    def create_table(self):
+        """
+        Creates the table (on demand billing) with TTL enabled, e.g., for tests
+        """
+        self.client.create_table(
+            TableName=self.table_name,
+            KeySchema=[{"AttributeName": self.key_attribute, "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": self.key_attribute, "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        self.client.get_waiter("table_exists").wait(TableName=self.table_name)
+        self.client.update_time_to_live(
+            TableName=self.table_name,
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": "expires_at"},
+        )
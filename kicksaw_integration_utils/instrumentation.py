@@ -0,0 +1,537 @@
+import bisect
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+
+from typing import Any, Callable, Dict, IO, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets; milliseconds, for latencies
+BUCKETS = (
+    1,
+    2,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+    60000,
+    300000,
+    float("inf"),
+)
+
+# instrumentation is on as long as there's an exporter. Everything checks this
+# list first, so that's all it costs when it's off
+_exporters: List["Exporter"] = list()
+
+
+class Span:
+    """
+    Times a block of code, as a context manager
+
+    Its duration (in milliseconds) goes into the histogram of the same name, and
+    the span itself goes to the exporters. Attributes describe this particular
+    span (file names, record counts, ...) and aren't used as metric dimensions
+    """
+
+    __slots__ = ("name", "attributes", "start_time", "duration", "error", "_start")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.start_time: float = 0.0
+        self.duration: float = 0.0
+        self.error: Optional[str] = None
+        self._start: float = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.duration = (time.perf_counter() - self._start) * 1000
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        observe(self.name, self.duration)
+        for exporter in _exporters:
+            exporter.export_span(self)
+        return False
+
+
+class _NoopSpan:
+    """
+    What span returns when instrumentation is off
+    """
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Times the block it wraps
+
+        with span("s3.upload_file", key=s3_key) as upload:
+            ...
+            upload.set_attribute("bytes", size)
+    """
+    if not _exporters:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def timed(name: str, func: Callable, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) in a span, e.g., to time a method that subclasses
+    may override
+    """
+    if not _exporters:
+        return func(*args, **kwargs)
+    with Span(name, dict()):
+        return func(*args, **kwargs)
+
+
+def instrumented(name: str = None):
+    """
+    Decorator that calls the function in a span, named after the function by
+    default. Don't use it on generators; they return before they do any work
+    """
+
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _exporters:
+                return func(*args, **kwargs)
+            with Span(span_name, dict()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Histogram:
+    """
+    Count, sum, min, max and the number of values in each of BUCKETS
+    """
+
+    __slots__ = ("count", "sum", "min", "max", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram()
+        histogram.count, histogram.sum = self.count, self.sum
+        histogram.min, histogram.max = self.min, self.max
+        histogram.buckets = list(self.buckets)
+        return histogram
+
+
+class MetricPoint(BaseModel):
+    """
+    A counter's total, or a histogram's summary, since the last flush
+
+    buckets line up with BUCKETS, for histograms
+    """
+
+    name: str
+    kind: str
+    unit: str
+    attributes: Dict[str, Any] = dict()
+    value: float = 0
+    count: int = 0
+    min: Optional[float] = None
+    max: Optional[float] = None
+    buckets: List[int] = list()
+
+
+MetricKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+class Metrics:
+    """
+    Counters and histograms, keyed by name and attributes
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[MetricKey, float] = dict()
+        self.histograms: Dict[MetricKey, Histogram] = dict()
+        self.units: Dict[str, str] = dict()
+
+    def count(self, name: str, value: float, unit: str, attributes: dict):
+        key = (name, tuple(sorted(attributes.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.units[name] = unit
+
+    def observe(self, name: str, value: float, unit: str, attributes: dict):
+        key = (name, tuple(sorted(attributes.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+            self.units[name] = unit
+
+    def collect(self, reset: bool = False) -> List[MetricPoint]:
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [
+                (key, histogram.copy()) for key, histogram in self.histograms.items()
+            ]
+            units = dict(self.units)
+            if reset:
+                self.counters, self.histograms = dict(), dict()
+
+        points = [
+            MetricPoint(
+                name=name,
+                kind="counter",
+                unit=units[name],
+                attributes=dict(attributes),
+                value=value,
+            )
+            for (name, attributes), value in counters
+        ]
+        points += [
+            MetricPoint(
+                name=name,
+                kind="histogram",
+                unit=units[name],
+                attributes=dict(attributes),
+                value=histogram.sum,
+                count=histogram.count,
+                min=histogram.min,
+                max=histogram.max,
+                buckets=histogram.buckets,
+            )
+            for (name, attributes), histogram in histograms
+        ]
+        return points
+
+
+_metrics = Metrics()
+
+
+def count(name: str, value: float = 1, unit: str = "Count", **attributes):
+    """
+    Adds value to a counter, e.g., count("sqs.api_calls", operation="SendMessageBatch")
+
+    attributes become metric dimensions, so keep their values to a handful
+    """
+    if not _exporters:
+        return
+    _metrics.count(name, value, unit, attributes)
+    for exporter in _exporters:
+        exporter.export_count(name, value, unit, attributes)
+
+
+def observe(name: str, value: float, unit: str = "Milliseconds", **attributes):
+    """
+    Records a value in a histogram, e.g., a batch's latency
+    """
+    if not _exporters:
+        return
+    _metrics.observe(name, value, unit, attributes)
+    for exporter in _exporters:
+        exporter.export_observation(name, value, unit, attributes)
+
+
+class Exporter:
+    """
+    Base class for sending instrumentation somewhere
+
+    Spans, counts and observations are handed over as they happen; metrics,
+    aggregated since the last flush, when flush is called. Exporters implement
+    whichever they need
+    """
+
+    def export_span(self, span: Span):
+        pass
+
+    def export_count(self, name: str, value: float, unit: str, attributes: dict):
+        pass
+
+    def export_observation(self, name: str, value: float, unit: str, attributes: dict):
+        pass
+
+    def export_metrics(self, metrics: List[MetricPoint]):
+        pass
+
+
+class LoggingExporter(Exporter):
+    """
+    Logs spans (at debug level) as they end, and metrics when flushed
+    """
+
+    def __init__(self, log: logging.Logger = None, level: int = logging.INFO) -> None:
+        self.log = log if log else logger
+        self.level = level
+
+    def export_span(self, span: Span):
+        self.log.debug(
+            "%s took %.1fms%s %s",
+            span.name,
+            span.duration,
+            f" and failed with {span.error}" if span.error else "",
+            span.attributes,
+        )
+
+    def export_metrics(self, metrics: List[MetricPoint]):
+        for point in metrics:
+            if point.kind == "counter":
+                self.log.log(
+                    self.level,
+                    "%s %s: %g %s",
+                    point.name,
+                    point.attributes,
+                    point.value,
+                    point.unit,
+                )
+            else:
+                self.log.log(
+                    self.level,
+                    "%s %s: count %d, avg %.1f, min %.1f, max %.1f %s",
+                    point.name,
+                    point.attributes,
+                    point.count,
+                    point.value / point.count,
+                    point.min,
+                    point.max,
+                    point.unit,
+                )
+
+
+# CloudWatch takes at most 100 values per metric, per EMF document
+EMF_MAX_VALUES = 100
+
+
+class EMFExporter(Exporter):
+    """
+    Writes metrics as CloudWatch Embedded Metric Format json lines when flushed.
+    In Lambda, printing them is enough for CloudWatch to pick them up as metrics
+
+    A metric's attributes become its dimensions, on top of the exporter's own
+    dimensions (e.g., {"Integration": "accounts"}). Histograms are written as
+    one value per observation, rounded up to their bucket (and down to the max),
+    over as many documents as it takes
+    """
+
+    def __init__(
+        self,
+        namespace: str = "KicksawIntegrationUtils",
+        dimensions: Dict[str, str] = None,
+        stream: IO = None,
+    ) -> None:
+        self.namespace = namespace
+        self.dimensions = dimensions if dimensions else dict()
+        self.stream = stream
+
+    def document(self, metrics: List[Tuple[str, str, Any]], dimensions: dict) -> dict:
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [sorted(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit} for name, unit, _ in metrics
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+            **{name: value for name, _, value in metrics},
+        }
+
+    def documents(self, metrics: List[MetricPoint]) -> List[dict]:
+        by_dimensions: Dict[tuple, list] = dict()
+        for point in metrics:
+            dimensions = {**self.dimensions, **point.attributes}
+            key = tuple(sorted(dimensions.items()))
+            by_dimensions.setdefault(key, list()).append(point)
+
+        documents = list()
+        for key, points in by_dimensions.items():
+            dimensions = {name: str(value) for name, value in key}
+            counters = [
+                (point.name, point.unit, point.value)
+                for point in points
+                if point.kind == "counter"
+            ]
+            if counters:
+                documents.append(self.document(counters, dimensions))
+            for point in points:
+                if point.kind != "histogram":
+                    continue
+                values = [
+                    min(bound, point.max)
+                    for bound, bucket_count in zip(BUCKETS, point.buckets)
+                    for _ in range(bucket_count)
+                ]
+                for start in range(0, len(values), EMF_MAX_VALUES):
+                    chunk = values[start : start + EMF_MAX_VALUES]
+                    documents.append(
+                        self.document([(point.name, point.unit, chunk)], dimensions)
+                    )
+        return documents
+
+    def export_metrics(self, metrics: List[MetricPoint]):
+        stream = self.stream if self.stream else sys.stdout
+        for document in self.documents(metrics):
+            stream.write(json.dumps(document) + "\n")
+        stream.flush()
+
+
+def _otel_value(value):
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+class OpenTelemetryExporter(Exporter):
+    """
+    Sends spans and metrics to OpenTelemetry, through the global tracer and meter
+    providers unless others are given. Requires opentelemetry-api
+
+    Spans are recorded as they end, with their original timings, so they're
+    exported flat rather than nested under one another
+    """
+
+    def __init__(self, tracer_provider=None, meter_provider=None) -> None:
+        # pylint: disable=import-outside-toplevel
+        try:
+            from opentelemetry import metrics as otel_metrics
+            from opentelemetry import trace as otel_trace
+        except ImportError:
+            otel_metrics = otel_trace = None
+        assert otel_trace is not None, "opentelemetry-api isn't installed"
+        self.otel_trace = otel_trace
+        self.tracer = otel_trace.get_tracer(__name__, tracer_provider=tracer_provider)
+        self.meter = otel_metrics.get_meter(__name__, meter_provider=meter_provider)
+        self.counters = dict()
+        self.histograms = dict()
+        self.lock = threading.Lock()
+
+    def export_span(self, span: Span):
+        start_time = int(span.start_time * 1e9)
+        otel_span = self.tracer.start_span(
+            span.name,
+            start_time=start_time,
+            attributes={
+                key: _otel_value(value) for key, value in span.attributes.items()
+            },
+        )
+        if span.error:
+            otel_span.set_status(
+                self.otel_trace.Status(self.otel_trace.StatusCode.ERROR, span.error)
+            )
+        otel_span.end(end_time=start_time + int(span.duration * 1e6))
+
+    def export_count(self, name: str, value: float, unit: str, attributes: dict):
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = self.meter.create_counter(
+                    name, unit=unit
+                )
+        counter.add(value, {key: _otel_value(v) for key, v in attributes.items()})
+
+    def export_observation(self, name: str, value: float, unit: str, attributes: dict):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = self.meter.create_histogram(
+                    name, unit=unit
+                )
+        histogram.record(value, {key: _otel_value(v) for key, v in attributes.items()})
+
+
+def enable(*exporters: Exporter):
+    """
+    Turns instrumentation on, sending it to exporters
+
+        enable(EMFExporter(dimensions={"Integration": "accounts"}))
+
+        def handler(event, context):
+            try:
+                respond_to_s3_event(event, process)
+            finally:
+                flush()
+    """
+    assert exporters, "give at least one exporter"
+    _exporters.extend(exporters)
+
+
+def disable():
+    """
+    Turns instrumentation off, dropping metrics that weren't flushed
+    """
+    _exporters.clear()
+    _metrics.collect(reset=True)
+
+
+def is_enabled() -> bool:
+    return bool(_exporters)
+
+
+def get_metrics() -> List[MetricPoint]:
+    """
+    The metrics collected since the last flush
+    """
+    return _metrics.collect()
+
+
+def flush() -> List[MetricPoint]:
+    """
+    Hands the metrics collected since the last flush to the exporters, and
+    starts over
+    """
+    metrics = _metrics.collect(reset=True)
+    for exporter in _exporters:
+        exporter.export_metrics(metrics)
+    return metrics
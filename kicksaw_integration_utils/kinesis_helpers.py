@@ -0,0 +1,135 @@
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import logging
+
+from typing import Iterator, List, Tuple
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+KPL_MAGIC = b"\xf3\x89\x9a\xc2"
+KPL_DIGEST_SIZE = 16
+
+
+def _read_varint(buffer: memoryview, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _iter_protobuf_fields(buffer: memoryview) -> Iterator[Tuple[int, object]]:
+    """
+    Yields (field number, value) for a serialized protobuf message. Just enough
+    protobuf to read KPL aggregated records without depending on protobuf
+    """
+    position = 0
+    while position < len(buffer):
+        key, position = _read_varint(buffer, position)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, position = _read_varint(buffer, position)
+        elif wire_type == 1:
+            value, position = buffer[position : position + 8], position + 8
+        elif wire_type == 2:
+            length, position = _read_varint(buffer, position)
+            value, position = buffer[position : position + length], position + length
+        elif wire_type == 5:
+            value, position = buffer[position : position + 4], position + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field_number, value
+
+
+def deaggregate(data: bytes) -> List[bytes]:
+    """
+    Splits a payload produced by the Kinesis Producer Library into the user records
+    it aggregates. Payloads that aren't aggregated come back as is
+
+    https://github.com/awslabs/amazon-kinesis-producer/blob/master/aggregation-format.md
+    """
+    if not data.startswith(KPL_MAGIC) or len(data) <= len(KPL_MAGIC) + KPL_DIGEST_SIZE:
+        return [data]
+
+    message = memoryview(data)[len(KPL_MAGIC) : -KPL_DIGEST_SIZE]
+    if hashlib.md5(message).digest() != data[-KPL_DIGEST_SIZE:]:
+        # the magic bytes were a coincidence
+        return [data]
+
+    records = list()
+    for field_number, value in _iter_protobuf_fields(message):
+        # AggregatedRecord.records
+        if field_number != 3:
+            continue
+        for record_field_number, record_value in _iter_protobuf_fields(value):
+            # Record.data
+            if record_field_number == 3:
+                records.append(bytes(record_value))
+    return records
+
+
+def decode_kinesis_data(data: bytes) -> list:
+    """
+    Decodes the raw (base64-decoded) data of a kinesis record into its json
+    payloads. A single record yields several payloads when it's KPL-aggregated
+    """
+    payloads = list()
+    for user_record in deaggregate(data):
+        if user_record.startswith(GZIP_MAGIC):
+            user_record = gzip.decompress(user_record)
+        payloads.append(json_loads(user_record))
+    return payloads
+
+
+def decode_kinesis_event(event: dict) -> Tuple[list, List[str]]:
+    """
+    Decodes every record of a kinesis Lambda event
+
+    Records may be gzipped and/or aggregated by the KPL. orjson is used for
+    parsing when it's installed
+
+    Returns the decoded payloads, and the sequence numbers of the records that
+    couldn't be decoded (see kinesis_batch_item_failures)
+    """
+    decoded = list()
+    failed_sequence_numbers = list()
+    for record in event["Records"]:
+        kinesis = record["kinesis"]
+        try:
+            data = base64.b64decode(kinesis["data"], validate=True)
+            decoded += decode_kinesis_data(data)
+        except (binascii.Error, OSError, EOFError, ValueError, IndexError) as reason:
+            logger.warning(
+                "Couldn't decode kinesis record %s: %r",
+                kinesis.get("sequenceNumber"),
+                reason,
+            )
+            failed_sequence_numbers.append(kinesis.get("sequenceNumber"))
+    return decoded, failed_sequence_numbers
+
+
+def kinesis_batch_item_failures(sequence_numbers: List[str]) -> dict:
+    """
+    Builds the partial batch response Lambda expects from kinesis-triggered
+    functions. Lambda retries the batch from the lowest failed sequence number on
+    """
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": sequence_number} for sequence_number in sequence_numbers
+        ]
+    }
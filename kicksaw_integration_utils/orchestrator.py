@@ -1,18 +1,49 @@
+import functools
+import itertools
 import os
+import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import gettempdir
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
 
-from kicksaw_integration_utils.csv_helpers import create_error_report
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.change_detection import ChangeDetector
+from kicksaw_integration_utils.checkpoints import Checkpoint, CheckpointStore
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter
+from kicksaw_integration_utils.csv_helpers import create_error_report, iter_csv_rows
+from kicksaw_integration_utils.idempotency import (
+    Claim,
+    IdempotencyStore,
+    InProgressError,
+    get_s3_idempotency_key,
+)
 from kicksaw_integration_utils.s3_helpers import (
     download_file,
+    get_s3_client,
     upload_file,
     timestamp_s3_key,
     move_file,
 )
-from kicksaw_integration_utils.salesforce_client import SfClient
-from kicksaw_integration_utils.sfdc_helpers import parse_bulk_upsert_results
-from kicksaw_integration_utils.utils import get_iso
+from kicksaw_integration_utils.parquet_helpers import ParquetErrorReportWriter
+from kicksaw_integration_utils.sfdc_helpers import (
+    has_lock_errors,
+    parse_bulk_upsert_results,
+)
+from kicksaw_integration_utils.sharding import (
+    Shard,
+    ShardResult,
+    download_shard,
+    get_shard_file_name,
+)
+from kicksaw_integration_utils.utils import batch_collection, get_iso
+
+if TYPE_CHECKING:
+    # the Orchestrator only calls the client it's given, so it doesn't need
+    # simple_salesforce loaded
+    from kicksaw_integration_utils.salesforce_client import SfClient
 
 
 class Orchestrator:
@@ -35,50 +66,133 @@ class Orchestrator:
     8. a custom SFDC object is created, logging all of the above
 
     If you don't need/need to change something, subclass it!
+
+    Alternatively, implement serialize and call run, which pipelines steps 3 through
+    8: chunks of the file are serialized, pushed in parallel and logged as the
+    pushes complete, then the reporting steps run in parallel
+
+    Given a checkpoint_store, run saves its progress after every chunk, and an
+    Orchestrator created later for the same file (e.g., after a Lambda timeout)
+    resumes from there, adding to the same error report. A checkpointed report is
+    written and uploaded in parts, merged once when it's uploaded at the end
+
+    Large files can be split with sharding.plan_shards and processed by one
+    Orchestrator per shard (see from_shard), locally or through SQS. Each shard
+    uploads its own error report, then a single Orchestrator created with
+    download=False merges them with merge_shards and reports once
+
+    Given an idempotency_store, an Orchestrator for a file (or shard) that was
+    already processed doesn't download it and is marked skipped; run does
+    nothing then. One for a file that's still being processed raises
+    InProgressError, so the event is retried. The file is marked processed by
+    report (or finish_shard), and released if run fails, so a retry goes
+    through. Pass the
+    store here or to respond_to_s3_event, not both, since they'd use the same keys
+
+    Given a change_detector, run only pushes the records that are new or changed
+    since they were last pushed successfully. log_batch records the records that
+    went through, and report (or finish_shard) saves the detector's store
+
+    Given report_format="parquet", the error report is written as Parquet (see
+    parquet_helpers.ParquetErrorReportWriter) rather than csv: typed, compressed
+    and queryable with Athena as is. Requires pyarrow
     """
 
     def __init__(
         self,
         s3_object_key,
         bucket_name,
-        sf_client: SfClient = None,
+        sf_client: "SfClient" = None,
         archive_folder: str = None,
         error_report_file_name: str = None,
         error_folder: str = None,
         execution_object_name: str = None,
+        checkpoint_store: CheckpointStore = None,
+        shard: Shard = None,
+        download: bool = True,
+        idempotency_store: IdempotencyStore = None,
+        change_detector: ChangeDetector = None,
+        report_format: str = "csv",
     ) -> None:
+        assert report_format in ("csv", "parquet"), f"unknown format {report_format}"
         self.s3_object_key = s3_object_key
         self.bucket_name = bucket_name
+        self.shard = shard
 
-        self.archive_folder = archive_folder
-        self.error_folder = error_folder if error_folder else "errors"
+        self.idempotency_store = idempotency_store
+        self.idempotency_key = None
+        self.skipped = False
+        if self.idempotency_store:
+            self.idempotency_key = self.get_idempotency_key()
+            claim = self.idempotency_store.claim(self.idempotency_key)
+            if claim == Claim.IN_PROGRESS:
+                # retried later, in case whoever is processing it fails
+                raise InProgressError(self.idempotency_key)
+            self.skipped = claim == Claim.COMPLETED
 
-        self.execution_object_name = execution_object_name
+        # nothing below may keep the key claimed if it fails, or every retry of
+        # the file would be skipped until the lease runs out
+        try:
+            self.archive_folder = archive_folder
+            self.error_folder = error_folder if error_folder else "errors"
 
-        self.download_s3_file()
-        self.sf_client = sf_client
-        self.timestamp = None
-        self.set_timestamp()
-        self.set_error_report_name(error_report_file_name)
-        self.error_count: int = 0
+            self.execution_object_name = execution_object_name
+
+            self.downloaded_file = None
+            if download and not self.skipped:
+                instrumentation.timed("orchestrator.download", self.download_s3_file)
+            self.sf_client = sf_client
+            self.timestamp = None
+            self.set_timestamp()
+            self.report_format = report_format
+            self.report_writer: Optional[ParquetErrorReportWriter] = None
+            self.set_error_report_name(error_report_file_name)
+            self.error_count: int = 0
+
+            self.change_detector = change_detector
+
+            self.checkpoint_store = checkpoint_store
+            self.rows_read: int = 0
+            self.batches_pushed: int = 0
+            self.checkpointed_error_count: int = 0
+            self.report_parts: int = 0
+            if self.checkpoint_store and not self.skipped:
+                self.resume()
+        except Exception:
+            self.release()
+            raise
 
     def set_error_report_name(self, error_report_file_name=None):
         if error_report_file_name:
             self.error_report_file_name = error_report_file_name
         else:
             self.error_report_file_name: str = (
-                f"error-report-{self.get_timestamp()}.csv"
+                f"error-report-{self.get_timestamp()}.{self.report_format}"
             )
+            if self.shard:
+                self.error_report_file_name = get_shard_file_name(
+                    self.error_report_file_name, self.shard.index
+                )
         self.error_report_path = (
             Path(os.getenv("TEMP", gettempdir()))
             / self.error_folder
             / self.error_report_file_name
         )
 
+    @classmethod
+    def from_shard(cls, shard: Shard, **kwargs):
+        """
+        Creates an Orchestrator that only downloads and processes one shard
+        """
+        return cls(shard.s3_object_key, shard.bucket_name, shard=shard, **kwargs)
+
     def download_s3_file(self):
-        self.downloaded_file = download_file(self.s3_object_key, self.bucket_name)
+        if self.shard:
+            self.downloaded_file = download_shard(self.shard)
+        else:
+            self.downloaded_file = download_file(self.s3_object_key, self.bucket_name)
 
-    def set_sf_client(self, sf_client: SfClient):
+    def set_sf_client(self, sf_client: "SfClient"):
         self.sf_client = sf_client
 
     def log_batch(
@@ -93,30 +207,420 @@ class Orchestrator:
             salesforce_object: The name of the object you upserted to
             upsert_key: The upsert key you used
         """
-        batch = (results, list(data), salesforce_object, upsert_key)
-        _, errors = self.parse_sfdc_results(*batch)
-        error_count = self.create_error_report_file(errors)
+        with instrumentation.span("orchestrator.log_batch", object=salesforce_object):
+            batch = (results, list(data), salesforce_object, upsert_key)
+            successes, errors = self.parse_sfdc_results(*batch)
+            error_count = self.create_error_report_file(errors)
+            if self.change_detector and successes:
+                self.change_detector.record(*batch)
         self.error_count += error_count
+        self.batches_pushed += 1
+        instrumentation.count("orchestrator.records_pushed", len(batch[1]))
+        instrumentation.count("orchestrator.record_errors", error_count)
+
+    def resume(self):
+        """
+        Picks up where a previous Orchestrator left off, if it saved a checkpoint
+        """
+        checkpoint = self.checkpoint_store.load(self.checkpoint_key)
+        if checkpoint is None:
+            return
+        self.set_timestamp(checkpoint.timestamp)
+        self.set_error_report_name(checkpoint.error_report_file_name)
+        self.rows_read = checkpoint.rows_read
+        self.batches_pushed = checkpoint.batches_pushed
+        self.error_count = checkpoint.error_count
+        self.checkpointed_error_count = checkpoint.error_count
+        self.report_parts = checkpoint.report_parts
+        for index in range(self.report_parts):
+            # lands on the part's path, since it mirrors the part's s3 key
+            download_file(self.get_report_part_s3_key(index), self.bucket_name)
+        # a local report left by this process (e.g., a warm Lambda container)
+        # may hold errors of batches after the checkpoint, which are pushed again
+        for path in (
+            self.get_report_part_path(self.report_parts),
+            self.error_report_path,
+        ):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def save_checkpoint(self, rows_read: int):
+        """
+        Records that the first rows_read rows of the file are pushed and logged
+
+        The part of the error report written since the last checkpoint is
+        uploaded along with it when it has new errors, since the local copy won't
+        survive a new Lambda invocation. Only that part is, so each error is
+        uploaded once however many checkpoints follow, and the parts are merged
+        by upload_error_report
+        """
+        assert self.checkpoint_store, "checkpoint_store isn't set"
+        self.rows_read = rows_read
+        if self.error_count > self.checkpointed_error_count:
+            self.upload_report_part()
+            self.checkpointed_error_count = self.error_count
+        checkpoint = Checkpoint(
+            s3_object_key=self.checkpoint_key,
+            rows_read=self.rows_read,
+            batches_pushed=self.batches_pushed,
+            error_count=self.error_count,
+            timestamp=self.get_timestamp(),
+            error_report_file_name=self.error_report_file_name,
+            report_parts=self.report_parts,
+        )
+        self.checkpoint_store.save(checkpoint)
 
     def automagically_finish_up(self):
         self.report()
 
+    def read_chunks(self, chunk_size: int, skip_rows: int = 0) -> Iterator[List[dict]]:
+        """
+        Reads the downloaded file in chunks of rows, starting after skip_rows rows.
+        Expects a csv, so override this for anything else
+        """
+        rows = itertools.islice(iter_csv_rows(self.downloaded_file), skip_rows, None)
+        yield from batch_collection(rows, chunk_size)
+
+    def serialize(self, rows: List[dict]) -> Iterable[Tuple[list, str, str]]:
+        """
+        Turns a chunk of rows into the batches to push to Salesforce, each batch
+        being a tuple of (data, salesforce_object, upsert_key)
+
+        Must be implemented to use run
+        """
+        raise NotImplementedError
+
+    def push(self, data: list, salesforce_object: str, upsert_key: str) -> list:
+        """
+        Pushes a batch to Salesforce, returning the results. Upserts through the
+        bulk API by default
+        """
+        assert self.sf_client, "sf_client isn't set"
+        return getattr(self.sf_client.bulk, salesforce_object).upsert(data, upsert_key)
+
+    def run(
+        self,
+        chunk_size: int = 10000,
+        max_workers: int = 4,
+        max_pending: int = None,
+        finish_up: bool = True,
+        limiter: AdaptiveLimiter = None,
+    ) -> Optional[ShardResult]:
+        """
+        Pipelined version of serializing, pushing and calling log_batch by hand
+
+            read_chunks -> serialize -> push (max_workers at a time) -> log_batch
+
+        The batches are logged in the order they were serialized, one at a time,
+        while later batches are still being pushed. Serializing blocks once
+        max_pending batches (2 * max_workers by default) are pushed or waiting to
+        be, so the whole file is never held in memory
+
+        With a checkpoint_store, a checkpoint is saved once every batch of a chunk
+        is logged, and rows already covered by a checkpoint are skipped. Once a
+        batch fails nothing after it is logged, so a resumed run re-pushes
+        (at most) the batches that were in flight
+
+        Parameters:
+            chunk_size: The number of rows handed to serialize at a time
+            max_workers: The number of batches pushed in parallel
+            max_pending: The number of batches allowed in flight
+            finish_up: Calls report in parallel mode once everything's logged,
+                or finish_shard (returning its result) for a shard
+            limiter: Adapts the number of batches pushed in parallel (up to
+                max_workers) to how Salesforce copes, backing off on throttling
+                and UNABLE_TO_LOCK_ROW errors
+        """
+        if self.skipped:
+            return None
+        try:
+            with instrumentation.span(
+                "orchestrator.run", s3_object_key=self.s3_object_key
+            ):
+                return self._run(
+                    chunk_size, max_workers, max_pending, finish_up, limiter
+                )
+        except Exception:
+            self.release()
+            raise
+
+    def _run(
+        self,
+        chunk_size: int,
+        max_workers: int,
+        max_pending: int,
+        finish_up: bool,
+        limiter: Optional[AdaptiveLimiter],
+    ) -> Optional[ShardResult]:
+        push = functools.partial(instrumentation.timed, "orchestrator.push", self.push)
+        if limiter:
+            # a bulk push's latency is mostly polling, so only lock errors and
+            # throttling back off
+            push = functools.partial(
+                limiter.call, push, throttled=has_lock_errors, timed=False
+            )
+        slots = threading.BoundedSemaphore(max_pending or max_workers * 2)
+        failed = threading.Event()
+        logged = deque()
+        rows_read = self.rows_read
+        with ThreadPoolExecutor(max_workers=max_workers) as push_pool:
+            with ThreadPoolExecutor(max_workers=1) as log_pool:
+                for chunk in self.read_chunks(chunk_size, skip_rows=rows_read):
+                    for batch in self.serialize(chunk):
+                        if self.change_detector:
+                            batch = (self.change_detector.changed(*batch), *batch[1:])
+                            if not batch[0]:
+                                continue
+                        slots.acquire()
+                        pushed = push_pool.submit(push, *batch)
+                        logged.append(
+                            log_pool.submit(
+                                self._log_pushed_batch, pushed, batch, slots, failed
+                            )
+                        )
+                        # raise errors as soon as possible
+                        while logged and logged[0].done():
+                            logged.popleft().result()
+                    rows_read += len(chunk)
+                    if self.checkpoint_store:
+                        logged.append(
+                            log_pool.submit(self._checkpoint_chunk, rows_read, failed)
+                        )
+                while logged:
+                    logged.popleft().result()
+
+        if finish_up and self.shard:
+            return self.finish_shard()
+        if finish_up:
+            self.report(parallel=True)
+
+    def _log_pushed_batch(
+        self,
+        pushed,
+        batch: tuple,
+        slots: threading.Semaphore,
+        failed: threading.Event,
+    ):
+        try:
+            if not failed.is_set():
+                self.log_batch(pushed.result(), *batch)
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    def _checkpoint_chunk(self, rows_read: int, failed: threading.Event):
+        try:
+            if not failed.is_set():
+                instrumentation.timed(
+                    "orchestrator.checkpoint", self.save_checkpoint, rows_read
+                )
+        except Exception:
+            failed.set()
+            raise
+
     def parse_sfdc_results(self, *args):
         return parse_bulk_upsert_results(*args)
 
     def create_error_report_file(self, errors):
-        return create_error_report(errors, self.error_report_path)
+        if self.report_format == "parquet":
+            return self.get_report_writer().write(errors)
+        return create_error_report(errors, self.get_report_path())
 
-    def report(self):
-        self.archive_file()
-        self.upload_error_report()
-        self.create_execution_object()
+    def get_report_writer(self) -> ParquetErrorReportWriter:
+        if self.report_writer is None:
+            self.report_writer = ParquetErrorReportWriter(self.get_report_path())
+        return self.report_writer
+
+    def get_report_path(self) -> Path:
+        """
+        Where errors are written: the current part of the error report if it's
+        checkpointed, or the report itself
+        """
+        if self.checkpoint_store:
+            return self.get_report_part_path(self.report_parts)
+        return self.error_report_path
+
+    def get_report_part_path(self, index: int) -> Path:
+        name = Path(self.error_report_file_name)
+        return self.error_report_path.with_name(
+            f"{name.stem}.part-{index:04d}{name.suffix}"
+        )
+
+    def get_report_part_s3_key(self, index: int) -> str:
+        name = self.get_report_part_path(index).name
+        return (Path(self.error_folder) / name).as_posix()
+
+    def upload_report_part(self):
+        """
+        Finishes and uploads the part of the error report written since the last
+        checkpoint
+        """
+        if self.report_writer is not None:
+            self.report_writer.close()
+            self.report_writer = None
+        upload_file(
+            self.get_report_part_path(self.report_parts),
+            self.bucket_name,
+            self.get_report_part_s3_key(self.report_parts),
+        )
+        self.report_parts += 1
+
+    def close_error_report(self):
+        """
+        Finishes the error report, if any, so it can be uploaded, merging its
+        parts if it was checkpointed
+        """
+        if self.report_writer is not None:
+            self.report_writer.close()
+            self.report_writer = None
+        if not self.checkpoint_store:
+            return
+        parts = [self.get_report_part_path(i) for i in range(self.report_parts + 1)]
+        parts = [part for part in parts if os.path.isfile(part)]
+        if not parts:
+            return
+        if os.path.isfile(self.error_report_path):
+            os.remove(self.error_report_path)
+        if self.report_format == "parquet":
+            with ParquetErrorReportWriter(self.error_report_path) as writer:
+                for part in parts:
+                    writer.append_file(part)
+        else:
+            with open(self.error_report_path, mode="w", newline="") as error_report:
+                for index, part in enumerate(parts):
+                    with open(part, newline="") as part_report:
+                        header = part_report.readline()
+                        if index == 0:
+                            error_report.write(header)
+                        for line in part_report:
+                            error_report.write(line)
+        for part in parts:
+            os.remove(part)
+
+    def report(self, parallel: bool = False):
+        steps = [
+            ("orchestrator.archive_file", self.archive_file),
+            ("orchestrator.upload_error_report", self.upload_error_report),
+            ("orchestrator.create_execution_object", self.create_execution_object),
+        ]
+        if not parallel:
+            for name, step in steps:
+                instrumentation.timed(name, step)
+        else:
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                futures = [
+                    pool.submit(instrumentation.timed, name, step)
+                    for name, step in steps
+                ]
+            for future in futures:
+                future.result()
+
+        self.save_changes()
+        if self.checkpoint_store:
+            self.checkpoint_store.clear(self.checkpoint_key)
+        self.complete()
+
+    def finish_shard(self) -> ShardResult:
+        """
+        The shard's counterpart to report: uploads the shard's error report, if
+        any, and returns what merge_shards needs
+        """
+        assert self.shard, "shard isn't set"
+        error_report_s3_key = None
+        if self.error_count:
+            error_report_s3_key = self.upload_error_report()
+        self.save_changes()
+        if self.checkpoint_store:
+            self.checkpoint_store.clear(self.checkpoint_key)
+        self.complete()
+        return ShardResult(
+            index=self.shard.index,
+            error_count=self.error_count,
+            error_report_s3_key=error_report_s3_key,
+        )
+
+    def save_changes(self):
+        """
+        Saves the change_detector's store, if any
+        """
+        if self.change_detector:
+            instrumentation.timed(
+                "orchestrator.save_changes", self.change_detector.save
+            )
+
+    def get_idempotency_key(self) -> str:
+        """
+        Identifies this version of the file (and the shard, if any), by its ETag
+        """
+        head = get_s3_client().head_object(
+            Bucket=self.bucket_name, Key=self.s3_object_key
+        )
+        key = get_s3_idempotency_key(
+            self.bucket_name,
+            self.s3_object_key,
+            etag=head.get("ETag"),
+            version_id=head.get("VersionId"),
+        )
+        if self.shard:
+            key += f"#shard-{self.shard.index:04d}"
+        return key
+
+    def complete(self):
+        """
+        Marks the file as processed in the idempotency_store, if any
+        """
+        if self.idempotency_store and not self.skipped:
+            self.idempotency_store.complete(self.idempotency_key)
+
+    def release(self):
+        """
+        Lets the next Orchestrator for the file process it, e.g., after a failure
+        """
+        if self.idempotency_store and not self.skipped:
+            self.idempotency_store.release(self.idempotency_key)
+
+    def merge_shards(self, results: List[ShardResult]):
+        """
+        Combines the error reports and counts of every shard into this
+        Orchestrator's, ready for report
+        """
+        if self.report_format == "parquet":
+            writer = self.get_report_writer()
+            for result in sorted(results, key=lambda result: result.index):
+                self.error_count += result.error_count
+                if result.error_report_s3_key:
+                    writer.append_file(
+                        download_file(result.error_report_s3_key, self.bucket_name)
+                    )
+            return
+
+        report_path = self.get_report_path()
+        Path(report_path.parent).mkdir(parents=True, exist_ok=True)
+        write_header = not os.path.isfile(report_path)
+        with open(report_path, mode="a", newline="") as error_report:
+            for result in sorted(results, key=lambda result: result.index):
+                self.error_count += result.error_count
+                if not result.error_report_s3_key:
+                    continue
+                shard_report_path = download_file(
+                    result.error_report_s3_key, self.bucket_name
+                )
+                with open(shard_report_path, newline="") as shard_report:
+                    header = shard_report.readline()
+                    if write_header:
+                        error_report.write(header)
+                        write_header = False
+                    for line in shard_report:
+                        error_report.write(line)
 
     def archive_file(self):
         move_file(self.s3_object_key, self.archive_file_s3_key, self.bucket_name)
 
     def upload_error_report(self):
-        assert self.error_report_path, f"error_report_path is not set"
+        assert self.error_report_path, "error_report_path is not set"
+        self.close_error_report()
         return upload_file(
             self.error_report_path, self.bucket_name, self.error_file_s3_key
         )
@@ -134,13 +638,23 @@ class Orchestrator:
         archive_s3_key = timestamp_s3_key(s3_object_key, timestamp=self.get_timestamp())
         return (Path(archive_folder) / archive_s3_key).as_posix()
 
+    @property
+    def checkpoint_key(self) -> str:
+        if self.shard:
+            return f"{self.s3_object_key}#shard-{self.shard.index:04d}"
+        return self.s3_object_key
+
     @property
     def error_file_s3_key(self):
         return (Path(self.error_folder) / self.error_report_file_name).as_posix()
 
     def create_execution_object(self):
-        assert self.sf_client, f"sf_client isn't set"
-        assert self.execution_object_name, f"execution_object_name isn't set"
+        """
+        Records this execution in Salesforce, which takes a single REST call and
+        raises SalesforceError if it fails, so it doesn't go through SfClient.push
+        """
+        assert self.sf_client, "sf_client isn't set"
+        assert self.execution_object_name, "execution_object_name isn't set"
         return getattr(self.sf_client, self.execution_object_name).create(
             self.execution_sfdc_hash
         )
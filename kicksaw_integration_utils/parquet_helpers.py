@@ -0,0 +1,192 @@
+import json
+import os
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Union
+
+from kicksaw_integration_utils import instrumentation
+
+ERROR_REPORT_COLUMNS = (
+    "salesforce_object",
+    "code",
+    "message",
+    "upsert_key",
+    "upsert_key_value",
+    "object_json",
+)
+# the same few values repeat on nearly every row
+_DICTIONARY_COLUMNS = ("salesforce_object", "code", "upsert_key")
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    """
+    pyarrow, or None if it isn't installed. It's large and slow to import, so
+    it's only imported once a report is written
+    """
+    # pylint: disable=import-outside-toplevel
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def error_report_schema():
+    """
+    The schema of Parquet error reports: every column is a nullable string, and
+    salesforce_object, code and upsert_key are dictionary encoded, so they're
+    read back as categoricals
+
+    object_json holds the record as json (see Athena's json_extract) rather than
+    a struct, since a report can hold records of several objects, which don't
+    share their fields
+    """
+    pa = _pyarrow()
+    assert pa is not None, "pyarrow isn't installed"
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            pa.field(
+                column, dictionary if column in _DICTIONARY_COLUMNS else pa.string()
+            )
+            for column in ERROR_REPORT_COLUMNS
+        ],
+        metadata={"object_json": "json"},
+    )
+
+
+def _to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def _to_json(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+class ParquetErrorReportWriter:
+    """
+    Writes the errors from parse_bulk_upsert_results to a Parquet file, the
+    typed and compressed counterpart of create_error_report's csv
+
+    Errors are buffered and written out a row group at a time, as soon as
+    row_group_size of them are in, so memory stays flat however many there are.
+    The file is only valid once close is called
+
+    Parquet files can't be appended to. Writing to a report that already exists,
+    e.g., after resuming from a checkpoint, copies its row groups into the new
+    one first. Requires pyarrow
+    """
+
+    def __init__(
+        self,
+        report_path: Union[Path, str],
+        row_group_size: int = 10000,
+        compression: str = "zstd",
+    ) -> None:
+        assert row_group_size > 0, "row_group_size must be positive"
+        self.pa = _pyarrow()
+        assert self.pa is not None, "pyarrow isn't installed"
+        self.report_path = Path(report_path)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = error_report_schema()
+        self.columns = {column: list() for column in ERROR_REPORT_COLUMNS}
+        self.buffered = 0
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        previous = None
+        if os.path.isfile(self.report_path):
+            previous = self.report_path.with_name(self.report_path.name + ".previous")
+            os.replace(self.report_path, previous)
+        self.writer = self.pa.parquet.ParquetWriter(
+            str(self.report_path), self.schema, compression=self.compression
+        )
+        if previous:
+            self._copy(previous)
+            os.remove(previous)
+
+    def _copy(self, path: Path):
+        source = self.pa.parquet.ParquetFile(str(path))
+        for index in range(source.num_row_groups):
+            self.writer.write_table(source.read_row_group(index).cast(self.schema))
+
+    def append_file(self, path: Union[Path, str]):
+        """
+        Copies the rows of another Parquet error report, a row group at a time,
+        e.g., to merge the reports of shards
+        """
+        self.flush()
+        if self.writer is None:
+            self._open()
+        self._copy(Path(path))
+
+    def write(self, errors: Iterable[dict]) -> int:
+        """
+        Buffers errors, writing out every row group that fills up. Returns the
+        number of errors
+        """
+        errors_count = 0
+        for error in errors:
+            errors_count += 1
+            for column, values in self.columns.items():
+                convert = _to_json if column == "object_json" else _to_string
+                values.append(convert(error[column]))
+            self.buffered += 1
+            if self.buffered >= self.row_group_size:
+                self.flush()
+        instrumentation.count("parquet.error_rows_written", errors_count)
+        return errors_count
+
+    def flush(self):
+        """
+        Writes out the errors buffered so far as a row group
+        """
+        if not self.buffered:
+            return
+        if self.writer is None:
+            self._open()
+        with instrumentation.span("parquet.write_row_group", rows=self.buffered):
+            table = self.pa.Table.from_pydict(self.columns, schema=self.schema)
+            self.writer.write_table(table)
+        self.columns = {column: list() for column in ERROR_REPORT_COLUMNS}
+        self.buffered = 0
+
+    def close(self):
+        """
+        Flushes what's left and finishes the file, which is written even when
+        there were no errors
+        """
+        self.flush()
+        if self.writer is None:
+            self._open()
+        self.writer.close()
+        self.writer = None
+
+
+def create_parquet_error_report(
+    errors: list,
+    report_path: Path,
+    row_group_size: int = 10000,
+    compression: str = "zstd",
+) -> int:
+    """
+    Takes in the errors from the output of parse_bulk_upsert_results and writes a
+    Parquet report, adding to the report if it exists. See ParquetErrorReportWriter
+    """
+    with ParquetErrorReportWriter(report_path, row_group_size, compression) as writer:
+        return writer.write(errors)
@@ -1,16 +1,40 @@
 import base64
-import boto3
 import datetime
 import json
+import logging
 import os
+import threading
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from tempfile import gettempdir
-from typing import Union
+from typing import Any, Iterator, List, Optional, Tuple, Union
 from urllib.parse import unquote_plus
 
+from pydantic import BaseModel
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.idempotency import (
+    Claim,
+    IdempotencyStore,
+    InProgressError,
+    get_s3_idempotency_key,
+)
 from kicksaw_integration_utils.utils import get_iso
 
+logger = logging.getLogger(__name__)
+
+# boto3's default session isn't thread-safe when creating clients
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    # boto3 takes a while to import; only pay for it once s3 is used
+    import boto3
+
+    with _client_lock:
+        return boto3.client("s3")
+
 
 def upload_file(
     local_path: Path,
@@ -37,13 +61,19 @@ def upload_file(
     local_path = str(local_path)
     s3_key = str(s3_key)
 
-    s3_client = boto3.client("s3")
-    if public_read:
-        s3_client.upload_file(
-            local_path, bucket, s3_key, ExtraArgs={"ACL": "public-read"}
+    s3_client = get_s3_client()
+    with instrumentation.span("s3.upload_file", bucket=bucket, key=s3_key):
+        if public_read:
+            s3_client.upload_file(
+                local_path, bucket, s3_key, ExtraArgs={"ACL": "public-read"}
+            )
+        else:
+            s3_client.upload_file(local_path, bucket, s3_key)
+    if instrumentation.is_enabled():
+        instrumentation.count("s3.api_calls", operation="upload_file")
+        instrumentation.count(
+            "s3.bytes_uploaded", os.path.getsize(local_path), unit="Bytes"
         )
-    else:
-        s3_client.upload_file(local_path, bucket, s3_key)
 
     return s3_key
 
@@ -54,17 +84,20 @@ def move_file(
     """
     Move a file within an S3 bucket by copying to a different path and delete the original
     """
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
     copy_source = {"Bucket": bucket, "Key": old_key}
     destination_bucket = new_bucket if new_bucket else bucket
-    s3_client.copy(copy_source, destination_bucket, new_key)
-    if delete:
-        delete_file(old_key, bucket)
+    with instrumentation.span("s3.move_file", bucket=bucket, key=old_key):
+        s3_client.copy(copy_source, destination_bucket, new_key)
+        instrumentation.count("s3.api_calls", operation="copy")
+        if delete:
+            delete_file(old_key, bucket)
 
 
 def delete_file(s3_key: str, bucket: str):
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
     s3_client.delete_object(Bucket=bucket, Key=s3_key)
+    instrumentation.count("s3.api_calls", operation="delete_object")
 
 
 def download_file(
@@ -82,12 +115,20 @@ def download_file(
     if not download_path:
         download_path = Path(os.getenv("TEMP", gettempdir()))
 
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
     download_folder = download_path / os.path.dirname(s3_object_key)
     download_path = download_path / s3_object_key
     # spawn the nested folders without the os complaining
     Path(download_folder).mkdir(parents=True, exist_ok=True)
-    s3_client.download_file(bucket_name, s3_object_key, str(download_path))
+    with instrumentation.span(
+        "s3.download_file", bucket=bucket_name, key=s3_object_key
+    ):
+        s3_client.download_file(bucket_name, s3_object_key, str(download_path))
+    if instrumentation.is_enabled():
+        instrumentation.count("s3.api_calls", operation="download_file")
+        instrumentation.count(
+            "s3.bytes_downloaded", os.path.getsize(download_path), unit="Bytes"
+        )
 
     return download_path
 
@@ -125,7 +166,23 @@ def parse_s3_event_record(record: dict):
     return bucket_name, s3_object_key
 
 
-def respond_to_s3_event(event, callback, *args, **kwargs):
+def get_s3_record_idempotency_key(record: dict) -> str:
+    """
+    The idempotency key of the object version an s3 event record is about
+    """
+    bucket_name, s3_object_key = parse_s3_event_record(record)
+    s3_object = record["s3"]["object"]
+    return get_s3_idempotency_key(
+        bucket_name,
+        s3_object_key,
+        etag=s3_object.get("eTag"),
+        version_id=s3_object.get("versionId"),
+    )
+
+
+def respond_to_s3_event(
+    event, callback, *args, idempotency_store: IdempotencyStore = None, **kwargs
+):
     """
     Use like this:
         def process_s3_event(s3_object_key, bucket_name):
@@ -133,11 +190,216 @@ def respond_to_s3_event(event, callback, *args, **kwargs):
 
         def handler(event, context):
             respond_to_s3_event(event, process_s3_event)
+
+    With an idempotency_store, records for an object version that was already
+    processed are skipped, e.g., when s3 delivers an event twice. A record whose
+    callback raises is released, so a retry goes through. Records that are still
+    being processed elsewhere raise InProgressError once the others are done, so
+    the event is retried rather than dropped
     """
     records = event["Records"]
+    in_progress = list()
     for record in records:
         bucket_name, s3_object_key = parse_s3_event_record(record)
-        callback(s3_object_key, bucket_name, *args, **kwargs)
+        if not idempotency_store:
+            callback(s3_object_key, bucket_name, *args, **kwargs)
+            continue
+
+        key = get_s3_record_idempotency_key(record)
+        claim = idempotency_store.claim(key)
+        if claim == Claim.IN_PROGRESS:
+            logger.info("Event for %s is still being processed elsewhere", key)
+            in_progress.append(key)
+            continue
+        if claim == Claim.COMPLETED:
+            logger.info("Skipping duplicate event for %s", key)
+            continue
+        try:
+            callback(s3_object_key, bucket_name, *args, **kwargs)
+        except Exception:
+            idempotency_store.release(key)
+            raise
+        idempotency_store.complete(key)
+    if in_progress:
+        raise InProgressError(", ".join(in_progress))
+
+
+class S3RecordResult(BaseModel):
+    """
+    The outcome of calling back on a single s3 event record
+
+    item_identifier is the SQS message id when the s3 event came through SQS,
+    and the s3 object key otherwise. skipped records were duplicates, or failed
+    because they're still being processed elsewhere, see
+    respond_to_s3_event's idempotency_store
+    """
+
+    item_identifier: str
+    bucket_name: str
+    s3_object_key: str
+    success: bool
+    skipped: bool = False
+    result: Any = None
+    error: Optional[str] = None
+
+
+def iter_s3_event_records(event) -> Iterator[Tuple[str, dict]]:
+    """
+    Yields (item_identifier, s3 record) for every s3 record in the event,
+    unwrapping s3 events that were delivered through SQS
+    """
+    for record in event["Records"]:
+        if "s3" in record:
+            yield record.get("messageId", record["s3"]["object"]["key"]), record
+        elif "body" in record:
+            # s3 -> SQS -> Lambda; s3:TestEvent messages have no Records
+            for s3_record in json.loads(record["body"]).get("Records", []):
+                yield record["messageId"], s3_record
+
+
+def _parse_s3_event(event) -> list:
+    """
+    (item_identifier, s3 record, bucket name, s3 key) for every s3 record in the
+    event, or a failed S3RecordResult for each record that can't be parsed
+    """
+    parsed = list()
+    for event_record in event["Records"]:
+        try:
+            # all or nothing, the SQS message is retried as a whole
+            records = [
+                (item_identifier, record, *parse_s3_event_record(record))
+                for item_identifier, record in iter_s3_event_records(
+                    {"Records": [event_record]}
+                )
+            ]
+        except (AttributeError, KeyError, TypeError, ValueError) as error:
+            item_identifier = event_record.get("messageId") or ""
+            logger.error("Failed to parse record %s: %r", item_identifier, error)
+            parsed.append(
+                S3RecordResult(
+                    item_identifier=item_identifier,
+                    bucket_name="",
+                    s3_object_key="",
+                    success=False,
+                    error=repr(error),
+                )
+            )
+            continue
+        parsed.extend(records)
+    return parsed
+
+
+def respond_to_s3_event_concurrently(
+    event,
+    callback,
+    *args,
+    max_workers: int = 8,
+    use_processes: bool = False,
+    idempotency_store: IdempotencyStore = None,
+    **kwargs,
+) -> List[S3RecordResult]:
+    """
+    Same as respond_to_s3_event, but calls back on up to max_workers records at
+    a time, on threads or (use_processes=True) processes. A record that fails
+    doesn't stop the others, and neither does one that can't be parsed; every
+    record gets a result, in the event's order
+
+    With processes, the callback and its return value must be picklable
+
+    idempotency_store works as in respond_to_s3_event; records are claimed here,
+    before anything is submitted. Duplicates come back as skipped successes, and
+    records still being processed elsewhere as failures, so they're retried
+
+    Use like this:
+        def handler(event, context):
+            results = respond_to_s3_event_concurrently(event, process_s3_event)
+            return get_batch_item_failures(results)
+    """
+    parsed = _parse_s3_event(event)
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_class(max_workers=max_workers) as pool:
+        # the results of records that weren't submitted, or what's needed to
+        # get the result of the ones that were
+        pending = list()
+        submitted = dict()
+        for entry in parsed:
+            if isinstance(entry, S3RecordResult):
+                pending.append(entry)
+                continue
+            item_identifier, record, bucket_name, s3_object_key = entry
+            key = None
+            if idempotency_store:
+                key = get_s3_record_idempotency_key(record)
+                if key in submitted:
+                    # the same object twice in one event shares the first's fate
+                    logger.info("Skipping duplicate event for %s", key)
+                    entry = (item_identifier, bucket_name, s3_object_key, None)
+                    pending.append(entry + (submitted[key], True))
+                    continue
+                claim = idempotency_store.claim(key)
+                if not claim:
+                    logger.info("Skipping %s event for %s", claim.value, key)
+                    in_progress = claim == Claim.IN_PROGRESS
+                    pending.append(
+                        S3RecordResult(
+                            item_identifier=item_identifier,
+                            bucket_name=bucket_name,
+                            s3_object_key=s3_object_key,
+                            success=not in_progress,
+                            skipped=True,
+                            error=repr(InProgressError(key)) if in_progress else None,
+                        )
+                    )
+                    continue
+            future = pool.submit(callback, s3_object_key, bucket_name, *args, **kwargs)
+            submitted[key] = future
+            pending.append(
+                (item_identifier, bucket_name, s3_object_key, key, future, False)
+            )
+
+    results = list()
+    for entry in pending:
+        if isinstance(entry, S3RecordResult):
+            results.append(entry)
+            continue
+
+        item_identifier, bucket_name, s3_object_key, key, future, skipped = entry
+        result = S3RecordResult(
+            item_identifier=item_identifier,
+            bucket_name=bucket_name,
+            s3_object_key=s3_object_key,
+            success=future.exception() is None,
+            skipped=skipped,
+        )
+        if key is not None:
+            if result.success:
+                idempotency_store.complete(key)
+            else:
+                idempotency_store.release(key)
+        if result.success:
+            result.result = future.result()
+        else:
+            result.error = repr(future.exception())
+            logger.error(
+                "Failed to process s3://%s/%s: %s",
+                bucket_name,
+                s3_object_key,
+                result.error,
+            )
+        results.append(result)
+    return results
+
+
+def get_batch_item_failures(results: List[S3RecordResult]) -> dict:
+    """
+    Builds the partial batch response Lambda expects from SQS-triggered functions,
+    so only the messages that failed are retried
+    """
+    failed = list()
+    for result in results:
+        if not result.success and result.item_identifier not in failed:
+            failed.append(result.item_identifier)
+    return {"batchItemFailures": [{"itemIdentifier": item} for item in failed]}
 
 
 def parse_kinesis_record(record: dict):
@@ -1,6 +1,17 @@
+import csv
+import functools
+import gzip
+import itertools
+import json
 import requests
 import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Hashable, Iterator
+
+from requests.adapters import HTTPAdapter
 from simple_salesforce import Salesforce
 from simple_salesforce.bulk import (
     SFBulkHandler as BaseSFBulkHandler,
@@ -8,52 +19,424 @@ from simple_salesforce.bulk import (
 )
 from simple_salesforce.exceptions import (
     SalesforceAuthenticationFailed,
+    SalesforceGeneralError,
     SalesforceMalformedRequest,
 )
+from simple_salesforce.util import call_salesforce
+from urllib3.util.retry import Retry
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.batching import (
+    batch_by_group,
+    batch_by_size,
+    iter_slices,
+    json_size,
+)
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter, is_throttling_error
+from kicksaw_integration_utils.governor import LIMIT_EXCEEDED, SalesforceGovernor
+from kicksaw_integration_utils.sfdc_helpers import (
+    UNABLE_TO_LOCK_ROW,
+    has_lock_errors,
+    is_lock_error,
+)
+
+# Bulk API (v1) limits per batch. The size limit is 10MB and 10,000,000 characters;
+# json.dumps escapes non-ascii characters, so those are the same thing
+BULK_BATCH_MAX_RECORDS = 10000
+BULK_BATCH_MAX_BYTES = 10_000_000
+
+
+class SalesforceHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that can gzip request bodies before they're sent
+
+    Salesforce accepts gzip-compressed request bodies on both the REST and
+    Bulk APIs, which noticeably shrinks the upload time of large batches.
+    Responses are already gzipped, as requests asks for them by default
+
+    With a governor, every request waits for its go-ahead, and requests that
+    Salesforce turned down for too many concurrent requests are retried
+    """
+
+    def __init__(
+        self,
+        *args,
+        compress_requests: bool = False,
+        compress_min_size=1024,
+        governor: SalesforceGovernor = None,
+        **kwargs,
+    ):
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.governor = governor
+        super().__init__(*args, **kwargs)
+
+    def gzip_body(self, request: requests.PreparedRequest):
+        body = request.body
+        if not body or "Content-Encoding" in request.headers:
+            return
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if not isinstance(body, bytes) or len(body) < self.compress_min_size:
+            return
+        request.body = gzip.compress(body)
+        request.headers["Content-Encoding"] = "gzip"
+        request.headers["Content-Length"] = str(len(request.body))
+
+    def send(self, request, *args, **kwargs):
+        if self.compress_requests:
+            self.gzip_body(request)
+        if self.governor is None:
+            return self._send(request, *args, **kwargs)
+
+        retries = 0
+        while True:
+            self.governor.acquire()
+            response = self._send(request, *args, **kwargs)
+            retry = self.governor.observe(response)
+            if not retry or retries >= self.governor.max_retries:
+                return response
+            response.close()
+            retries += 1
+            instrumentation.count("salesforce.retries", reason=LIMIT_EXCEEDED)
+
+    def _send(self, request, *args, **kwargs):
+        if not instrumentation.is_enabled():
+            return super().send(request, *args, **kwargs)
+
+        instrumentation.count("salesforce.api_calls")
+        if request.body:
+            instrumentation.count(
+                "salesforce.bytes_sent", len(request.body), unit="Bytes"
+            )
+        with instrumentation.span(
+            "salesforce.request", method=request.method, path=request.path_url
+        ) as request_span:
+            response = super().send(request, *args, **kwargs)
+            request_span.set_attribute("status", response.status_code)
+        return response
+
+
+def build_session(
+    pool_connections: int = 10,
+    pool_maxsize: int = 32,
+    max_retries: int = 3,
+    backoff_factor: float = 0.5,
+    compress_requests: bool = False,
+    governor: SalesforceGovernor = None,
+) -> requests.Session:
+    """
+    Builds a requests session to share between the REST and Bulk APIs
+
+    The session keeps connections alive, so parallel bulk and REST calls reuse
+    warm connections instead of going through a new TLS handshake every time.
+    pool_maxsize should be at least the number of threads talking to Salesforce,
+    otherwise connections get thrown away after every call.
+
+    Retries only cover connection errors and gateway errors on idempotent
+    requests; everything else is left to simple salesforce's error handling.
+    Pass a governor to throttle calls as the org's API limit gets close
+    """
+    retries = Retry(
+        total=max_retries,
+        status_forcelist=(502, 503, 504),
+        backoff_factor=backoff_factor,
+        raise_on_status=False,
+    )
+    adapter = SalesforceHTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retries,
+        compress_requests=compress_requests,
+        governor=governor,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class SFBulkType(BaseSFBulkType):
-    def __init__(self, object_name, bulk_url, headers, session):
+    def __init__(
+        self, object_name, bulk_url, headers, session, limiter: AdaptiveLimiter = None
+    ):
         # used for backoff logic on Connection interrupts
         self.attempts = 0
         self.max_attempts = 5
+        self.limiter = limiter
+        # how many times records that failed with UNABLE_TO_LOCK_ROW are pushed again
+        self.lock_retries = 2
         super().__init__(object_name, bulk_url, headers, session)
 
+    def upsert(
+        self,
+        data,
+        external_id_field,
+        batch_size=10000,
+        use_serial=False,
+        parent_key: Callable[[dict], Hashable] = None,
+    ):
+        """
+        upsert records based on a unique identifier
+
+        parent_key, when given, returns the parent of a record, e.g.,
+        lambda contact: contact["AccountId"]. Records with the same parent go in
+        the same batch, so batches processed in parallel don't fight over the
+        parent's lock. The results still come back in the order of data
+        """
+        return self._bulk_operation(
+            operation="upsert",
+            data=data,
+            use_serial=use_serial,
+            external_id_field=external_id_field,
+            batch_size=batch_size,
+            parent_key=parent_key,
+        )
+
     def _bulk_operation(
         self,
-        *args,
+        operation,
+        data,
+        use_serial=False,
+        external_id_field=None,
         batch_size=10000,
-        **kwargs,
+        wait=5,
+        parent_key=None,
     ):
-        try:
+        if operation in ("query", "queryAll"):
             return super()._bulk_operation(
-                *args,
+                operation,
+                data,
+                use_serial=use_serial,
+                external_id_field=external_id_field,
                 batch_size=batch_size,
-                **kwargs,
+                wait=wait,
             )
+
+        if batch_size == "auto":
+            batch_size = BULK_BATCH_MAX_RECORDS
+        if not isinstance(batch_size, int):
+            raise ValueError("batch size should be auto or an integer")
+        batch_size = min(batch_size, BULK_BATCH_MAX_RECORDS)
+
+        write = functools.partial(
+            self._write, operation, data, use_serial, external_id_field
+        )
+        try:
+            return write(batch_size, wait, parent_key)
         except SalesforceMalformedRequest as exception:
             if "Exceeded max size limit" in str(exception):
                 new_batch_size = batch_size - 1000
                 assert new_batch_size > 0, "Batch Size Too Low!"
+                instrumentation.count("salesforce.retries", reason="ExceededMaxSize")
                 print(
                     f"Payload too large. Retrying with a lower batch size. {batch_size} -> {new_batch_size}"
                 )
-                return super()._bulk_operation(
-                    *args,
-                    batch_size=new_batch_size,
-                    **kwargs,
-                )
+                return write(new_batch_size, wait, parent_key)
             raise exception
 
+    def _write(
+        self,
+        operation,
+        data,
+        use_serial,
+        external_id_field,
+        batch_size,
+        wait,
+        parent_key=None,
+    ) -> list:
+        """
+        _write_batches, then pushes the records that failed with
+        UNABLE_TO_LOCK_ROW again, up to lock_retries times. They clashed with
+        each other in parallel, so they're pushed in serial mode
+        """
+        results = self._write_batches(
+            operation, data, use_serial, external_id_field, batch_size, wait, parent_key
+        )
+        for _ in range(self.lock_retries):
+            locked = [i for i, result in enumerate(results) if is_lock_error(result)]
+            if not locked:
+                break
+            instrumentation.count(
+                "salesforce.retries", len(locked), reason=UNABLE_TO_LOCK_ROW
+            )
+            retried = self._write_batches(
+                operation,
+                [data[i] for i in locked],
+                True,
+                external_id_field,
+                batch_size,
+                wait,
+                parent_key,
+            )
+            for i, result in zip(locked, retried):
+                results[i] = result
+        return results
+
+    def _write_batches(
+        self,
+        operation,
+        data,
+        use_serial,
+        external_id_field,
+        batch_size,
+        wait,
+        parent_key=None,
+    ) -> list:
+        """
+        Runs a write operation as one job, in batches of at most batch_size records
+        that also stay under the Bulk API's size limit
+
+        simple_salesforce cuts batches by count alone, and its batch_size="auto"
+        (which is meant to account for size) fails on any data
+
+        With a limiter, a batch is only added once there's room for it, so the
+        number of batches Salesforce processes at once backs off when records
+        fail with UNABLE_TO_LOCK_ROW
+
+        With a parent_key, batches are planned with batch_by_group, and the
+        results are put back in the order of data. A parent with too many
+        children for one batch can't have them all in one, and the batches of a
+        parallel job run at the same time, so those children go in a second job,
+        in serial mode, once the first is done
+        """
+        if not data:
+            return list()
+
+        if parent_key is None:
+            batches = batch_by_size(data, BULK_BATCH_MAX_BYTES, max_count=batch_size)
+            return self._run_job(
+                operation, batches, use_serial, external_id_field, wait, len(data)
+            )
+
+        keys = [parent_key(record) for record in data]
+        sizes = [json_size(record) for record in data]
+        groups = dict()
+        for i, group_key in enumerate(keys):
+            groups.setdefault(group_key, list()).append(i)
+        spilled = list()
+        if not use_serial:
+            for group_key, group in groups.items():
+                if group_key is None:
+                    continue
+                group_size = sum(sizes[i] for i in group)
+                if len(group) > batch_size or group_size > BULK_BATCH_MAX_BYTES:
+                    spilled += group
+        spilled_set = set(spilled)
+
+        planned = batch_by_group(
+            (i for i in range(len(data)) if i not in spilled_set),
+            key=keys.__getitem__,
+            max_count=batch_size,
+            max_weight=BULK_BATCH_MAX_BYTES,
+            weight=sizes.__getitem__,
+        )
+        spilled_batches = list(
+            batch_by_size(
+                spilled,
+                BULK_BATCH_MAX_BYTES,
+                max_count=batch_size,
+                size=sizes.__getitem__,
+            )
+        )
+
+        results = list()
+        for batches, serial in ((planned, use_serial), (spilled_batches, True)):
+            if batches:
+                results += self._run_job(
+                    operation,
+                    ([data[i] for i in batch] for batch in batches),
+                    serial,
+                    external_id_field,
+                    wait,
+                    sum(map(len, batches)),
+                )
+
+        ordered = [None] * len(data)
+        for i, result in zip(
+            itertools.chain.from_iterable(planned + spilled_batches), results
+        ):
+            ordered[i] = result
+        return ordered
+
+    def _run_job(
+        self, operation, batches, use_serial, external_id_field, wait, record_count
+    ) -> list:
+        """
+        Adds batches to a new job, waits for them and closes the job. Returns the
+        results in the order of the batches
+        """
+        attributes = dict(object=self.object_name, operation=operation)
+        job_span = instrumentation.span("salesforce.bulk_job", **attributes)
+        with job_span, ThreadPoolExecutor() as pool:
+            job = self._create_job(
+                operation=operation,
+                use_serial=use_serial,
+                external_id_field=external_id_field,
+            )
+            worker = functools.partial(
+                self._wait_for_batch, operation=operation, wait=wait
+            )
+            waiting = list()
+            for batch in batches:
+                if self.limiter is None:
+                    added = self._add_batch(job["id"], batch, operation)
+                    waiting.append(pool.submit(worker, added))
+                    continue
+                started_at = self.limiter.acquire()
+                try:
+                    added = self._add_batch(job["id"], batch, operation)
+                except Exception as error:
+                    throttled = is_throttling_error(error)
+                    self.limiter.release(started_at, throttled=throttled, failed=True)
+                    raise
+                waiting.append(
+                    pool.submit(self._wait_for_limited_batch, worker, added, started_at)
+                )
+            instrumentation.count("salesforce.bulk_batches", len(waiting), **attributes)
+            instrumentation.count("salesforce.bulk_records", record_count, **attributes)
+            results = [
+                result
+                for batch_results in waiting
+                for page in batch_results.result()
+                for result in page
+            ]
+            self._close_job(job_id=job["id"])
+        return results
+
+    def _wait_for_limited_batch(self, worker, batch, started_at: float) -> list:
+        try:
+            # simple_salesforce yields pages lazily, and they're read twice
+            batch_results = list(worker(batch))
+        except Exception as error:
+            throttled = is_throttling_error(error)
+            self.limiter.release(started_at, throttled=throttled, failed=True)
+            raise
+        results = [result for page in batch_results for result in page]
+        # a batch's latency is mostly polling, and grows with its size, so only
+        # lock errors back off
+        self.limiter.release(
+            started_at, throttled=has_lock_errors(results), timed=False
+        )
+        return batch_results
+
+    def _wait_for_batch(self, batch, operation, wait) -> list:
+        with instrumentation.span(
+            "salesforce.bulk_batch", object=self.object_name, operation=operation
+        ):
+            return self.worker(batch, operation=operation, wait=wait)
+
     def _get_batch_results(self, job_id, batch_id, operation):
         try:
             batch_result = super()._get_batch_results(job_id, batch_id, operation)
         except requests.ConnectionError as reason:
             if self.attempts < self.max_attempts:
                 self.attempts += 1
+                instrumentation.count("salesforce.retries", reason="ConnectionError")
                 time.sleep(2 ** self.attempts)
                 return self._get_batch_results(job_id, batch_id, operation)
             raise reason
+        self.attempts = 0
         return batch_result
 
     def _add_batch(self, job_id, data, operation):
@@ -62,33 +445,326 @@ class SFBulkType(BaseSFBulkType):
         except requests.ConnectionError as reason:
             if self.attempts < self.max_attempts:
                 self.attempts += 1
+                instrumentation.count("salesforce.retries", reason="ConnectionError")
                 time.sleep(2 ** self.attempts)
                 return self._add_batch(job_id, data, operation)
             raise reason
+        self.attempts = 0
         return result
 
+    def _create_query_job(self, operation, pk_chunking=False, chunk_size=100000):
+        headers = dict(self.headers)
+        if pk_chunking:
+            headers["Sforce-Enable-PKChunking"] = f"chunkSize={chunk_size}"
+        payload = {
+            "operation": operation,
+            "object": self.object_name,
+            "contentType": "JSON",
+        }
+        result = call_salesforce(
+            url=f"{self.bulk_url}job",
+            method="POST",
+            session=self.session,
+            headers=headers,
+            data=json.dumps(payload),
+        )
+        return result.json()
+
+    def _get_batches(self, job_id) -> list:
+        result = call_salesforce(
+            url=f"{self.bulk_url}job/{job_id}/batch",
+            method="GET",
+            session=self.session,
+            headers=self.headers,
+        )
+        return result.json()["batchInfo"]
+
+    def _get_result_ids(self, job_id, batch_id) -> list:
+        result = call_salesforce(
+            url=f"{self.bulk_url}job/{job_id}/batch/{batch_id}/result",
+            method="GET",
+            session=self.session,
+            headers=self.headers,
+        )
+        return result.json()
+
+    def _get_result_page(self, job_id, batch_id, result_id) -> list:
+        result = call_salesforce(
+            url=f"{self.bulk_url}job/{job_id}/batch/{batch_id}/result/{result_id}",
+            method="GET",
+            session=self.session,
+            headers=self.headers,
+        )
+        return result.json()
+
+    def _completed_query_batches(self, job_id, batch_id, pk_chunking, wait):
+        """
+        Yields the batches of a query job as they complete
+
+        With PK chunking, Salesforce splits the query into one batch per chunk
+        and marks the original batch NotProcessed once all of them are created
+        """
+        yielded = set()
+        while True:
+            batches = self._get_batches(job_id)
+            original = next(batch for batch in batches if batch["id"] == batch_id)
+            if pk_chunking and original["state"] != "Completed":
+                batches = [batch for batch in batches if batch["id"] != batch_id]
+            else:
+                batches = [original]
+
+            done = True
+            for batch in batches + [original]:
+                if batch["state"] == "Failed":
+                    raise SalesforceGeneralError(
+                        "", batch["state"], job_id, batch.get("stateMessage")
+                    )
+            for batch in batches:
+                if batch["state"] == "Completed":
+                    if batch["id"] not in yielded:
+                        yielded.add(batch["id"])
+                        yield batch
+                elif batch["state"] != "NotProcessed":
+                    done = False
+            if original["state"] not in ("Completed", "NotProcessed"):
+                done = False
+
+            if done:
+                return
+            time.sleep(wait)
+
+    def query_pages(
+        self,
+        query: str,
+        include_deleted: bool = False,
+        pk_chunking: bool = False,
+        chunk_size: int = 100000,
+        max_workers: int = 4,
+        wait: int = 5,
+    ) -> Iterator[list]:
+        """
+        Streams the results of a bulk query, one page (list of records) at a time
+
+        Up to max_workers pages are downloaded in parallel ahead of the consumer,
+        so memory stays bounded no matter how many records the query returns.
+        Pages of the same batch come out in order
+
+        Parameters:
+            query: The SOQL query
+            include_deleted: Runs a queryAll instead of a query
+            pk_chunking: Lets Salesforce split the query by record Id, which
+                is much faster for objects with millions of records
+            chunk_size: The number of records per chunk when pk_chunking
+            max_workers: The number of pages downloaded in parallel
+            wait: Seconds to sleep between checking the status of the job
+        """
+        operation = "queryAll" if include_deleted else "query"
+        job = self._create_query_job(operation, pk_chunking, chunk_size)
+        batch = self._add_batch(job["id"], query, operation)
+        self._close_job(job["id"])
+
+        pages = (
+            (job["id"], completed["id"], result_id)
+            for completed in self._completed_query_batches(
+                job["id"], batch["id"], pk_chunking, wait
+            )
+            for result_id in self._get_result_ids(job["id"], completed["id"])
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            in_flight = deque()
+            for page in pages:
+                in_flight.append(pool.submit(self._get_result_page, *page))
+                if len(in_flight) >= max_workers:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def query_records(self, query: str, **kwargs) -> Iterator[dict]:
+        """
+        Same as query_pages, but yields one record at a time
+        """
+        for page in self.query_pages(query, **kwargs):
+            yield from page
+
+    def query_to_file(
+        self, query: str, path: Path, file_format: str = "ndjson", **kwargs
+    ) -> int:
+        """
+        Streams the results of a bulk query to disk, returning the number of records
+
+        file_format is either ndjson (one json record per line) or csv. The csv
+        headers are taken from the first record, relationship fields are
+        written as json and the "attributes" key is dropped
+        """
+        assert file_format in ("ndjson", "csv"), f"Unknown file format {file_format}"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        count = 0
+        with open(path, mode="w", newline="") as file:
+            writer = None
+            for record in self.query_records(query, **kwargs):
+                if file_format == "ndjson":
+                    file.write(json.dumps(record) + "\n")
+                else:
+                    row = {
+                        key: json.dumps(value) if isinstance(value, dict) else value
+                        for key, value in record.items()
+                        if key != "attributes"
+                    }
+                    if writer is None:
+                        writer = csv.DictWriter(
+                            file, fieldnames=list(row), extrasaction="ignore"
+                        )
+                        writer.writeheader()
+                    writer.writerow(row)
+                count += 1
+        return count
+
 
 class SFBulkHandler(BaseSFBulkHandler):
+    def __init__(self, *args, limiter: AdaptiveLimiter = None, **kwargs):
+        self._bulk_types = dict()
+        self.limiter = limiter
+        super().__init__(*args, **kwargs)
+
     def __getattr__(self, name):
         """
         Source code from simple salesforce, but with SFBulkType swapped out
         for a subclassed version with back-off handling due to excessive
         payload size
+
+        The SFBulkType instances are cached per object name
         """
-        return SFBulkType(
-            object_name=name,
-            bulk_url=self.bulk_url,
-            headers=self.headers,
-            session=self.session,
+        if name.startswith("__"):
+            raise AttributeError(name)
+        bulk_type = self._bulk_types.get(name)
+        if bulk_type is None:
+            bulk_type = SFBulkType(
+                object_name=name,
+                bulk_url=self.bulk_url,
+                headers=self.headers,
+                session=self.session,
+                limiter=self.limiter,
+            )
+            self._bulk_types[name] = bulk_type
+        return bulk_type
+
+
+class SFCollectionsType:
+    """
+    Interface to the sObject Collections API for writes too small to be worth
+    a bulk job
+
+    Mirrors the write methods of SFBulkType, so sf.collections.Account can be
+    swapped in for sf.bulk.Account. Records are sent 200 at a time (the most a
+    single collections call accepts), and the results come back in the same
+    shape as the bulk results, ready for parse_bulk_upsert_results
+    """
+
+    batch_size = 200
+
+    def __init__(self, object_name, salesforce: Salesforce):
+        self.object_name = object_name
+        self.salesforce = salesforce
+
+    @property
+    def url(self):
+        return f"{self.salesforce.base_url}composite/sobjects"
+
+    def _call(self, method, url, **kwargs) -> list:
+        result = self.salesforce._call_salesforce(
+            method, url, name=self.object_name, **kwargs
         )
+        return result.json()
+
+    def _write(self, method, url, data, all_or_none) -> list:
+        results = list()
+        for batch in iter_slices(data, self.batch_size):
+            records = [
+                {"attributes": {"type": self.object_name}, **record} for record in batch
+            ]
+            payload = {"allOrNone": all_or_none, "records": records}
+            results += self._call(method, url, data=json.dumps(payload))
+        return results
+
+    def insert(self, data, all_or_none=False) -> list:
+        """create records"""
+        return self._write("POST", self.url, data, all_or_none)
+
+    def update(self, data, all_or_none=False) -> list:
+        """update records, each record must have an Id"""
+        return self._write("PATCH", self.url, data, all_or_none)
+
+    def upsert(self, data, external_id_field, all_or_none=False) -> list:
+        """upsert records based on a unique identifier"""
+        url = f"{self.url}/{self.object_name}/{external_id_field}"
+        return self._write("PATCH", url, data, all_or_none)
+
+    def delete(self, data, all_or_none=False) -> list:
+        """delete records, data looks like the bulk API's: [{"Id": ...}, ...]"""
+        results = list()
+        for batch in iter_slices(data, self.batch_size):
+            ids = [record["Id"] for record in batch]
+            params = {"ids": ",".join(ids), "allOrNone": str(all_or_none).lower()}
+            results += self._call("DELETE", self.url, params=params)
+        return results
+
+
+class SFCollectionsHandler:
+    """
+    Allows the sf.collections.Contact.insert(...) syntax, same as the bulk handler
+    """
+
+    def __init__(self, salesforce: Salesforce):
+        self.salesforce = salesforce
+        self._collections_types = dict()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        collections_type = self._collections_types.get(name)
+        if collections_type is None:
+            collections_type = SFCollectionsType(name, self.salesforce)
+            self._collections_types[name] = collections_type
+        return collections_type
 
 
 class SfClient(Salesforce):
-    def __init__(self, username, password, security_token, domain):
+    def __init__(
+        self,
+        username,
+        password,
+        security_token,
+        domain,
+        session: requests.Session = None,
+        pool_maxsize: int = 32,
+        max_retries: int = 3,
+        compress_requests: bool = False,
+        governor: SalesforceGovernor = None,
+        bulk_limiter: AdaptiveLimiter = None,
+    ):
+        """
+        session, when passed, is used as is. Otherwise one is built with
+        build_session using pool_maxsize, max_retries, compress_requests and
+        governor
+
+        bulk_limiter, when passed, is shared by every bulk job, and adapts how
+        many of their batches are processed at once. It backs off when batches
+        are throttled or have UNABLE_TO_LOCK_ROW errors, not on their latency
+        """
+        self.bulk_limiter = bulk_limiter
+        if session is None:
+            session = build_session(
+                pool_maxsize=pool_maxsize,
+                max_retries=max_retries,
+                compress_requests=compress_requests,
+                governor=governor,
+            )
         config = {
             "username": username,
             "password": password,
             "security_token": security_token,
+            "session": session,
         }
         if domain and domain.lower() != "na":
             config["domain"] = domain
@@ -103,6 +779,7 @@ class SfClient(Salesforce):
             except SalesforceAuthenticationFailed as reason:
                 login_attempts += 1
                 if reason.code == "SERVER_UNAVAILABLE":
+                    instrumentation.count("salesforce.retries", reason=reason.code)
                     time.sleep(2 ** login_attempts)
                     continue
                 raise reason
@@ -111,10 +788,56 @@ class SfClient(Salesforce):
         """
         This is the source code from simple salesforce, but we swap out
         SFBulkHandler with our own
+
+        The handler is cached until the session is refreshed
         """
         if name == "bulk":
             # Deal with bulk API functions
-            return SFBulkHandler(
-                self.session_id, self.bulk_url, self.proxies, self.session
-            )
+            bulk_handler = self.__dict__.get("_bulk_handler")
+            if bulk_handler is None or bulk_handler.session_id != self.session_id:
+                bulk_handler = SFBulkHandler(
+                    self.session_id,
+                    self.bulk_url,
+                    self.proxies,
+                    self.session,
+                    limiter=self.bulk_limiter,
+                )
+                self._bulk_handler = bulk_handler
+            return bulk_handler
+        if name == "collections":
+            collections_handler = SFCollectionsHandler(self)
+            self.collections = collections_handler
+            return collections_handler
         return super().__getattr__(name)
+
+    def push(
+        self,
+        salesforce_object: str,
+        operation: str,
+        data: list,
+        external_id_field: str = None,
+        bulk_threshold: int = 2000,
+    ) -> list:
+        """
+        Writes data with the collections API when there's at most bulk_threshold
+        records, and with the bulk API otherwise. A bulk job costs several API
+        calls and at least one polling interval, so small batches are faster
+        (and cheaper) through collections
+
+        Parameters:
+            salesforce_object: The name of the object, e.g. Account
+            operation: One of insert, update, upsert or delete
+            data: The records to push
+            external_id_field: The upsert key, required for upserts
+
+        The results are in the bulk API's shape either way
+        """
+        if len(data) <= bulk_threshold:
+            handler = self.collections
+        else:
+            handler = self.bulk
+        sobject = getattr(handler, salesforce_object)
+        if operation == "upsert":
+            assert external_id_field, "external_id_field is required for upserts"
+            return sobject.upsert(data, external_id_field)
+        return getattr(sobject, operation)(data)
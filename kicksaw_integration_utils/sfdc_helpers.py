@@ -1,5 +1,7 @@
 from typing import Tuple
 
+UNABLE_TO_LOCK_ROW = "UNABLE_TO_LOCK_ROW"
+
 
 def parse_bulk_upsert_results(
     results: list, data: list, salesforce_object: str, upsert_key: str
@@ -33,6 +35,19 @@ def parse_bulk_upsert_results(
     return successes, errors
 
 
+def split_lock_errors(errors: list) -> Tuple[list, list]:
+    """
+    Splits the errors from parse_bulk_upsert_results into other errors and
+    UNABLE_TO_LOCK_ROW errors, which are contention rather than bad data, so
+    pushing those records again usually works
+    """
+    others = list()
+    locked = list()
+    for error in errors:
+        (locked if error["code"] == UNABLE_TO_LOCK_ROW else others).append(error)
+    return others, locked
+
+
 def extract_errors_from_results(results: list) -> list:
     """
     More general version of parse_bulk_upsert_results
@@ -42,4 +57,22 @@ def extract_errors_from_results(results: list) -> list:
         success = result.get("success")
         if not success:
             errors += result.get("errors")
-    return errors
\ No newline at end of file
+    return errors
+
+
+def is_lock_error(result: dict) -> bool:
+    """
+    Whether a record failed with UNABLE_TO_LOCK_ROW, i.e., records were written
+    to concurrently, usually children of the same parent
+    """
+    return not result.get("success") and any(
+        error.get("statusCode") == UNABLE_TO_LOCK_ROW
+        for error in result.get("errors") or []
+    )
+
+
+def has_lock_errors(results: list) -> bool:
+    """
+    Whether any record failed with UNABLE_TO_LOCK_ROW
+    """
+    return any(map(is_lock_error, results))
@@ -0,0 +1,161 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Callable, List, Optional
+
+from pydantic import BaseModel
+
+from kicksaw_integration_utils.aws import SQSQueue
+from kicksaw_integration_utils.s3_helpers import get_s3_client
+
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+
+class Shard(BaseModel):
+    """
+    A byte range of a csv in S3, aligned to row boundaries
+
+    start is inclusive, end is exclusive. Every shard gets the csv's header
+    prepended when it's downloaded, so each one is a valid csv on its own
+    """
+
+    s3_object_key: str
+    bucket_name: str
+    index: int
+    start: int
+    end: int
+    header: str
+
+
+class ShardResult(BaseModel):
+    """
+    What a worker reports back after processing a shard
+    """
+
+    index: int
+    error_count: int = 0
+    error_report_s3_key: Optional[str] = None
+
+
+def _read_range(s3_client, bucket_name: str, s3_object_key: str, start, end) -> bytes:
+    response = s3_client.get_object(
+        Bucket=bucket_name, Key=s3_object_key, Range=f"bytes={start}-{end - 1}"
+    )
+    return response["Body"].read()
+
+
+def _next_row_start(
+    s3_client, bucket_name: str, s3_object_key: str, offset, size, window=64 * 1024
+) -> int:
+    """
+    Returns the offset right after the first newline at or after offset
+    """
+    while offset < size:
+        end = min(offset + window, size)
+        data = _read_range(s3_client, bucket_name, s3_object_key, offset, end)
+        newline = data.find(b"\n")
+        if newline != -1:
+            return offset + newline + 1
+        offset = end
+    return size
+
+
+def plan_shards(
+    s3_object_key: str, bucket_name: str, shard_size: int = DEFAULT_SHARD_SIZE
+) -> List[Shard]:
+    """
+    Divides a csv in S3 into shards of roughly shard_size bytes
+
+    Only the bytes around each boundary are read, never the whole file. Rows are
+    assumed to end with a newline, i.e., quoted values can't contain newlines
+    """
+    s3_client = get_s3_client()
+    head = s3_client.head_object(Bucket=bucket_name, Key=s3_object_key)
+    size = head["ContentLength"]
+    header_end = _next_row_start(s3_client, bucket_name, s3_object_key, 0, size)
+    header = _read_range(s3_client, bucket_name, s3_object_key, 0, header_end)
+
+    starts = [header_end]
+    boundary = header_end + shard_size
+    while boundary < size:
+        row_start = _next_row_start(
+            s3_client, bucket_name, s3_object_key, boundary - 1, size
+        )
+        if row_start >= size:
+            break
+        starts.append(row_start)
+        boundary = row_start + shard_size
+
+    ends = starts[1:] + [size]
+    return [
+        Shard(
+            s3_object_key=s3_object_key,
+            bucket_name=bucket_name,
+            index=index,
+            start=start,
+            end=end,
+            header=header.decode("utf-8"),
+        )
+        for index, (start, end) in enumerate(zip(starts, ends))
+        if start < end
+    ]
+
+
+def get_shard_file_name(s3_object_key: str, index: int) -> str:
+    """
+    e.g., origin/a_file.csv, 3 -> a_file-shard-0003.csv
+    """
+    name, extension = os.path.splitext(os.path.basename(s3_object_key))
+    return f"{name}-shard-{index:04d}{extension}"
+
+
+def download_shard(shard: Shard, download_path: Path = None) -> Path:
+    """
+    Downloads a shard with the csv's header prepended, following the pathing
+    convention of download_file
+
+        e.g., origin/a_file.csv, shard 3 -> %TEMP%/origin/a_file-shard-0003.csv
+    """
+    if not download_path:
+        download_path = Path(os.getenv("TEMP", gettempdir()))
+
+    download_folder = download_path / os.path.dirname(shard.s3_object_key)
+    download_path = download_folder / get_shard_file_name(
+        shard.s3_object_key, shard.index
+    )
+    Path(download_folder).mkdir(parents=True, exist_ok=True)
+
+    response = get_s3_client().get_object(
+        Bucket=shard.bucket_name,
+        Key=shard.s3_object_key,
+        Range=f"bytes={shard.start}-{shard.end - 1}",
+    )
+    with open(download_path, mode="wb") as file:
+        file.write(shard.header.encode("utf-8"))
+        for chunk in response["Body"].iter_chunks(chunk_size=1024 * 1024):
+            file.write(chunk)
+
+    return download_path
+
+
+def run_shards(
+    shards: List[Shard],
+    worker: Callable[[Shard], ShardResult],
+    max_workers: int = None,
+) -> List[ShardResult]:
+    """
+    Processes the shards on a local process pool, returning the results in order
+
+    worker must be picklable, i.e., a function defined at the top level of a module
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(worker, shards))
+
+
+def dispatch_shards(shards: List[Shard], queue: SQSQueue) -> List[bool]:
+    """
+    Sends one message per shard to an SQSQueue[Shard], for workers to pick up
+    """
+    return queue.send_messages(shards)
@@ -1,4 +1,4 @@
-from kicksaw_integration_utils.utils import batch_collection
+from kicksaw_integration_utils.batching import iter_slices
 
 
 def get_queue_url(sqs_client, queue_name: str):
@@ -27,7 +27,7 @@ def pull_n_number_of_messages(sqs_client, queue_name: str, n: int = 10000):
 
 def acknowledge_messages(sqs_client, queue_name: str, messages: list):
     queue_url = get_queue_url(sqs_client, queue_name)
-    for batch in batch_collection(messages, 10):
+    for batch in iter_slices(messages, 10):
         entries = list()
         for message in batch:
             entries.append(
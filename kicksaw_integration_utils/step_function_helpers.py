@@ -1,4 +1,3 @@
-import boto3
 import json
 
 from pathlib import Path
@@ -16,6 +15,8 @@ def cache_data_in_s3(data: CACHED_DATA, bucket: str, s3_key: Union[Path, str] =
 
     Useful when using step functions where payload size is a limit
     """
+    import boto3
+
     s3 = boto3.client("s3")
 
     if not s3_key:
@@ -37,6 +38,8 @@ def pull_cached_data_from_s3(bucket: str, s3_key: str, delete: bool = False):
     safer to delete explicitly once the step is done and the data
     has been been processed
     """
+    import boto3
+
     s3 = boto3.resource("s3")
     s3_object = s3.Object(bucket, s3_key)
 
@@ -1,11 +1,26 @@
 import datetime
+import functools
+import hashlib
+import ipaddress
 import itertools
+import json
+import math
+import operator
+import pickle
+import shutil
+import sqlite3
+import tempfile
 import time
 
 from pathlib import Path
-from typing import Iterable
+from typing import Any, Callable, Iterable, Iterator, List, Sequence, Tuple, Union
 from urllib.parse import urlparse
 
+from kicksaw_integration_utils.domains import registered_domain
+
+_MISSING = object()
+_UINT64_MASK = 2**64 - 1
+
 
 def get_iso() -> str:
     """
@@ -39,7 +54,15 @@ def batch_collection(iterable: Iterable, size: int):
     return a generator for performance reasons
 
     Stolen from https://stackoverflow.com/a/8991553/8395007
+
+    Lists are sliced rather than iterated. See batching.iter_slices for batches
+    that don't copy at all
     """
+    if isinstance(iterable, list):
+        for start in range(0, len(iterable), size):
+            yield iterable[start : start + size]
+        return
+
     it = iter(iterable)
     while True:
         chunk = list(itertools.islice(it, size))
@@ -48,23 +71,278 @@ def batch_collection(iterable: Iterable, size: int):
         yield chunk
 
 
-def dedupe(elements: list, unique_prop: str) -> list:
-    seen_unique_props = set()
-    deduped_elements = list()
+class BloomFilter:
+    """
+    A set that only answers "definitely not seen" or "probably seen", in a fixed
+    amount of memory: about 1.2 bytes per key at a 1% error rate, 1.8 at 0.1%
+
+    Sized for capacity keys; past that, the error rate climbs
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        assert capacity > 0, "capacity must be positive"
+        assert 0 < error_rate < 1, "error_rate must be between 0 and 1"
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _hashes(self, key: bytes) -> Tuple[int, int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return (
+            int.from_bytes(digest[:8], "little"),
+            int.from_bytes(digest[8:], "little") | 1,
+        )
+
+    def _positions(self, key: bytes) -> List[int]:
+        # double hashing: the k positions are h1 + i * h2, in 64 bit arithmetic
+        # so they match add_many's
+        first, second = self._hashes(key)
+        return [
+            ((first + i * second) & _UINT64_MASK) % self.size
+            for i in range(self.hash_count)
+        ]
+
+    def add(self, key: bytes) -> bool:
+        """
+        Adds a key, returning whether it was (probably) there already
+        """
+        positions = self._positions(key)
+        bits = self.bits
+        if all(bits[position >> 3] & (1 << (position & 7)) for position in positions):
+            return True
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        return False
+
+    def add_many(self, keys: List[bytes]) -> List[bool]:
+        """
+        add for several distinct keys at once. Vectorized when numpy is installed
+        """
+        try:
+            import numpy as np  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return [self.add(key) for key in keys]
+
+        if not keys:
+            return list()
+        digests = b"".join(
+            [hashlib.blake2b(key, digest_size=16).digest() for key in keys]
+        )
+        hashes = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+        offsets = np.arange(self.hash_count, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            positions = (hashes[:, :1] + offsets * (hashes[:, 1:] | np.uint64(1))) % (
+                np.uint64(self.size)
+            )
+        indexes = (positions >> np.uint64(3)).astype(np.intp)
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        seen = ((bits[indexes] & masks) != 0).all(axis=1)
+        np.bitwise_or.at(bits, indexes.ravel(), masks.ravel())
+        return seen.tolist()
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+def _get_key_function(key, element) -> Callable[[Any], Any]:
+    """
+    Turns a dedupe key into a function of an element. Whether a key name is a
+    dict key or an attribute is decided once, from the first element
+    """
+    if callable(key):
+        return key
+    names = key if isinstance(key, (tuple, list)) else (key,)
+    getter = operator.itemgetter if isinstance(element, dict) else operator.attrgetter
+    return getter(*names)
+
+
+def _normalize_key(key):
+    # equal keys must encode the same, as they'd hash the same in a set:
+    # True == 1 == 1.0
+    if isinstance(key, bool):
+        return int(key)
+    if isinstance(key, float) and key.is_integer():
+        return int(key)
+    if isinstance(key, (tuple, list)):
+        return [_normalize_key(part) for part in key]
+    return key
+
+
+def _key_bytes(key) -> bytes:
+    """
+    Encodes a key for the disk and bloom modes, which compare bytes rather than
+    keys. Anything but str and bytes is encoded as json, behind a null byte so
+    it can't be taken for a str
+    """
+    if isinstance(key, str):
+        return key.encode("utf-8")
+    if isinstance(key, bytes):
+        return key
+    encoded = json.dumps(
+        _normalize_key(key), sort_keys=True, separators=(",", ":"), default=str
+    )
+    return b"\0" + encoded.encode("utf-8")
+
 
+def _dedupe_in_memory(elements: Iterator, get_key, last_wins: bool) -> Iterator:
+    if last_wins:
+        # keeps each key where it first appeared, with its last element
+        kept = dict()
+        for element in elements:
+            kept[get_key(element)] = element
+        yield from kept.values()
+        return
+
+    seen = set()
+    add = seen.add
     for element in elements:
-        if isinstance(element, dict):
-            unique_value = element[unique_prop]
-        else:
-            unique_value = getattr(element, unique_prop)
+        key = get_key(element)
+        if key not in seen:
+            add(key)
+            yield element
+
+
+def _dedupe_with_bloom_filter(
+    elements: Iterator, get_key, capacity: int, error_rate: float, chunk_size=10_000
+) -> Iterator:
+    bloom_filter = BloomFilter(capacity, error_rate)
+    for chunk in batch_collection(elements, chunk_size):
+        # duplicates within the chunk are dropped exactly, the rest of the keys are
+        # checked against the filter together
+        firsts = dict()
+        for element in chunk:
+            firsts.setdefault(_key_bytes(get_key(element)), element)
+        for element, seen in zip(firsts.values(), bloom_filter.add_many(list(firsts))):
+            if not seen:
+                yield element
+
+
+def _dedupe_on_disk(
+    elements: Iterator, get_key, last_wins: bool, path: Path, chunk_size: int = 500
+) -> Iterator:
+    """
+    Keeps the keys seen so far in a sqlite database rather than in memory. Works a
+    chunk of elements at a time, so there's one query and one insert per chunk
+    """
+    folder = None
+    if not path:
+        folder = tempfile.mkdtemp()
+        path = Path(folder) / "dedupe.sqlite3"
+
+    connection = sqlite3.connect(str(path))
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        # a path given again starts over, since the keys of another run don't apply
+        connection.execute("DROP TABLE IF EXISTS seen")
+        connection.execute(
+            "CREATE TABLE seen (key BLOB PRIMARY KEY, position INTEGER, element BLOB)"
+        )
+        position = 0
+        for chunk in batch_collection(elements, chunk_size):
+            keyed = [(_key_bytes(get_key(element)), element) for element in chunk]
+
+            if last_wins:
+                connection.executemany(
+                    "INSERT INTO seen VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET element = excluded.element",
+                    (
+                        (key, position + offset, pickle.dumps(element, protocol=4))
+                        for offset, (key, element) in enumerate(keyed)
+                    ),
+                )
+                position += len(keyed)
+                continue
+
+            firsts = dict()
+            for key, element in keyed:
+                firsts.setdefault(key, element)
+            placeholders = ", ".join("?" * len(firsts))
+            already_seen = {
+                row[0]
+                for row in connection.execute(
+                    f"SELECT key FROM seen WHERE key IN ({placeholders})",
+                    list(firsts),
+                )
+            }
+            new = [key for key in firsts if key not in already_seen]
+            connection.executemany(
+                "INSERT INTO seen (key) VALUES (?)", ((key,) for key in new)
+            )
+            for key in new:
+                yield firsts[key]
+
+        if last_wins:
+            for (element,) in connection.execute(
+                "SELECT element FROM seen ORDER BY position"
+            ):
+                yield pickle.loads(element)
+    finally:
+        connection.close()
+        if folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
 
-        if unique_value in seen_unique_props:
-            continue
+def iter_dedupe(
+    elements: Iterable,
+    key: Union[str, Sequence[str], Callable[[Any], Any]],
+    mode: str = "memory",
+    last_wins: bool = False,
+    capacity: int = 10_000_000,
+    error_rate: float = 0.001,
+    path: Path = None,
+) -> Iterator:
+    """
+    Lazily drops the elements whose key has already been seen, keeping their order
+
+    Parameters:
+        key: A dict key or attribute name, a tuple of them for a composite key, or a
+            function of an element
+        mode: Where the keys seen so far are kept
+            memory: a set. Fastest, but every key stays in memory
+            disk: a sqlite database at path (a temporary file by default), for
+                more keys than fit in memory. What path held is discarded
+            bloom: a BloomFilter sized for capacity keys. Memory stays fixed, but
+                about error_rate of the unique elements are wrongly dropped
+        last_wins: Keep the last element of each key (at the position of the
+            first) instead of the first. Nothing is yielded until elements is
+            exhausted. Not supported in bloom mode
+    """
+    assert mode in ("memory", "disk", "bloom"), f"unknown dedupe mode {mode}"
+    assert not (last_wins and mode == "bloom"), "bloom mode can't keep last elements"
+
+    elements = iter(elements)
+    first = next(elements, _MISSING)
+    if first is _MISSING:
+        return
+    elements = itertools.chain([first], elements)
+    get_key = _get_key_function(key, first)
 
-        seen_unique_props.add(unique_value)
-        deduped_elements.append(element)
+    if mode == "memory":
+        yield from _dedupe_in_memory(elements, get_key, last_wins)
+    elif mode == "disk":
+        yield from _dedupe_on_disk(elements, get_key, last_wins, path)
+    else:
+        yield from _dedupe_with_bloom_filter(elements, get_key, capacity, error_rate)
 
-    return deduped_elements
+
+def dedupe(elements: list, unique_prop: str) -> list:
+    """
+    Keeps the first element of each unique_prop value, a dict key or an
+    attribute, element by element. See iter_dedupe
+    """
+
+    def get_unique_value(element):
+        if isinstance(element, dict):
+            return element[unique_prop]
+        return getattr(element, unique_prop)
+
+    return list(iter_dedupe(elements, get_unique_value))
 
 
 def unix_timestamp_in_future(hours: int):
@@ -72,9 +350,16 @@ def unix_timestamp_in_future(hours: int):
     return epoch_now + (60 * 60 * hours)
 
 
+@functools.lru_cache(maxsize=2**16)
 def extract_domain(url: str, remove_subdomains: bool = False, remove_www: bool = True):
     """
     Extracts a clean, top-level domain from a url
+
+    remove_subdomains keeps the registered domain, per the public suffix list
+    bundled in this package, e.g., https://shop.example.co.uk -> example.co.uk,
+    leaving out any port or credentials. An IP address is returned as is
+
+    Results are cached, since the same websites tend to come up over and over
     """
     if url is None:
         return None
@@ -96,4 +381,14 @@ def extract_domain(url: str, remove_subdomains: bool = False, remove_www: bool =
         return parsed
 
     # clean out subdomains
-    return ".".join(parsed.split(".")[-2:])
\ No newline at end of file
+    hostname = urlparse(url).hostname
+    try:
+        ipaddress.ip_address(hostname)
+        return hostname
+    except ValueError:
+        pass
+    domain = registered_domain(hostname)
+    if domain is None:
+        # hostname is a public suffix itself, e.g., co.uk
+        return hostname
+    return domain
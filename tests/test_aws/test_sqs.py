@@ -1,3 +1,6 @@
+import threading
+import time
+
 from typing import List
 
 import boto3
@@ -7,6 +10,9 @@ from moto import mock_sqs
 from pydantic import BaseModel
 
 from kicksaw_integration_utils.aws import SQSQueue
+from kicksaw_integration_utils.aws.sqs.queue import MAX_BATCH_BYTES
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter
+from kicksaw_integration_utils.idempotency import MemoryIdempotencyStore
 
 
 class Message(BaseModel):
@@ -88,3 +94,301 @@ def test_warn_max_poll_attempts(queue: SQSQueue, messages: List[Message]):
         match=r"max_poll_attempts.+shouldn't exceed.+max_messages",
     ):
         queue.receive_messages(max_messages=10_000, max_poll_attempts=100_000)
+
+
+class SpyQueue:
+    def __init__(self, queue) -> None:
+        self.queue = queue
+        self.batch_sizes = list()
+
+    def __getattr__(self, name):
+        return getattr(self.queue, name)
+
+    def send_messages(self, Entries):
+        self.batch_sizes.append(sum(len(entry["MessageBody"]) for entry in Entries))
+        return self.queue.send_messages(Entries=Entries)
+
+
+def test_send_messages_splits_large_batches(queue: SQSQueue):
+    # 10 of these add up to more than SQS accepts in one batch
+    messages = [Message(number=i, message="x" * 60_000) for i in range(10)]
+    spy = SpyQueue(queue._queue)
+    queue._queue, real_queue = spy, queue._queue
+
+    assert queue.send_messages(messages) == [True] * 10
+    assert len(spy.batch_sizes) == 3
+    assert all(size <= MAX_BATCH_BYTES for size in spy.batch_sizes)
+
+    queue._queue = real_queue
+
+    handles, received_messages = queue.receive_messages()
+    assert sorted(message.number for message in received_messages) == list(range(10))
+
+
+def test_process_messages(queue: SQSQueue, messages: List[Message]):
+    queue.send_messages(messages)
+    store = MemoryIdempotencyStore()
+    # as if these had been delivered and processed before
+    for message in queue._queue.receive_messages(MaxNumberOfMessages=2):
+        store.claim(message.message_id)
+        store.complete(message.message_id)
+        message.change_visibility(VisibilityTimeout=0)
+
+    processed = []
+
+    def process(message: Message):
+        if message.number == 5:
+            raise ValueError("can't process message #5")
+        processed.append(message.number)
+
+    counts = queue.process_messages(process, idempotency_store=store)
+    assert counts == (7, 2, 1)
+    assert len(processed) == 7
+    assert 5 not in processed
+
+    # only the failure is left, in flight until it's retried, and released
+    queue._queue.reload()
+    assert queue._queue.attributes["ApproximateNumberOfMessages"] == "0"
+    assert queue._queue.attributes["ApproximateNumberOfMessagesNotVisible"] == "1"
+    assert len(store.keys) == 9
+
+
+def test_process_messages_leaves_messages_in_progress(queue: SQSQueue):
+    queue.send_messages([Message(number=1, message="Message #1")])
+    store = MemoryIdempotencyStore()
+    # as if another consumer were processing it, and could still fail
+    (message,) = queue._queue.receive_messages()
+    store.claim(message.message_id)
+    message.change_visibility(VisibilityTimeout=0)
+
+    assert queue.process_messages(lambda message: None, idempotency_store=store) == (
+        0,
+        0,
+        1,
+    )
+    assert queue_counts(queue) == (0, 1)
+
+
+def test_send_messages_with_limiter(queue: SQSQueue):
+    messages = [Message(number=i, message=f"Message #{i}") for i in range(50)]
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4, latency_tolerance=None)
+
+    assert queue.send_messages(messages, limiter=limiter) == [True] * 50
+    assert limiter.limit > 2
+    assert limiter.in_flight == 0
+
+    received = queue.receive_messages(max_messages=50)[1]
+    assert sorted(message.number for message in received) == list(range(50))
+
+
+class PatientMessage(BaseModel):
+    patient: str
+    number: int
+
+
+@pytest.fixture(scope="function")
+def fifo_queue():
+    with mock_sqs():
+        queue_name = "test-queue-name.fifo"
+        sqs_client = boto3.client("sqs", region_name="us-east-1")
+        sqs_client.create_queue(
+            QueueName=queue_name,
+            Attributes={"FifoQueue": "true", "ContentBasedDeduplication": "true"},
+        )
+        yield SQSQueue.from_name(queue_name, PatientMessage, region_name="us-east-1")
+
+
+def patient_messages(count=30):
+    return [PatientMessage(patient=f"p{i % 3}", number=i) for i in range(count)]
+
+
+def test_send_messages_to_fifo_queue(fifo_queue: SQSQueue):
+    assert fifo_queue.fifo
+    with pytest.raises(AssertionError, match="needs a group_id"):
+        fifo_queue.send_messages(patient_messages())
+
+    messages = patient_messages()
+    limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+    results = fifo_queue.send_messages(
+        messages, limiter=limiter, group_id=lambda message: message.patient
+    )
+    assert results == [True] * 30
+
+    # a group's messages aren't received again while some are in flight
+    received = []
+    while True:
+        handles, batch = fifo_queue.receive_messages(max_messages=10)
+        if not handles:
+            break
+        received += batch
+        fifo_queue.delete_messages(handles)
+    assert sorted(message.number for message in received) == list(range(30))
+    for patient in ("p0", "p1", "p2"):
+        numbers = [message.number for message in received if message.patient == patient]
+        assert numbers == sorted(numbers)
+
+
+def test_send_messages_deduplicates(fifo_queue: SQSQueue):
+    messages = patient_messages(4)
+    fifo_queue.send_messages(
+        messages, group_id="patients", deduplication_id=lambda message: message.patient
+    )
+
+    # 0 and 3 share a deduplication id
+    received = fifo_queue.receive_messages()[1]
+    assert [message.number for message in received] == [0, 1, 2]
+
+
+def test_process_message_groups_in_parallel(fifo_queue: SQSQueue):
+    fifo_queue.send_messages(
+        patient_messages(), group_id=lambda message: message.patient
+    )
+    processed = {"p0": [], "p1": [], "p2": []}
+
+    def process(message: PatientMessage):
+        if message.number == 13:
+            raise ValueError("can't process message #13")
+        processed[message.patient].append(message.number)
+
+    processed_count, skipped, failed = fifo_queue.process_messages(
+        process, max_workers=3
+    )
+
+    # p1 stopped at 13, the rest of its messages are left to be retried in order
+    assert processed["p0"] == list(range(0, 30, 3))
+    assert processed["p2"] == list(range(2, 30, 3))
+    assert processed["p1"] == [1, 4, 7, 10]
+    assert skipped == 0
+    assert processed_count == 24
+    assert failed >= 1
+
+
+def test_process_messages_receives_while_groups_are_processed(fifo_queue: SQSQueue):
+    messages = [PatientMessage(patient="p0", number=i) for i in range(10)]
+    messages.append(PatientMessage(patient="p1", number=10))
+    fifo_queue.send_messages(messages, group_id=lambda message: message.patient)
+    p1_processed = threading.Event()
+    p0_waited = []
+
+    def process(message: PatientMessage):
+        if message.patient == "p1":
+            p1_processed.set()
+        elif message.number == 0:
+            # p0's ten messages fill a whole receive; p1 only gets processed
+            # if another receive happens while p0 is still being processed
+            p0_waited.append(p1_processed.wait(timeout=5))
+
+    assert fifo_queue.process_messages(process, max_workers=2) == (11, 0, 0)
+    assert p0_waited == [True]
+
+
+@pytest.fixture(scope="function")
+def dead_letter_queue(queue: SQSQueue):
+    boto3.client("sqs", region_name="us-east-1").create_queue(QueueName="test-dlq")
+    return SQSQueue.from_name("test-dlq", Message, region_name="us-east-1")
+
+
+def queue_counts(queue: SQSQueue):
+    queue._queue.reload()
+    return (
+        int(queue._queue.attributes["ApproximateNumberOfMessages"]),
+        int(queue._queue.attributes["ApproximateNumberOfMessagesNotVisible"]),
+    )
+
+
+def test_redrive_messages(queue: SQSQueue, dead_letter_queue: SQSQueue):
+    messages = [Message(number=i, message=f"Message #{i}") for i in range(25)]
+    dead_letter_queue.send_messages(messages)
+
+    result = dead_letter_queue.redrive_messages(queue, max_workers=3)
+
+    assert result.dict() == {
+        "received": 25,
+        "matched": 25,
+        "moved": 25,
+        "skipped": 0,
+        "failed": 0,
+    }
+    assert queue_counts(dead_letter_queue) == (0, 0)
+    received = queue.receive_messages(max_messages=25)[1]
+    assert sorted(message.number for message in received) == list(range(25))
+
+
+def test_redrive_messages_dry_run_with_predicate(
+    queue: SQSQueue, dead_letter_queue: SQSQueue
+):
+    dead_letter_queue.send_messages(
+        [Message(number=i, message=f"Message #{i}") for i in range(20)]
+    )
+
+    # moto can hand a message to two threads receiving at once
+    result = dead_letter_queue.redrive_messages(
+        queue,
+        predicate=lambda message: message.number % 2 == 0,
+        dry_run=True,
+        max_workers=1,
+    )
+
+    assert (result.received, result.matched, result.skipped) == (20, 10, 10)
+    assert result.moved == 0
+    assert queue_counts(queue) == (0, 0)
+    # nothing was deleted, and what was received was released
+    assert queue_counts(dead_letter_queue) == (20, 0)
+
+    # so a real run after counting moves them
+    result = dead_letter_queue.redrive_messages(
+        queue, predicate=lambda message: message.number % 2 == 0, max_workers=1
+    )
+
+    assert (result.received, result.moved, result.skipped) == (20, 10, 10)
+    assert queue_counts(queue) == (10, 0)
+    # the ones that didn't match are back in the dead-letter queue
+    assert queue_counts(dead_letter_queue) == (10, 0)
+
+
+class FailingQueue(SpyQueue):
+    def send_messages(self, Entries):
+        response = self.queue.send_messages(Entries=Entries[1:])
+        response["Failed"] = [{"Id": Entries[0]["Id"], "Code": "InternalError"}]
+        return response
+
+
+def test_redrive_messages_keeps_what_was_not_sent(
+    queue: SQSQueue, dead_letter_queue: SQSQueue
+):
+    dead_letter_queue.send_messages(
+        [Message(number=i, message=f"Message #{i}") for i in range(10)]
+    )
+    queue._queue = FailingQueue(queue._queue)
+
+    result = dead_letter_queue.redrive_messages(queue, max_workers=1)
+
+    assert (result.moved, result.failed) == (9, 1)
+    # the failure is left in the dead-letter queue, in flight until it's retried
+    assert queue_counts(dead_letter_queue) == (0, 1)
+
+
+def test_redrive_messages_rate(queue: SQSQueue, dead_letter_queue: SQSQueue):
+    dead_letter_queue.send_messages(
+        [Message(number=i, message=f"Message #{i}") for i in range(15)]
+    )
+
+    start = time.monotonic()
+    result = dead_letter_queue.redrive_messages(queue, rate=10)
+
+    # a burst of 10, then 5 more at 10 a second
+    assert result.moved == 15
+    assert time.monotonic() - start >= 0.4
+
+
+def test_redrive_messages_to_fifo_queue_needs_group_ids(dead_letter_queue: SQSQueue):
+    dead_letter_queue.send_messages([Message(number=1, message="Message #1")])
+    boto3.client("sqs", region_name="us-east-1").create_queue(
+        QueueName="test-target.fifo", Attributes={"FifoQueue": "true"}
+    )
+    target = SQSQueue.from_name("test-target.fifo", Message, region_name="us-east-1")
+
+    with pytest.raises(AssertionError, match="no group id"):
+        dead_letter_queue.redrive_messages(target)
+    # nothing was received, so nothing is left in flight
+    assert queue_counts(dead_letter_queue) == (1, 0)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from kicksaw_integration_utils.batching import (
+    SequenceView,
+    abatch,
+    batch_by_group,
+    batch_by_size,
+    batch_by_time,
+    batch_by_weight,
+    iter_slices,
+)
+
+
+def test_sequence_view():
+    data = list(range(10))
+    view = SequenceView(data, 2, 8)
+
+    assert len(view) == 6
+    assert view == [2, 3, 4, 5, 6, 7]
+    assert view[0] == 2 and view[-1] == 7
+    assert view[1:3] == [3, 4]
+    assert isinstance(view[1:3], SequenceView)
+    assert view[1:3].sequence is data
+    assert view[::2] == [2, 4, 6]
+    with pytest.raises(IndexError):
+        view[6]
+
+    data[2] = "changed"
+    assert view[0] == "changed"
+
+
+def test_iter_slices():
+    data = list(range(7))
+
+    slices = list(iter_slices(data, 3))
+
+    assert slices == [[0, 1, 2], [3, 4, 5], [6]]
+    assert all(view.sequence is data for view in slices)
+    assert [view.start for view in slices] == [0, 3, 6]
+    assert list(iter_slices([], 3)) == []
+    assert list(iter_slices(SequenceView(data, 1, 6), 2)) == [[1, 2], [3, 4], [5]]
+    assert list(iter_slices(range(5), 2)) == [range(0, 2), range(2, 4), range(4, 5)]
+
+
+def test_batch_by_weight():
+    batches = batch_by_weight([1, 2, 3, 9, 1, 1, 1], max_weight=5, weight=lambda x: x)
+
+    assert list(batches) == [[1, 2], [3], [9], [1, 1, 1]]
+
+    batches = batch_by_weight([1] * 5, max_weight=100, weight=lambda x: x, max_count=2)
+    assert list(batches) == [[1, 1], [1, 1], [1]]
+
+
+def test_batch_by_size():
+    records = [{"Name": "x" * 10}] * 5  # 20 bytes of json each, plus 2
+
+    assert [len(batch) for batch in batch_by_size(records, 50)] == [2, 2, 1]
+
+
+def test_batch_by_group():
+    contacts = [(i, account) for i, account in enumerate("AABACCCBD" + "E" * 5)]
+    contacts.append((14, None))
+
+    batches = batch_by_group(contacts, key=lambda contact: contact[1], max_count=4)
+
+    # largest groups first; E is too big for one batch so it's split, and the
+    # rest of it shares a batch with A. Children keep their order
+    assert batches == [
+        [(9, "E"), (10, "E"), (11, "E"), (12, "E")],
+        [(13, "E"), (0, "A"), (1, "A"), (3, "A")],
+        [(4, "C"), (5, "C"), (6, "C"), (14, None)],
+        [(2, "B"), (7, "B"), (8, "D")],
+    ]
+
+    batches = batch_by_group(
+        [1, 1, 2, 2, 3], key=int, max_count=10, max_weight=4, weight=lambda x: x
+    )
+    assert batches == [[1, 1], [2, 2], [3]]
+
+
+def slow_stream():
+    yield 1
+    yield 2
+    time.sleep(0.3)
+    yield 3
+
+
+def test_batch_by_time():
+    assert list(batch_by_time(slow_stream(), max_count=10, max_seconds=0.1)) == [
+        [1, 2],
+        [3],
+    ]
+    assert list(batch_by_time(range(5), max_count=2, max_seconds=10)) == [
+        [0, 1],
+        [2, 3],
+        [4],
+    ]
+
+
+def test_batch_by_time_raises_stream_errors():
+    def broken_stream():
+        yield 1
+        raise ValueError("broken")
+
+    batches = batch_by_time(broken_stream(), max_count=10, max_seconds=10)
+
+    assert next(batches) == [1]
+    with pytest.raises(ValueError):
+        next(batches)
+
+
+async def slow_async_stream():
+    for element in range(5):
+        if element == 3:
+            await asyncio.sleep(0.3)
+        yield element
+
+
+def test_abatch():
+    async def collect(**kwargs):
+        return [batch async for batch in abatch(slow_async_stream(), **kwargs)]
+
+    assert asyncio.run(collect(size=2)) == [[0, 1], [2, 3], [4]]
+    assert asyncio.run(collect(size=10, max_seconds=0.1)) == [[0, 1, 2], [3, 4]]
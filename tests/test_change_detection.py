@@ -0,0 +1,65 @@
+import boto3
+
+from moto import mock_s3
+
+from kicksaw_integration_utils.change_detection import (
+    ChangeDetector,
+    S3HashStore,
+    SQLiteHashStore,
+    record_hash,
+)
+
+
+def test_record_hash():
+    assert record_hash({"a": 1, "b": "x"}) == record_hash({"b": "x", "a": 1})
+    assert record_hash({"a": 1, "b": "x"}) != record_hash({"a": 1, "b": "y"})
+    assert len(record_hash({"a": 1})) == 8
+
+
+def test_sqlite_hash_store(tmp_path):
+    store = SQLiteHashStore(tmp_path / "hashes.sqlite3")
+    store.query_size = 2
+    store.put_many({f"key-{i}": bytes([i]) * 8 for i in range(5)})
+
+    assert store.get_many(["key-0", "key-3", "key-4", "missing"]) == {
+        "key-0": bytes([0]) * 8,
+        "key-3": bytes([3]) * 8,
+        "key-4": bytes([4]) * 8,
+    }
+    assert SQLiteHashStore(tmp_path / "hashes.sqlite3").get_many(["key-1"])
+
+
+def test_change_detector(tmp_path):
+    detector = ChangeDetector(SQLiteHashStore(tmp_path / "hashes.sqlite3"))
+    data = [{"Key": str(i), "Name": f"Contact {i}"} for i in range(4)]
+
+    assert detector.changed(data, "Contact", "Key") == data
+
+    results = [{"success": i != 2} for i in range(4)]
+    detector.record(results, data, "Contact", "Key")
+    data[1]["Name"] = "Renamed"
+    data.append({"Key": "4", "Name": "New"})
+
+    # changed, failed last time, new
+    changed = detector.changed(data, "Contact", "Key")
+    assert [record["Key"] for record in changed] == ["1", "2", "4"]
+    # the same key on another object is another record
+    assert detector.changed(data, "Account", "Key") == data
+
+
+@mock_s3
+def test_s3_hash_store(tmp_path):
+    s3_client = boto3.client("s3")
+    bucket_name = "a-bucket"
+    s3_client.create_bucket(
+        Bucket=bucket_name,
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+
+    store = S3HashStore(bucket_name, path=tmp_path / "first.sqlite3")
+    assert store.get_many(["key"]) == dict()
+    store.put_many({"key": b"12345678"})
+    store.save()
+
+    store = S3HashStore(bucket_name, path=tmp_path / "second.sqlite3")
+    assert store.get_many(["key"]) == {"key": b"12345678"}
@@ -0,0 +1,57 @@
+import boto3
+
+from moto import mock_s3
+
+from kicksaw_integration_utils.checkpoints import (
+    Checkpoint,
+    LocalCheckpointStore,
+    S3CheckpointStore,
+)
+
+
+def get_checkpoint():
+    return Checkpoint(
+        s3_object_key="origin/a_file.csv",
+        rows_read=20000,
+        batches_pushed=2,
+        error_count=3,
+        timestamp="20220101T1200",
+        error_report_file_name="error-report-20220101T1200.csv",
+    )
+
+
+def test_local_checkpoint_store(tmp_path):
+    store = LocalCheckpointStore(tmp_path)
+    checkpoint = get_checkpoint()
+
+    assert store.load(checkpoint.s3_object_key) is None
+
+    store.save(checkpoint)
+    assert store.load(checkpoint.s3_object_key) == checkpoint
+
+    store.clear(checkpoint.s3_object_key)
+    assert store.load(checkpoint.s3_object_key) is None
+
+
+@mock_s3
+def test_s3_checkpoint_store():
+    s3_client = boto3.client("s3")
+    bucket_name = "a-bucket"
+    s3_client.create_bucket(
+        Bucket=bucket_name,
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    store = S3CheckpointStore(bucket_name)
+    checkpoint = get_checkpoint()
+
+    assert store.load(checkpoint.s3_object_key) is None
+
+    store.save(checkpoint)
+    s3_object = s3_client.get_object(
+        Bucket=bucket_name, Key="checkpoints/origin/a_file.csv.json"
+    )
+    assert Checkpoint.parse_raw(s3_object["Body"].read()) == checkpoint
+    assert store.load(checkpoint.s3_object_key) == checkpoint
+
+    store.clear(checkpoint.s3_object_key)
+    assert store.load(checkpoint.s3_object_key) is None
@@ -1,7 +1,24 @@
 import csv
+import io
+import json
 import os
+import time
 
+from pathlib import Path
+from tempfile import gettempdir
+
+import pytest
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.change_detection import ChangeDetector, SQLiteHashStore
+from kicksaw_integration_utils.checkpoints import LocalCheckpointStore
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter
+from kicksaw_integration_utils.idempotency import (
+    InProgressError,
+    MemoryIdempotencyStore,
+)
 from kicksaw_integration_utils.orchestrator import Orchestrator
+from kicksaw_integration_utils.parquet_helpers import ERROR_REPORT_COLUMNS
 
 import kicksaw_integration_utils.orchestrator as orchestrator_module
 
@@ -15,7 +32,6 @@ def test_orchestrator(monkeypatch):
     monkeypatch.setattr(
         orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
     )
-    monkeypatch.setattr(orchestrator_module, "SfClient", MockSfClient)
 
     s3_key = "junk.csv"
     bucket = "a bucket"
@@ -130,3 +146,469 @@ def test_orchestrator(monkeypatch):
     assert orchestrator.error_file_s3_key == f"errors/error-report-{timestamp}.csv"
 
     os.remove(orchestrator.error_report_path)
+
+
+class PipelinedOrchestrator(Orchestrator):
+    def serialize(self, rows):
+        data = [{"ID": row["ID"], "LastName": row["Name"]} for row in rows]
+        yield data, "Contact", "ID"
+
+    def push(self, data, salesforce_object, upsert_key):
+        return [
+            {
+                "success": item["ID"] != "1",
+                "created": True,
+                "Id": item["ID"],
+                "errors": []
+                if item["ID"] != "1"
+                else [{"statusCode": "DIDNT_WORK", "message": "it broke"}],
+            }
+            for item in data
+        ]
+
+    @property
+    def execution_sfdc_hash(self):
+        return {"Errors_Count__c": self.error_count}
+
+
+class MockSObject:
+    def __init__(self) -> None:
+        self.created = []
+
+    def create(self, data):
+        self.created.append(data)
+
+
+def test_orchestrator_run(monkeypatch):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    moved = []
+    monkeypatch.setattr(
+        orchestrator_module, "move_file", lambda *args: moved.append(args)
+    )
+    uploaded = []
+    monkeypatch.setattr(
+        orchestrator_module, "upload_file", lambda *args: uploaded.append(args)
+    )
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    orchestrator = PipelinedOrchestrator(
+        "junk.csv",
+        "a bucket",
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+    )
+    orchestrator.run(chunk_size=1, max_workers=2)
+
+    with open(orchestrator.error_report_path) as error_report:
+        rows = list(csv.DictReader(error_report))
+    assert len(rows) == 1
+    assert rows[0]["code"] == "DIDNT_WORK"
+    assert rows[0]["upsert_key_value"] == "1"
+    assert orchestrator.error_count == 1
+
+    assert moved == [("junk.csv", orchestrator.archive_file_s3_key, "a bucket")]
+    assert uploaded[0][2] == orchestrator.error_file_s3_key
+    assert sf_client.Execution__c.created == [{"Errors_Count__c": 1}]
+
+    os.remove(orchestrator.error_report_path)
+
+
+def test_orchestrator_run_writes_parquet_report(monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    uploaded = []
+    monkeypatch.setattr(
+        orchestrator_module,
+        "upload_file",
+        lambda *args: uploaded.append(pq.read_table(str(args[0])).to_pylist()),
+    )
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    orchestrator = PipelinedOrchestrator(
+        "junk.csv",
+        "a bucket",
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+        report_format="parquet",
+    )
+    orchestrator.run(chunk_size=1)
+
+    assert orchestrator.error_file_s3_key.endswith(".parquet")
+    # the report was finished before it was uploaded
+    assert orchestrator.report_writer is None
+    assert len(uploaded[0]) == 1
+    assert uploaded[0][0]["code"] == "DIDNT_WORK"
+    assert uploaded[0][0]["upsert_key_value"] == "1"
+    assert json.loads(uploaded[0][0]["object_json"]) == {"ID": "1", "LastName": "Bob"}
+
+    os.remove(orchestrator.error_report_path)
+
+
+class SlowOrchestrator(PipelinedOrchestrator):
+    def push(self, data, salesforce_object, upsert_key):
+        # as if later bulk jobs spent longer polling
+        time.sleep(0.05 * int(data[0]["ID"]))
+        return super().push(data, salesforce_object, upsert_key)
+
+
+def test_orchestrator_run_doesnt_back_off_on_latency(monkeypatch):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    orchestrator = SlowOrchestrator(
+        "junk.csv",
+        "a bucket",
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+    )
+    limiter = AdaptiveLimiter(initial_limit=2, latency_tolerance=2)
+    orchestrator.run(chunk_size=1, max_workers=4, limiter=limiter)
+
+    assert limiter.limit > 2
+    assert limiter.in_flight == 0
+
+    os.remove(orchestrator.error_report_path)
+
+
+class LockedOrchestrator(PipelinedOrchestrator):
+    def push(self, data, salesforce_object, upsert_key):
+        results = super().push(data, salesforce_object, upsert_key)
+        for result, item in zip(results, data):
+            if item["ID"] == "2":
+                result["success"] = False
+                result["errors"] = [
+                    {"statusCode": "UNABLE_TO_LOCK_ROW", "message": "locked"}
+                ]
+        return results
+
+
+def test_orchestrator_run_adapts_concurrency(monkeypatch):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    orchestrator = LockedOrchestrator(
+        "junk.csv",
+        "a bucket",
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+    )
+    limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+    orchestrator.run(chunk_size=1, max_workers=4, limiter=limiter)
+
+    # the lock error backed off, the other two batches grew the limit back a bit
+    assert 2 <= limiter.limit < 4
+    assert limiter.in_flight == 0
+    assert orchestrator.error_count == 2
+
+    os.remove(orchestrator.error_report_path)
+
+
+class CountingOrchestrator(PipelinedOrchestrator):
+    def push(self, data, salesforce_object, upsert_key):
+        self.pushed = getattr(self, "pushed", []) + [item["ID"] for item in data]
+        return super().push(data, salesforce_object, upsert_key)
+
+
+def test_orchestrator_run_skips_unchanged_records(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    pushed = []
+    for _ in range(2):
+        orchestrator = CountingOrchestrator(
+            "junk.csv",
+            "a bucket",
+            sf_client=sf_client,
+            execution_object_name="Execution__c",
+            change_detector=ChangeDetector(SQLiteHashStore(tmp_path / "hashes")),
+        )
+        orchestrator.run(chunk_size=1, max_workers=2)
+        pushed.append(sorted(orchestrator.pushed))
+        os.remove(orchestrator.error_report_path)
+
+    # 1 failed the first time, so it's the only one pushed again
+    assert pushed == [["1", "2", "3"], ["1"]]
+
+
+class FlakyOrchestrator(PipelinedOrchestrator):
+    fail_on = None
+    pushed = []
+
+    def push(self, data, salesforce_object, upsert_key):
+        if data[0]["ID"] == self.fail_on:
+            raise TimeoutError("Lambda timed out")
+        self.pushed.append(data[0]["ID"])
+        return super().push(data, salesforce_object, upsert_key)
+
+
+def test_orchestrator_resumes_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+
+    store = LocalCheckpointStore(tmp_path)
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    kwargs = dict(
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+        checkpoint_store=store,
+    )
+
+    FlakyOrchestrator.fail_on = "3"
+    orchestrator = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    with pytest.raises(TimeoutError):
+        orchestrator.run(chunk_size=1, max_workers=1)
+
+    checkpoint = store.load("junk.csv")
+    assert checkpoint.rows_read == 2
+    assert checkpoint.batches_pushed == 2
+    assert checkpoint.error_count == 1
+    assert FlakyOrchestrator.pushed == ["1", "2"]
+
+    FlakyOrchestrator.fail_on = None
+    resumed = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    assert resumed.error_report_path == orchestrator.error_report_path
+    resumed.run(chunk_size=1, max_workers=1)
+
+    assert FlakyOrchestrator.pushed == ["1", "2", "3"]
+    assert resumed.error_count == 1
+    assert sf_client.Execution__c.created == [{"Errors_Count__c": 1}]
+    assert store.load("junk.csv") is None
+
+    os.remove(resumed.error_report_path)
+
+
+def fake_s3(monkeypatch) -> dict:
+    """
+    Keeps what the orchestrator uploads in a dict, and downloads it back
+    """
+    uploaded = dict()
+
+    def upload_file(path, bucket_name, s3_object_key):
+        uploaded[s3_object_key] = Path(path).read_bytes()
+        uploads.append(s3_object_key)
+
+    def download_file(s3_object_key, bucket_name):
+        if s3_object_key not in uploaded:
+            return "tests/sample.csv"
+        path = Path(os.getenv("TEMP", gettempdir())) / s3_object_key
+        path.write_bytes(uploaded[s3_object_key])
+        return path
+
+    uploads = uploaded["uploads"] = list()
+    monkeypatch.setattr(orchestrator_module, "download_file", download_file)
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", upload_file)
+    return uploaded
+
+
+def test_orchestrator_resume_discards_stale_report(monkeypatch, tmp_path):
+    fake_s3(monkeypatch)
+
+    store = LocalCheckpointStore(tmp_path)
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    kwargs = dict(
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+        checkpoint_store=store,
+    )
+
+    FlakyOrchestrator.pushed = []
+    FlakyOrchestrator.fail_on = "3"
+    orchestrator = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    with pytest.raises(TimeoutError):
+        orchestrator.run(chunk_size=1, max_workers=1)
+    # as if a batch after the checkpoint had logged an error before the crash
+    orchestrator.create_error_report_file(
+        [dict.fromkeys(ERROR_REPORT_COLUMNS, "stale")]
+    )
+
+    FlakyOrchestrator.fail_on = None
+    resumed = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    assert not os.path.isfile(resumed.get_report_path())
+    with open(resumed.get_report_part_path(0)) as error_report:
+        assert [row["code"] for row in csv.DictReader(error_report)] == ["DIDNT_WORK"]
+
+    # a checkpoint without errors leaves no report at all
+    store.save(store.load("junk.csv").copy(update={"report_parts": 0}))
+    FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    assert not list(resumed.error_report_path.parent.glob("*.part-*"))
+
+
+class FailingOrchestrator(FlakyOrchestrator):
+    def push(self, data, salesforce_object, upsert_key):
+        results = super().push(data, salesforce_object, upsert_key)
+        error = {"statusCode": "DIDNT_WORK", "message": "it broke"}
+        return [{**result, "success": False, "errors": [error]} for result in results]
+
+
+def read_report(report_format: str, report: bytes) -> list:
+    if report_format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(io.BytesIO(report)).column("upsert_key_value").to_pylist()
+    rows = csv.DictReader(io.StringIO(report.decode()))
+    return [row["upsert_key_value"] for row in rows]
+
+
+@pytest.mark.parametrize("report_format", ["csv", "parquet"])
+def test_orchestrator_checkpoints_report_in_parts(monkeypatch, tmp_path, report_format):
+    if report_format == "parquet":
+        pytest.importorskip("pyarrow")
+    uploaded = fake_s3(monkeypatch)
+    store = LocalCheckpointStore(tmp_path)
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    kwargs = dict(
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+        checkpoint_store=store,
+        report_format=report_format,
+    )
+
+    FailingOrchestrator.pushed = []
+    FailingOrchestrator.fail_on = "3"
+    orchestrator = FailingOrchestrator("junk.csv", "a bucket", **kwargs)
+    with pytest.raises(TimeoutError):
+        orchestrator.run(chunk_size=1, max_workers=1)
+    assert store.load("junk.csv").report_parts == 2
+
+    FailingOrchestrator.fail_on = None
+    resumed = FailingOrchestrator("junk.csv", "a bucket", **kwargs)
+    resumed.run(chunk_size=1, max_workers=1)
+
+    # each checkpoint uploaded only its own part, merged once at the end
+    parts = [resumed.get_report_part_s3_key(index) for index in range(3)]
+    assert uploaded["uploads"] == parts + [resumed.error_file_s3_key]
+    report = uploaded[resumed.error_file_s3_key]
+    assert read_report(report_format, report) == ["1", "2", "3"]
+    assert not list(resumed.error_report_path.parent.glob("*.part-*"))
+
+    os.remove(resumed.error_report_path)
+
+
+def test_orchestrator_skips_processed_files(monkeypatch):
+    downloaded = []
+    monkeypatch.setattr(
+        orchestrator_module,
+        "download_file",
+        lambda *args: downloaded.append(args) or "tests/sample.csv",
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+    monkeypatch.setattr(
+        FlakyOrchestrator,
+        "get_idempotency_key",
+        lambda self: f"s3://{self.bucket_name}/{self.s3_object_key}#etag",
+    )
+
+    store = MemoryIdempotencyStore()
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    kwargs = dict(
+        sf_client=sf_client,
+        execution_object_name="Execution__c",
+        idempotency_store=store,
+    )
+
+    FlakyOrchestrator.pushed = []
+    FlakyOrchestrator.fail_on = "2"
+    orchestrator = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    # a concurrent delivery is retried later, in case this one fails
+    with pytest.raises(InProgressError):
+        FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    with pytest.raises(TimeoutError):
+        orchestrator.run(chunk_size=1, max_workers=1)
+
+    # the failure was released, so the retry goes through
+    FlakyOrchestrator.fail_on = None
+    retried = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    assert not retried.skipped
+    retried.run(chunk_size=1, max_workers=1)
+    assert sf_client.Execution__c.created == [{"Errors_Count__c": 1}]
+    assert len(downloaded) == 2
+
+    duplicate = FlakyOrchestrator("junk.csv", "a bucket", **kwargs)
+    assert duplicate.skipped
+    assert duplicate.downloaded_file is None
+    assert duplicate.run(chunk_size=1, max_workers=1) is None
+    assert sf_client.Execution__c.created == [{"Errors_Count__c": 1}]
+    assert len(downloaded) == 2
+
+    os.remove(retried.error_report_path)
+
+
+def test_orchestrator_releases_files_it_fails_to_download(monkeypatch):
+    def download_file(*args):
+        raise ConnectionError("s3 is down")
+
+    monkeypatch.setattr(orchestrator_module, "download_file", download_file)
+    monkeypatch.setattr(
+        Orchestrator,
+        "get_idempotency_key",
+        lambda self: f"s3://{self.bucket_name}/{self.s3_object_key}#etag",
+    )
+    store = MemoryIdempotencyStore()
+
+    with pytest.raises(ConnectionError):
+        Orchestrator("junk.csv", "a bucket", idempotency_store=store)
+    assert store.claim("s3://a bucket/junk.csv#etag")
+
+
+def test_orchestrator_run_is_instrumented(monkeypatch):
+    monkeypatch.setattr(
+        orchestrator_module, "download_file", lambda *args: "tests/sample.csv"
+    )
+    monkeypatch.setattr(orchestrator_module, "move_file", lambda *args: None)
+    monkeypatch.setattr(orchestrator_module, "upload_file", lambda *args: None)
+
+    sf_client = MockSfClient()
+    sf_client.Execution__c = MockSObject()
+    instrumentation.enable(instrumentation.LoggingExporter())
+    try:
+        orchestrator = PipelinedOrchestrator(
+            "junk.csv",
+            "a bucket",
+            sf_client=sf_client,
+            execution_object_name="Execution__c",
+        )
+        orchestrator.run(chunk_size=2, max_workers=2)
+        metrics = {point.name: point for point in instrumentation.flush()}
+    finally:
+        instrumentation.disable()
+
+    assert metrics["orchestrator.download"].count == 1
+    assert metrics["orchestrator.push"].count == 2
+    assert metrics["orchestrator.log_batch"].count == 2
+    assert metrics["orchestrator.records_pushed"].value == 3
+    assert metrics["orchestrator.record_errors"].value == 1
+    for step in ("archive_file", "upload_error_report", "create_execution_object"):
+        assert metrics[f"orchestrator.{step}"].count == 1
+    assert metrics["orchestrator.run"].count == 1
+
+    os.remove(orchestrator.error_report_path)
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from botocore.exceptions import ClientError
+
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter, is_throttling_error
+
+
+def throttling_error():
+    return ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+        "SendMessageBatch",
+    )
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(throttling_error())
+    assert is_throttling_error(Exception("UNABLE_TO_LOCK_ROW: unable to obtain lock"))
+    assert not is_throttling_error(ValueError("bad data"))
+
+
+def test_limit_grows_while_calls_go_well():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4, latency_tolerance=None)
+
+    for _ in range(2):
+        limiter.call(lambda: None)
+    # 2 + 1 / 2, then 2.5 + 1 / 2.5
+    assert limiter.limit == pytest.approx(2.9)
+
+    for _ in range(100):
+        limiter.call(lambda: None)
+    assert limiter.limit == 4
+
+
+def test_limit_backs_off_once_per_wave():
+    limiter = AdaptiveLimiter(initial_limit=8, latency_tolerance=None)
+    started = [limiter.acquire() for _ in range(4)]
+
+    # the whole wave was throttled, but it only counts once
+    for started_at in started:
+        limiter.release(started_at, throttled=True, failed=True)
+    assert limiter.limit == 4
+
+    with pytest.raises(ClientError):
+        limiter.call(lambda: (_ for _ in ()).throw(throttling_error()))
+    assert limiter.limit == 2
+
+    # errors that aren't throttling leave the limit alone
+    with pytest.raises(ValueError):
+        limiter.call(lambda: (_ for _ in ()).throw(ValueError()))
+    assert limiter.limit == 2
+
+
+def test_throttled_results_back_off():
+    limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=None)
+
+    assert limiter.call(lambda: "locked", throttled=lambda r: r == "locked")
+    assert limiter.limit == 2
+
+
+def test_slow_calls_back_off():
+    limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=2)
+
+    limiter.call(time.sleep, 0.01)
+    limiter.call(time.sleep, 0.05)
+    assert limiter.limit < 4
+
+
+def test_untimed_calls_dont_back_off_for_latency():
+    limiter = AdaptiveLimiter(initial_limit=4, latency_tolerance=2)
+
+    limiter.call(time.sleep, 0.01)
+    started_at = limiter.acquire()
+    time.sleep(0.05)
+    limiter.release(started_at, timed=False)
+    assert limiter.limit > 4
+
+    limit = limiter.limit
+    limiter.call(time.sleep, 0.05, timed=False)
+    assert limiter.limit > limit
+
+
+def test_calls_in_flight_stay_under_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=3, latency_tolerance=None)
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def work():
+        with lock:
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda _: limiter.call(work), range(30)))
+
+    assert 2 <= most_in_flight[0] <= 3
+    assert limiter.in_flight == 0
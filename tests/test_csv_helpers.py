@@ -0,0 +1,99 @@
+import boto3
+import pytest
+
+from moto import mock_s3
+from pydantic import BaseModel, Field
+
+from kicksaw_integration_utils.csv_helpers import (
+    iter_csv_rows,
+    open_s3_csv,
+    read_csv_batches,
+)
+
+
+class Contact(BaseModel):
+    External_Id__c: int = Field(alias="ID")
+    LastName: str = Field(alias="Name")
+
+
+def to_contact(row: dict) -> dict:
+    return {"External_Id__c": row["ID"], "LastName": row["Name"].upper()}
+
+
+@pytest.fixture(scope="function")
+def big_csv(tmp_path):
+    path = tmp_path / "big.csv"
+    lines = ["ID,Name"] + [f"{i},Person {i}" for i in range(2500)]
+    lines[10] = "not a number,Broken"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_iter_csv_rows():
+    rows = list(iter_csv_rows("tests/sample.csv"))
+    assert rows == [
+        {"ID": "1", "Name": "Bob"},
+        {"ID": "2", "Name": "Sarah"},
+        {"ID": "3", "Name": "Jack"},
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_read_csv_batches_with_model(big_csv, max_workers):
+    batches = list(
+        read_csv_batches(
+            big_csv, batch_size=1000, model=Contact, max_workers=max_workers
+        )
+    )
+
+    assert [len(records) for records, _ in batches] == [1000, 1000, 499]
+    assert batches[0][0][0] == {"External_Id__c": 0, "LastName": "Person 0"}
+
+    errors = [error for _, batch_errors in batches for error in batch_errors]
+    assert len(errors) == 1
+    assert errors[0]["row_number"] == 10
+    assert errors[0]["object_json"] == {"ID": "not a number", "Name": "Broken"}
+
+
+def test_read_csv_batches_with_mapper():
+    batches = list(
+        read_csv_batches("tests/sample.csv", batch_size=2, mapper=to_contact)
+    )
+
+    assert batches == [
+        (
+            [
+                {"External_Id__c": "1", "LastName": "BOB"},
+                {"External_Id__c": "2", "LastName": "SARAH"},
+            ],
+            [],
+        ),
+        ([{"External_Id__c": "3", "LastName": "JACK"}], []),
+    ]
+
+
+@mock_s3
+def test_read_csv_batches_from_s3():
+    s3_client = boto3.client("s3")
+    bucket_name = "a-bucket"
+    s3_client.create_bucket(
+        Bucket=bucket_name,
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    s3_client.put_object(
+        Bucket=bucket_name, Key="contacts.csv", Body="\ufeffID,Name\n1,Bob\n2,Sarah\n"
+    )
+
+    batches = list(
+        read_csv_batches(open_s3_csv("contacts.csv", bucket_name), model=Contact)
+    )
+
+    assert batches == [
+        (
+            [
+                {"External_Id__c": 1, "LastName": "Bob"},
+                {"External_Id__c": 2, "LastName": "Sarah"},
+            ],
+            [],
+        )
+    ]
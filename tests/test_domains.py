@@ -0,0 +1,79 @@
+import pytest
+
+from kicksaw_integration_utils.domains import (
+    PublicSuffixList,
+    get_public_suffix_list,
+    registered_domain,
+    registered_domains,
+)
+
+RULES = """
+// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+*.ck
+!www.ck
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+github.io
+// ===END PRIVATE DOMAINS===
+"""
+
+
+@pytest.mark.parametrize(
+    "host,public_suffix,domain",
+    [
+        ("example.com", "com", "example.com"),
+        ("a.b.example.co.uk", "co.uk", "example.co.uk"),
+        ("co.uk", "co.uk", None),
+        ("shop.example.ck", "example.ck", "shop.example.ck"),
+        ("www.ck", "ck", "www.ck"),
+        ("example.unlisted", "unlisted", "example.unlisted"),
+        ("Blog.Example.COM.", "com", "example.com"),
+        ("a..com", None, None),
+        ("", None, None),
+    ],
+)
+def test_public_suffix_list(host, public_suffix, domain):
+    suffix_list = PublicSuffixList(RULES)
+
+    assert suffix_list.public_suffix(host) == public_suffix
+    assert suffix_list.registered_domain(host) == domain
+
+
+def test_private_domains():
+    assert PublicSuffixList(RULES).registered_domain("me.github.io") == "github.io"
+    assert (
+        PublicSuffixList(RULES, include_private=True).registered_domain("me.github.io")
+        == "me.github.io"
+    )
+
+
+@pytest.mark.parametrize(
+    "host,domain",
+    [
+        ("www.bbc.co.uk", "bbc.co.uk"),
+        ("city.kawasaki.jp", "city.kawasaki.jp"),
+        ("shop.example.kawasaki.jp", "shop.example.kawasaki.jp"),
+        ("例え.公司.cn", "例え.公司.cn"),
+        ("xn--r8jz45g.xn--55qx5d.cn", "xn--r8jz45g.xn--55qx5d.cn"),
+    ],
+)
+def test_bundled_list(host, domain):
+    assert registered_domain(host) == domain
+
+
+def test_bundled_list_is_parsed_once():
+    assert get_public_suffix_list() is get_public_suffix_list()
+
+
+def test_registered_domains():
+    hosts = ["a.example.com", "b.example.co.uk", "a.example.com", "co.uk"]
+
+    assert registered_domains(hosts) == [
+        "example.com",
+        "example.co.uk",
+        "example.com",
+        None,
+    ]
@@ -1,6 +1,11 @@
 import pytest
 
-from kicksaw_integration_utils.field_formatters import convert_to_iso_date
+from kicksaw_integration_utils import field_formatters
+from kicksaw_integration_utils.field_formatters import (
+    convert_column_to_iso_date,
+    convert_to_iso_date,
+    format_column,
+)
 
 
 @pytest.mark.parametrize(
@@ -21,3 +26,62 @@ from kicksaw_integration_utils.field_formatters import convert_to_iso_date
 def test_format_date(date_string, expected_date):
     result = convert_to_iso_date(date_string)
     assert result == expected_date
+
+
+COLUMN = [
+    "19700122",
+    "1999/05/16",
+    "/05/16",
+    "99999999",
+    "19870229",
+    None,
+    "10000101",
+    "19700122",
+    "",
+]
+EXPECTED_COLUMN = [convert_to_iso_date(value) for value in COLUMN]
+
+
+def test_convert_column_to_iso_date():
+    assert convert_column_to_iso_date(COLUMN) == EXPECTED_COLUMN
+    assert convert_column_to_iso_date([]) == []
+
+
+def test_convert_column_to_iso_date_without_pandas(monkeypatch):
+    monkeypatch.setattr(field_formatters, "_pandas", lambda: None)
+
+    assert convert_column_to_iso_date(COLUMN) == EXPECTED_COLUMN
+
+
+def test_convert_column_to_iso_date_with_pandas():
+    pd = pytest.importorskip("pandas")
+    np = pytest.importorskip("numpy")
+
+    series = pd.Series(COLUMN + [np.nan, 20220101], index=range(10, 21), name="Date")
+    result = convert_column_to_iso_date(series)
+
+    assert isinstance(result, pd.Series)
+    assert result.name == "Date"
+    assert list(result.index) == list(series.index)
+    assert result.tolist() == EXPECTED_COLUMN + [None, "2022-01-01"]
+
+    result = convert_column_to_iso_date(np.array(COLUMN, dtype=object))
+    assert isinstance(result, np.ndarray)
+    assert result.tolist() == EXPECTED_COLUMN
+
+
+def test_format_column_calls_formatter_once_per_value():
+    calls = list()
+
+    def formatter(value):
+        calls.append(value)
+        return value.upper()
+
+    assert format_column(["a", "b", None, "a", "b"], formatter) == [
+        "A",
+        "B",
+        None,
+        "A",
+        "B",
+    ]
+    assert calls == ["a", "b"]
@@ -0,0 +1,130 @@
+import pickle
+
+import pytest
+
+from pydantic import ValidationError
+
+from kicksaw_integration_utils.field_mapping import (
+    compile_column_mapping,
+    compile_mapping,
+    register_formatter,
+)
+
+MAPPING = {
+    "fields": {
+        "Name": "name",
+        "Website": {"source": "url", "formatters": ["extract_root_domain"]},
+        "Birthdate": {"source": "dob", "formatters": ["iso_date"]},
+        "Industry": {
+            "source": "sector",
+            "formatters": ["strip", "lower"],
+            "lookup": {"tech": "Technology"},
+            "default": "Other",
+        },
+        "LeadSource": {"constant": "Integration"},
+        "Missing": {"source": "not_a_column"},
+    }
+}
+
+ROWS = [
+    {
+        "name": "Acme",
+        "url": "https://www.shop.acme.com/about",
+        "dob": "1999/01/02",
+        "sector": " Tech ",
+    },
+    {"name": "Globex", "url": "", "dob": "", "sector": "mining"},
+]
+
+EXPECTED = [
+    {
+        "Name": "Acme",
+        "Website": "acme.com",
+        "Birthdate": "1999-01-02",
+        "Industry": "Technology",
+        "LeadSource": "Integration",
+        "Missing": None,
+    },
+    {
+        "Name": "Globex",
+        "Website": None,
+        "Birthdate": None,
+        "Industry": "Other",
+        "LeadSource": "Integration",
+        "Missing": None,
+    },
+]
+
+
+def test_row_mapper():
+    mapper = compile_mapping(MAPPING)
+
+    assert list(mapper.map_rows(ROWS)) == EXPECTED
+    assert pickle.loads(pickle.dumps(mapper))(ROWS[0]) == EXPECTED[0]
+
+
+def test_column_mapper():
+    mapper = compile_column_mapping(MAPPING)
+    columns = {name: [row[name] for row in ROWS] for name in ROWS[0]}
+
+    mapped = mapper(columns)
+
+    assert mapped == {
+        target: [record[target] for record in EXPECTED] for target in EXPECTED[0]
+    }
+
+
+def test_column_mapper_with_data_frame():
+    pd = pytest.importorskip("pandas")
+
+    mapped = compile_column_mapping(MAPPING)(pd.DataFrame(ROWS))
+
+    assert mapped.to_dict(orient="records") == EXPECTED
+
+
+def test_row_and_column_mappers_agree_on_values_that_arent_strings():
+    mapping = {
+        "fields": {
+            "Code": {"source": "code", "formatters": ["strip", "upper"]},
+            "Birthdate": {"source": "dob", "formatters": ["iso_date"]},
+            "Size": {"source": "size", "lookup": {1: "Small"}},
+        }
+    }
+    rows = [
+        {"code": 12, "dob": 19990102, "size": 1},
+        {"code": float("nan"), "dob": None, "size": 2},
+    ]
+    columns = {name: [row[name] for row in rows] for name in rows[0]}
+
+    records = list(compile_mapping(mapping).map_rows(rows))
+    mapped = compile_column_mapping(mapping)(columns)
+
+    assert records == [
+        {"Code": "12", "Birthdate": "1999-01-02", "Size": "Small"},
+        {"Code": None, "Birthdate": None, "Size": None},
+    ]
+    assert mapped == {
+        target: [record[target] for record in records] for target in records[0]
+    }
+
+
+def test_register_formatter():
+    register_formatter("reverse", lambda value: value[::-1])
+    mapper = compile_mapping(
+        {"fields": {"Name": {"source": "name", "formatters": ["reverse"]}}}
+    )
+
+    assert mapper({"name": "abc"}) == {"Name": "cba"}
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"source": "name", "formatters": ["not_a_formatter"]},
+        {"default": "nothing to map"},
+        {"source": "name", "constant": "both"},
+    ],
+)
+def test_invalid_specs(spec):
+    with pytest.raises(ValidationError):
+        compile_mapping({"fields": {"Name": spec}})
@@ -0,0 +1,133 @@
+import time
+
+import boto3
+import pytest
+
+from moto import mock_dynamodb
+
+from kicksaw_integration_utils.governor import (
+    ApiUsage,
+    DynamoDBGovernorStore,
+    SalesforceGovernor,
+    SQLiteGovernorStore,
+    TokenBucket,
+    parse_limit_info,
+)
+
+
+class Response:
+    def __init__(self, status_code=200, text="", limit_info=None) -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = {"Sforce-Limit-Info": limit_info} if limit_info else dict()
+
+
+def test_parse_limit_info():
+    header = "api-usage=25/15000, per-app-api-usage=17/250(appName=an-app)"
+    assert parse_limit_info(header) == {
+        "api-usage": (25, 15000),
+        "per-app-api-usage": (17, 250),
+    }
+    assert parse_limit_info(None) == dict()
+    assert parse_limit_info("api-usage=garbage") == dict()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=200, capacity=1)
+
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(21)]
+    elapsed = time.monotonic() - start
+
+    assert waits[0] == 0
+    assert elapsed >= 0.09
+
+
+def test_token_bucket_refund():
+    bucket = TokenBucket(rate=1, capacity=10)
+
+    bucket.acquire(10)
+    bucket.refund(4)
+    assert bucket.acquire(4) == 0
+    # never more than capacity
+    bucket.refund(100)
+    assert bucket.tokens == 10
+
+
+def test_rate_drops_past_soft_limit():
+    governor = SalesforceGovernor(rate=10, min_rate=1, soft_limit=0.5, hard_limit=0.9)
+
+    governor.observe(Response(limit_info="api-usage=100/1000"))
+    assert governor.effective_rate() == 10
+    governor.observe(Response(limit_info="api-usage=700/1000"))
+    assert governor.effective_rate() == pytest.approx(5)
+    assert governor.bucket.rate == pytest.approx(5)
+    governor.observe(Response(limit_info="api-usage=950/1000"))
+    assert governor.effective_rate() == 1
+
+
+def test_daily_limit_exceeded_is_not_retried():
+    governor = SalesforceGovernor(min_rate=1)
+    governor.observe(Response(limit_info="api-usage=10/1000"))
+
+    response = Response(
+        403,
+        '[{"message":"TotalRequests Limit exceeded.",'
+        '"errorCode":"REQUEST_LIMIT_EXCEEDED"}]',
+    )
+    assert not governor.observe(response)
+    assert governor.usage.fraction == 1
+    assert governor.effective_rate() == 1
+
+
+def test_concurrent_limit_exceeded_pauses():
+    governor = SalesforceGovernor(pause_seconds=0.05)
+
+    response = Response(
+        403,
+        '[{"message":"ConcurrentPerOrgLongTxn Limit exceeded.",'
+        '"errorCode":"REQUEST_LIMIT_EXCEEDED"}]',
+    )
+    assert governor.observe(response)
+    assert governor.usage.paused_until > time.time()
+
+    start = time.monotonic()
+    governor.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_sqlite_store_shares_usage(tmp_path):
+    path = tmp_path / "governor.sqlite3"
+    one = SalesforceGovernor(store=SQLiteGovernorStore(path), sync_interval=0)
+    two = SalesforceGovernor(store=SQLiteGovernorStore(path), sync_interval=0)
+
+    one.observe(Response(limit_info="api-usage=900/1000"))
+    one.sync()
+    two.sync()
+
+    assert two.usage.used == 900
+    assert two.effective_rate() < two.rate
+
+    # older numbers don't overwrite newer ones
+    stale = ApiUsage(used=1, limit=1000, observed_at=1)
+    assert SQLiteGovernorStore(path).merge("salesforce", stale).used == 900
+
+
+@mock_dynamodb
+def test_dynamodb_store_shares_usage():
+    client = boto3.client("dynamodb", region_name="us-east-1")
+    store = DynamoDBGovernorStore("governor", client=client)
+    store.create_table()
+    one = SalesforceGovernor(store=store, sync_interval=0)
+    two = SalesforceGovernor(store=store, sync_interval=0)
+
+    one.observe(Response(limit_info="api-usage=900/1000"))
+    one.observe(Response(403, "ConcurrentRequests REQUEST_LIMIT_EXCEEDED"))
+    two.sync()
+
+    assert two.usage.used == 900
+    assert two.usage.limit == 1000
+    assert two.usage.paused_until == one.usage.paused_until
+
+    stale = ApiUsage(used=1, limit=1000, observed_at=1)
+    assert store.merge("salesforce", stale).used == 900
@@ -0,0 +1,105 @@
+import time
+
+import boto3
+import pytest
+
+from moto import mock_dynamodb
+
+from kicksaw_integration_utils.idempotency import (
+    Claim,
+    DynamoDBIdempotencyStore,
+    MemoryIdempotencyStore,
+    SQLiteIdempotencyStore,
+    get_s3_idempotency_key,
+)
+
+
+def check_store(store):
+    assert store.claim("a") == Claim.CLAIMED
+    assert store.claim("a") == Claim.IN_PROGRESS
+    assert not store.claim("a")
+
+    store.release("a")
+    assert store.claim("a")
+
+    store.complete("a")
+    assert store.claim("a") == Claim.COMPLETED
+    assert not store.claim("a")
+    assert store.claim("b")
+
+
+def test_memory_idempotency_store():
+    check_store(MemoryIdempotencyStore())
+
+
+def test_memory_idempotency_store_evicts_least_recently_used():
+    store = MemoryIdempotencyStore(max_size=2)
+    assert store.claim("a")
+    assert store.claim("b")
+    assert not store.claim("a")
+    assert store.claim("c")
+
+    assert list(store.keys) == ["a", "c"]
+    assert store.claim("b")
+
+
+def test_sqlite_idempotency_store(tmp_path):
+    path = tmp_path / "idempotency.sqlite3"
+    check_store(SQLiteIdempotencyStore(path))
+
+    # shared through the file
+    store = SQLiteIdempotencyStore(path)
+    assert not store.claim("a")
+    assert store.claim("c")
+
+
+def test_sqlite_idempotency_store_expires_keys(tmp_path):
+    store = SQLiteIdempotencyStore(tmp_path / "idempotency.sqlite3", lease_seconds=0)
+    assert store.claim("a")
+    # the lease ran out, e.g., the Lambda holding it timed out
+    assert store.claim("a")
+
+    store.ttl = 0
+    store.complete("a")
+    assert store.claim("a")
+
+    store.purge()
+    assert store.connection.execute("SELECT count(*) FROM idempotency").fetchone() == (
+        0,
+    )
+
+
+@mock_dynamodb
+def test_dynamodb_idempotency_store():
+    client = boto3.client("dynamodb", region_name="us-east-1")
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+    store.create_table()
+    check_store(store)
+
+    item = client.get_item(
+        TableName="idempotency", Key={"idempotency_key": {"S": "a"}}
+    )["Item"]
+    assert item["status"] == {"S": "completed"}
+    assert int(item["expires_at"]["N"]) > time.time() + store.ttl - 60
+
+
+@mock_dynamodb
+def test_dynamodb_idempotency_store_expires_keys():
+    client = boto3.client("dynamodb", region_name="us-east-1")
+    store = DynamoDBIdempotencyStore("idempotency", client=client, lease_seconds=-1)
+    store.create_table()
+    assert store.claim("a")
+    assert store.claim("a")
+
+
+@pytest.mark.parametrize(
+    "etag, version_id, expected",
+    [
+        (None, None, "s3://bucket/origin/a_file.csv"),
+        ('"abc123"', None, "s3://bucket/origin/a_file.csv#abc123"),
+        ("abc123", "v1", "s3://bucket/origin/a_file.csv?versionId=v1#abc123"),
+    ],
+)
+def test_get_s3_idempotency_key(etag, version_id, expected):
+    key = get_s3_idempotency_key("bucket", "origin/a_file.csv", etag, version_id)
+    assert key == expected
@@ -0,0 +1,67 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import kicksaw_integration_utils
+
+HEAVY_MODULES = ["boto3", "simple_salesforce", "requests", "pandas", "opentelemetry"]
+
+
+def loaded_modules(*statements: str) -> set:
+    """
+    Runs statements in a fresh interpreter and returns which of HEAVY_MODULES
+    they loaded
+    """
+    code = "\n".join(
+        ["import json, sys"]
+        + list(statements)
+        + [f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"]
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "kicksaw_integration_utils",
+        "kicksaw_integration_utils.aws",
+        "kicksaw_integration_utils.aws.sqs",
+        "kicksaw_integration_utils.field_mapping",
+        "kicksaw_integration_utils.idempotency",
+        "kicksaw_integration_utils.instrumentation",
+        "kicksaw_integration_utils.orchestrator",
+        "kicksaw_integration_utils.s3_helpers",
+        "kicksaw_integration_utils.utils",
+    ],
+)
+def test_import_is_lazy(module):
+    assert loaded_modules(f"import {module}") == set()
+
+
+def test_heavy_modules_load_on_first_use():
+    loaded = loaded_modules(
+        "from kicksaw_integration_utils import SalesforceClient",
+        "from kicksaw_integration_utils.s3_helpers import get_s3_client",
+        "get_s3_client()",
+    )
+    assert {"boto3", "simple_salesforce", "requests"} <= loaded
+
+
+def test_lazy_exports():
+    from kicksaw_integration_utils import aws
+    from kicksaw_integration_utils.aws.sqs import SQSQueue
+    from kicksaw_integration_utils.orchestrator import Orchestrator
+    from kicksaw_integration_utils.salesforce_client import SfClient
+
+    assert kicksaw_integration_utils.Orchestrator is Orchestrator
+    assert kicksaw_integration_utils.SalesforceClient is SfClient
+    assert aws.SQSQueue is SQSQueue
+    assert set(kicksaw_integration_utils.__all__) <= set(dir(kicksaw_integration_utils))
+
+    with pytest.raises(AttributeError):
+        kicksaw_integration_utils.NotAnExport  # pylint: disable=pointless-statement
@@ -0,0 +1,195 @@
+import io
+import json
+import logging
+
+import pytest
+
+from kicksaw_integration_utils import instrumentation
+from kicksaw_integration_utils.instrumentation import (
+    BUCKETS,
+    EMFExporter,
+    Exporter,
+    LoggingExporter,
+    MetricPoint,
+)
+
+
+class RecordingExporter(Exporter):
+    def __init__(self) -> None:
+        self.spans = []
+        self.counts = []
+        self.metrics = []
+
+    def export_span(self, span):
+        self.spans.append(span)
+
+    def export_count(self, name, value, unit, attributes):
+        self.counts.append((name, value, attributes))
+
+    def export_metrics(self, metrics):
+        self.metrics.append(metrics)
+
+
+@pytest.fixture
+def exporter():
+    exporter = RecordingExporter()
+    instrumentation.enable(exporter)
+    yield exporter
+    instrumentation.disable()
+
+
+def get_point(metrics, name, **attributes) -> MetricPoint:
+    return next(
+        point
+        for point in metrics
+        if point.name == name and point.attributes == attributes
+    )
+
+
+def test_disabled():
+    assert not instrumentation.is_enabled()
+    with instrumentation.span("nothing", key="value") as span:
+        span.set_attribute("more", 1)
+    instrumentation.count("nothing")
+    instrumentation.observe("nothing", 1)
+    assert instrumentation.timed("nothing", sum, [1, 2]) == 3
+    assert instrumentation.get_metrics() == []
+
+
+def test_spans_and_metrics(exporter):
+    with instrumentation.span("work", key="a.csv") as span:
+        span.set_attribute("rows", 2)
+    with pytest.raises(ValueError):
+        with instrumentation.span("work"):
+            raise ValueError
+    instrumentation.count("api_calls", operation="send")
+    instrumentation.count("api_calls", 2, operation="send")
+    instrumentation.count("api_calls", operation="delete")
+    instrumentation.observe("latency", 3)
+    instrumentation.observe("latency", 7000)
+
+    assert [span.name for span in exporter.spans] == ["work", "work"]
+    assert exporter.spans[0].attributes == {"key": "a.csv", "rows": 2}
+    assert exporter.spans[0].error is None
+    assert exporter.spans[1].error == "ValueError"
+    assert exporter.counts[0] == ("api_calls", 1, {"operation": "send"})
+
+    metrics = instrumentation.flush()
+    assert exporter.metrics == [metrics]
+    assert get_point(metrics, "api_calls", operation="send").value == 3
+    assert get_point(metrics, "api_calls", operation="delete").value == 1
+    work = get_point(metrics, "work")
+    assert work.kind == "histogram"
+    assert work.unit == "Milliseconds"
+    assert work.count == 2
+    latency = get_point(metrics, "latency")
+    assert (latency.count, latency.value, latency.min, latency.max) == (
+        2,
+        7003,
+        3,
+        7000,
+    )
+    assert latency.buckets[BUCKETS.index(5)] == 1
+    assert latency.buckets[BUCKETS.index(10000)] == 1
+
+    # flushing starts over
+    assert instrumentation.get_metrics() == []
+
+
+def test_instrumented(exporter):
+    @instrumentation.instrumented("add")
+    def add(a, b):
+        return a + b
+
+    assert add(1, 2) == 3
+    assert exporter.spans[0].name == "add"
+
+
+def test_logging_exporter(caplog):
+    instrumentation.enable(LoggingExporter())
+    try:
+        with caplog.at_level(logging.DEBUG, logger="kicksaw_integration_utils"):
+            with instrumentation.span("work"):
+                pass
+            instrumentation.count("api_calls", operation="send")
+            instrumentation.flush()
+    finally:
+        instrumentation.disable()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0].startswith("work took")
+    assert "api_calls {'operation': 'send'}: 1 Count" in messages
+    assert any(message.startswith("work {}: count 1") for message in messages)
+
+
+def test_emf_exporter():
+    stream = io.StringIO()
+    instrumentation.enable(EMFExporter("Tests", {"Integration": "test"}, stream))
+    try:
+        instrumentation.count("api_calls", 2, operation="send")
+        for _ in range(150):
+            instrumentation.observe("latency", 20)
+        instrumentation.flush()
+    finally:
+        instrumentation.disable()
+
+    documents = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(documents) == 3
+
+    counters = documents[0]
+    metadata = counters["_aws"]["CloudWatchMetrics"][0]
+    assert metadata["Namespace"] == "Tests"
+    assert metadata["Dimensions"] == [["Integration", "operation"]]
+    assert metadata["Metrics"] == [{"Name": "api_calls", "Unit": "Count"}]
+    assert counters["Integration"] == "test"
+    assert counters["operation"] == "send"
+    assert counters["api_calls"] == 2
+
+    # at most 100 values per document; bucket bounds are capped at the max
+    assert documents[1]["latency"] == [20] * 100
+    assert documents[2]["latency"] == [20] * 50
+    assert documents[1]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["Integration"]
+    ]
+
+
+def test_opentelemetry_exporter():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    span_exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    reader = InMemoryMetricReader()
+    meter_provider = MeterProvider(metric_readers=[reader])
+
+    instrumentation.enable(
+        instrumentation.OpenTelemetryExporter(tracer_provider, meter_provider)
+    )
+    try:
+        with instrumentation.span("work", key="a.csv"):
+            pass
+        instrumentation.count("api_calls", 2, operation="send")
+    finally:
+        instrumentation.disable()
+
+    (span,) = span_exporter.get_finished_spans()
+    assert span.name == "work"
+    assert span.attributes["key"] == "a.csv"
+
+    metrics = {
+        metric.name: metric
+        for resource_metrics in reader.get_metrics_data().resource_metrics
+        for scope_metrics in resource_metrics.scope_metrics
+        for metric in scope_metrics.metrics
+    }
+    (point,) = metrics["api_calls"].data.data_points
+    assert point.value == 2
+    assert dict(point.attributes) == {"operation": "send"}
+    assert metrics["work"].data.data_points[0].count == 1
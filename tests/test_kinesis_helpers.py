@@ -0,0 +1,85 @@
+import base64
+import gzip
+import hashlib
+import json
+
+from kicksaw_integration_utils.kinesis_helpers import (
+    KPL_MAGIC,
+    decode_kinesis_event,
+    kinesis_batch_item_failures,
+)
+
+
+def varint(value: int) -> bytes:
+    encoded = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded += bytes([byte | 0x80])
+        else:
+            return encoded + bytes([byte])
+
+
+def length_delimited(field_number: int, value: bytes) -> bytes:
+    return varint(field_number << 3 | 2) + varint(len(value)) + value
+
+
+def aggregate(payloads: list) -> bytes:
+    message = length_delimited(1, b"partition-key")
+    for payload in payloads:
+        record = varint(1 << 3) + varint(0) + length_delimited(3, payload)
+        message += length_delimited(3, record)
+    return KPL_MAGIC + message + hashlib.md5(message).digest()
+
+
+def kinesis_record(data: bytes, sequence_number: str) -> dict:
+    return {
+        "kinesis": {
+            "data": base64.b64encode(data).decode("ascii"),
+            "sequenceNumber": sequence_number,
+        }
+    }
+
+
+def test_decode_kinesis_event():
+    big_payload = {"Name": "Bob" * 1000, "UniqueId__c": "123"}
+    event = {
+        "Records": [
+            kinesis_record(b'{"Name": "Bob", "UniqueId__c": "123"}', "1"),
+            kinesis_record(gzip.compress(json.dumps(big_payload).encode()), "2"),
+            kinesis_record(
+                aggregate([json.dumps({"i": i}).encode() for i in range(300)]), "3"
+            ),
+            kinesis_record(b"not json", "4"),
+            {"kinesis": {"data": "not base64!", "sequenceNumber": "5"}},
+            kinesis_record(b"\x1f\x8bnot really gzip", "6"),
+        ]
+    }
+
+    decoded, failed_sequence_numbers = decode_kinesis_event(event)
+
+    assert decoded[0] == {"Name": "Bob", "UniqueId__c": "123"}
+    assert decoded[1] == big_payload
+    assert decoded[2:] == [{"i": i} for i in range(300)]
+    assert failed_sequence_numbers == ["4", "5", "6"]
+    assert kinesis_batch_item_failures(failed_sequence_numbers) == {
+        "batchItemFailures": [
+            {"itemIdentifier": "4"},
+            {"itemIdentifier": "5"},
+            {"itemIdentifier": "6"},
+        ]
+    }
+
+
+def test_decode_kinesis_event_with_tampered_aggregate():
+    data = aggregate([b'{"i": 1}'])
+    data = data[:-1] + bytes([data[-1] ^ 0xFF])
+
+    decoded, failed_sequence_numbers = decode_kinesis_event(
+        {"Records": [kinesis_record(data, "1")]}
+    )
+
+    # not an aggregate after all, and not json either
+    assert decoded == []
+    assert failed_sequence_numbers == ["1"]
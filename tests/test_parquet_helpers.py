@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from kicksaw_integration_utils.parquet_helpers import (
+    ERROR_REPORT_COLUMNS,
+    ParquetErrorReportWriter,
+    create_parquet_error_report,
+)
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def make_errors(count, start=0):
+    return [
+        {
+            "salesforce_object": "Contact",
+            "code": "DIDNT_WORK",
+            "message": "it broke",
+            "upsert_key": "External_Id__c",
+            "upsert_key_value": index,
+            "object_json": {"External_Id__c": index, "LastName": f"Person {index}"},
+        }
+        for index in range(start, start + count)
+    ]
+
+
+def test_writer_flushes_row_groups_as_they_fill(tmp_path):
+    report_path = tmp_path / "report.parquet"
+    writer = ParquetErrorReportWriter(report_path, row_group_size=10)
+
+    assert writer.write(make_errors(25)) == 25
+    # two row groups are out, five errors are buffered
+    assert writer.buffered == 5
+    writer.close()
+
+    report = pq.ParquetFile(str(report_path))
+    assert report.num_row_groups == 3
+    assert report.metadata.row_group(0).column(0).compression == "ZSTD"
+    assert tuple(report.schema_arrow.names) == ERROR_REPORT_COLUMNS
+    assert pa.types.is_dictionary(report.schema_arrow.field("code").type)
+    assert report.schema_arrow.field("object_json").type == pa.string()
+
+    rows = report.read().to_pylist()
+    assert len(rows) == 25
+    assert rows[3]["upsert_key_value"] == "3"
+    assert json.loads(rows[3]["object_json"]) == {
+        "External_Id__c": 3,
+        "LastName": "Person 3",
+    }
+
+
+def test_create_parquet_error_report_adds_to_existing_report(tmp_path):
+    report_path = tmp_path / "errors" / "report.parquet"
+
+    assert create_parquet_error_report(make_errors(3), report_path) == 3
+    assert create_parquet_error_report(make_errors(2, start=3), report_path) == 2
+    assert create_parquet_error_report([], report_path) == 0
+
+    rows = pq.read_table(str(report_path)).to_pylist()
+    assert [row["upsert_key_value"] for row in rows] == ["0", "1", "2", "3", "4"]
+    assert not list(report_path.parent.glob("*.previous"))
+
+
+def test_writer_adds_to_report_of_plain_strings(tmp_path):
+    report_path = tmp_path / "report.parquet"
+    columns = {column: ["0"] for column in ERROR_REPORT_COLUMNS}
+    pq.write_table(pa.table(columns), str(report_path))
+
+    with ParquetErrorReportWriter(report_path) as writer:
+        writer.write(make_errors(1, start=1))
+
+    table = pq.read_table(str(report_path))
+    assert table.column("upsert_key_value").to_pylist() == ["0", "1"]
+    assert table.column("code").to_pylist() == ["0", "DIDNT_WORK"]
+    assert pa.types.is_dictionary(table.schema.field("code").type)
+
+
+def test_empty_report_has_the_schema(tmp_path):
+    report_path = tmp_path / "report.parquet"
+    ParquetErrorReportWriter(report_path).close()
+
+    table = pq.read_table(str(report_path))
+    assert table.num_rows == 0
+    assert tuple(table.schema.names) == ERROR_REPORT_COLUMNS
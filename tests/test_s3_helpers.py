@@ -1,5 +1,6 @@
 import boto3
 import datetime
+import json
 import os
 import pytest
 
@@ -9,12 +10,19 @@ from botocore.exceptions import ClientError
 
 from moto import mock_s3
 
+from kicksaw_integration_utils.idempotency import (
+    InProgressError,
+    MemoryIdempotencyStore,
+)
 from kicksaw_integration_utils.utils import get_iso
 from kicksaw_integration_utils.s3_helpers import (
     get_prefix_from_s3_key,
     parse_kinesis_record,
     timestamp_s3_key,
     respond_to_s3_event,
+    respond_to_s3_event_concurrently,
+    get_batch_item_failures,
+    get_s3_record_idempotency_key,
     move_file,
     upload_file,
     download_file,
@@ -168,6 +176,178 @@ def test_respond_to_s3_event(s3_key, expected_s3_key, bucket, expected_bucket):
     respond_to_s3_event(event, process)
 
 
+def s3_record(s3_key, bucket="bucket", etag=None):
+    s3_object = {"key": s3_key}
+    if etag:
+        s3_object["eTag"] = etag
+    return {"s3": {"bucket": {"name": bucket}, "object": s3_object}}
+
+
+def test_respond_to_s3_event_skips_duplicates():
+    processed = []
+
+    def process(s3_object_key, bucket_name):
+        if s3_object_key == "bad.csv" and "bad.csv" not in processed:
+            processed.append(s3_object_key)
+            raise ValueError("can't process bad.csv")
+        processed.append(s3_object_key)
+
+    store = MemoryIdempotencyStore()
+    event = {
+        "Records": [
+            s3_record("a.csv", etag="1"),
+            s3_record("a.csv", etag="1"),
+            s3_record("a.csv", etag="2"),
+        ]
+    }
+    respond_to_s3_event(event, process, idempotency_store=store)
+    respond_to_s3_event(event, process, idempotency_store=store)
+    assert processed == ["a.csv", "a.csv"]
+
+    # failures are released, so the retry goes through
+    event = {"Records": [s3_record("bad.csv", etag="1")]}
+    with pytest.raises(ValueError):
+        respond_to_s3_event(event, process, idempotency_store=store)
+    respond_to_s3_event(event, process, idempotency_store=store)
+    assert processed == ["a.csv", "a.csv", "bad.csv", "bad.csv"]
+
+
+def test_respond_to_s3_event_retries_events_in_progress():
+    processed = []
+    store = MemoryIdempotencyStore()
+    event = {"Records": [s3_record("a.csv", etag="1"), s3_record("b.csv", etag="1")]}
+    # as if another worker held a.csv, and could still die without finishing it
+    store.claim(get_s3_record_idempotency_key(event["Records"][0]))
+
+    with pytest.raises(InProgressError):
+        respond_to_s3_event(
+            event, lambda key, bucket: processed.append(key), idempotency_store=store
+        )
+    assert processed == ["b.csv"]
+
+
+def process_or_fail(s3_object_key, bucket_name, suffix=""):
+    if "bad" in s3_object_key:
+        raise ValueError(f"can't process {s3_object_key}")
+    return f"{bucket_name}/{s3_object_key}{suffix}"
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_respond_to_s3_event_concurrently(use_processes):
+    event = {
+        "Records": [
+            s3_record("good+1.csv"),
+            s3_record("bad.csv"),
+            s3_record("good-2.csv"),
+        ]
+    }
+
+    results = respond_to_s3_event_concurrently(
+        event, process_or_fail, suffix="!", use_processes=use_processes
+    )
+
+    assert [result.success for result in results] == [True, False, True]
+    assert results[0].result == "bucket/good 1.csv!"
+    assert results[2].result == "bucket/good-2.csv!"
+    assert "can't process bad.csv" in results[1].error
+    assert get_batch_item_failures(results) == {
+        "batchItemFailures": [{"itemIdentifier": "bad.csv"}]
+    }
+
+
+def test_respond_to_s3_event_concurrently_skips_duplicates():
+    store = MemoryIdempotencyStore()
+    event = {
+        "Records": [
+            s3_record("good.csv", etag="1"),
+            s3_record("bad.csv", etag="1"),
+            s3_record("good.csv", etag="1"),
+        ]
+    }
+
+    results = respond_to_s3_event_concurrently(
+        event, process_or_fail, idempotency_store=store
+    )
+    assert [result.success for result in results] == [True, False, True]
+    assert [result.skipped for result in results] == [False, False, True]
+
+    results = respond_to_s3_event_concurrently(
+        event, process_or_fail, idempotency_store=store
+    )
+    assert [result.success for result in results] == [True, False, True]
+    assert [result.skipped for result in results] == [True, False, True]
+
+    # still being processed elsewhere: retried, not dropped
+    event = {"Records": [s3_record("slow.csv", etag="1")]}
+    store.claim(get_s3_record_idempotency_key(event["Records"][0]))
+    results = respond_to_s3_event_concurrently(
+        event, process_or_fail, idempotency_store=store
+    )
+    assert results[0].skipped and not results[0].success
+    assert get_batch_item_failures(results) == {
+        "batchItemFailures": [{"itemIdentifier": "slow.csv"}]
+    }
+
+
+def test_respond_to_s3_event_concurrently_through_sqs():
+    event = {
+        "Records": [
+            {
+                "messageId": "message-1",
+                "body": json.dumps(
+                    {"Records": [s3_record("a.csv"), s3_record("bad.csv")]}
+                ),
+            },
+            {
+                "messageId": "message-2",
+                "body": json.dumps({"Records": [s3_record("b.csv")]}),
+            },
+            {
+                "messageId": "message-3",
+                "body": json.dumps({"Event": "s3:TestEvent"}),
+            },
+        ]
+    }
+
+    results = respond_to_s3_event_concurrently(event, process_or_fail)
+
+    assert [result.item_identifier for result in results] == [
+        "message-1",
+        "message-1",
+        "message-2",
+    ]
+    assert get_batch_item_failures(results) == {
+        "batchItemFailures": [{"itemIdentifier": "message-1"}]
+    }
+
+
+def test_respond_to_s3_event_concurrently_isolates_bad_records():
+    event = {
+        "Records": [
+            {"messageId": "message-1", "body": "not json"},
+            {
+                "messageId": "message-2",
+                "body": json.dumps({"Records": [s3_record("b.csv"), {}]}),
+            },
+            {
+                "messageId": "message-3",
+                "body": json.dumps({"Records": [s3_record("a.csv")]}),
+            },
+        ]
+    }
+
+    results = respond_to_s3_event_concurrently(event, process_or_fail)
+
+    assert [result.success for result in results] == [False, False, True]
+    assert results[2].result == "bucket/a.csv"
+    assert get_batch_item_failures(results) == {
+        "batchItemFailures": [
+            {"itemIdentifier": "message-1"},
+            {"itemIdentifier": "message-2"},
+        ]
+    }
+
+
 @pytest.mark.parametrize(
     "record,expected",
     [
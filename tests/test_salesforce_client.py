@@ -0,0 +1,441 @@
+import csv
+import gzip
+import json
+import re
+
+import requests
+import responses
+
+from simple_mockforce import mock_salesforce
+
+from kicksaw_integration_utils import salesforce_client
+from kicksaw_integration_utils.concurrency import AdaptiveLimiter
+from kicksaw_integration_utils.governor import SalesforceGovernor
+from kicksaw_integration_utils.salesforce_client import (
+    SalesforceHTTPAdapter,
+    SFBulkType,
+    SfClient,
+    build_session,
+)
+from kicksaw_integration_utils.sfdc_helpers import parse_bulk_upsert_results
+
+
+def get_client(**kwargs):
+    return SfClient("username", "password", "security_token", "na", **kwargs)
+
+
+@mock_salesforce
+def test_bulk_handlers_are_cached():
+    salesforce = get_client()
+
+    assert salesforce.bulk is salesforce.bulk
+    assert salesforce.bulk.Account is salesforce.bulk.Account
+    assert salesforce.bulk.Account is not salesforce.bulk.Contact
+    assert salesforce.bulk.Account.session is salesforce.session
+
+
+@mock_salesforce
+def test_bulk_handler_is_rebuilt_on_new_session():
+    salesforce = get_client()
+
+    bulk = salesforce.bulk
+    salesforce.session_id = "a-new-session"
+
+    assert salesforce.bulk is not bulk
+    assert salesforce.bulk.session_id == "a-new-session"
+
+
+@mock_salesforce
+def test_client_uses_tuned_session():
+    salesforce = get_client(pool_maxsize=64, compress_requests=True)
+
+    adapter = salesforce.session.get_adapter("https://mock.salesforce.com")
+    assert isinstance(adapter, SalesforceHTTPAdapter)
+    assert adapter._pool_maxsize == 64
+    assert adapter.compress_requests
+
+
+@mock_salesforce
+def test_bulk_upsert_through_tuned_session():
+    salesforce = get_client(compress_requests=True)
+
+    data = [{"Name": f"Account {i}", "External_Id__c": str(i)} for i in range(5)]
+    results = salesforce.bulk.Account.upsert(data, "External_Id__c")
+
+    assert len(results) == len(data)
+    assert all(result["success"] for result in results)
+
+
+def test_build_session_mounts_adapter():
+    session = build_session(max_retries=5)
+    adapter = session.get_adapter("https://example.my.salesforce.com")
+    assert isinstance(adapter, SalesforceHTTPAdapter)
+    assert adapter.max_retries.total == 5
+
+
+def test_gzip_body():
+    adapter = SalesforceHTTPAdapter(compress_requests=True, compress_min_size=10)
+    body = '[{"Name": "A name"}]' * 10
+    request = requests.Request(
+        "POST", "https://example.my.salesforce.com", data=body
+    ).prepare()
+
+    adapter.gzip_body(request)
+
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert request.headers["Content-Length"] == str(len(request.body))
+    assert gzip.decompress(request.body).decode("utf-8") == body
+
+
+def test_gzip_body_skips_small_payloads():
+    adapter = SalesforceHTTPAdapter(compress_requests=True)
+    request = requests.Request(
+        "POST", "https://example.my.salesforce.com", data="{}"
+    ).prepare()
+
+    adapter.gzip_body(request)
+
+    assert "Content-Encoding" not in request.headers
+    assert request.body == "{}"
+
+
+@responses.activate
+def test_governed_session_retries_concurrent_limit_exceeded():
+    url = "https://example.my.salesforce.com/services/data/v52.0/limits"
+    responses.add(
+        responses.GET,
+        url,
+        status=403,
+        json=[
+            {
+                "message": "ConcurrentPerOrgLongTxn Limit exceeded.",
+                "errorCode": "REQUEST_LIMIT_EXCEEDED",
+            }
+        ],
+    )
+    responses.add(
+        responses.GET,
+        url,
+        json={},
+        headers={"Sforce-Limit-Info": "api-usage=950/1000"},
+    )
+    governor = SalesforceGovernor(pause_seconds=0, min_rate=1)
+    session = build_session(governor=governor)
+
+    response = session.get(url)
+
+    assert response.status_code == 200
+    assert len(responses.calls) == 2
+    assert governor.usage.used == 950
+    assert governor.effective_rate() == 1
+
+
+def collections_callback(request):
+    payload = json.loads(request.body)
+    results = []
+    for idx, record in enumerate(payload["records"]):
+        assert record["attributes"] == {"type": "Account"}
+        if record.get("Name"):
+            results.append({"id": f"001{idx}", "success": True, "errors": []})
+        else:
+            results.append(
+                {
+                    "id": None,
+                    "success": False,
+                    "errors": [
+                        {
+                            "statusCode": "REQUIRED_FIELD_MISSING",
+                            "message": "Required fields are missing: [Name]",
+                            "fields": ["Name"],
+                        }
+                    ],
+                }
+            )
+    return 200, {}, json.dumps(results)
+
+
+@mock_salesforce
+def test_collections_upsert():
+    responses.add_callback(
+        responses.PATCH,
+        re.compile(r".*/composite/sobjects/Account/External_Id__c$"),
+        callback=collections_callback,
+    )
+    salesforce = get_client()
+
+    data = [{"Name": f"Account {i}", "External_Id__c": str(i)} for i in range(450)]
+    data[0]["Name"] = None
+    results = salesforce.collections.Account.upsert(data, "External_Id__c")
+
+    assert len(responses.calls) - 1 == 3  # minus login, 200 + 200 + 50
+    assert len(results) == len(data)
+
+    successes, errors = parse_bulk_upsert_results(
+        results, data, "Account", "External_Id__c"
+    )
+    assert len(successes) == 449
+    assert len(errors) == 1
+    assert errors[0]["code"] == "REQUIRED_FIELD_MISSING"
+    assert errors[0]["upsert_key_value"] == "0"
+
+
+@mock_salesforce
+def test_collections_delete():
+    responses.add(
+        responses.DELETE,
+        re.compile(r".*/composite/sobjects\?.*"),
+        json=[{"id": "001A", "success": True, "errors": []}],
+    )
+    salesforce = get_client()
+
+    results = salesforce.collections.Account.delete([{"Id": "001A"}])
+
+    assert results == [{"id": "001A", "success": True, "errors": []}]
+    assert "ids=001A" in responses.calls[-1].request.url
+    assert "allOrNone=false" in responses.calls[-1].request.url
+
+
+@mock_salesforce
+def test_push_picks_api_by_size():
+    responses.add_callback(
+        responses.POST,
+        re.compile(r".*/composite/sobjects$"),
+        callback=collections_callback,
+    )
+    salesforce = get_client()
+
+    data = [{"Name": f"Account {i}"} for i in range(3)]
+    results = salesforce.push("Account", "insert", data, bulk_threshold=5)
+    assert "composite/sobjects" in responses.calls[-1].request.url
+    assert all(result["success"] for result in results)
+
+    results = salesforce.push("Account", "insert", data, bulk_threshold=2)
+    assert "/services/async/" in responses.calls[-1].request.url
+    assert len(results) == len(data)
+
+
+BULK_URL = "https://example.my.salesforce.com/services/async/52.0/"
+
+
+def add_pk_chunked_query_responses():
+    job_url = f"{BULK_URL}job/750J"
+    responses.add(responses.POST, f"{BULK_URL}job", json={"id": "750J"})
+    responses.add(responses.POST, f"{job_url}/batch", json={"id": "751B"})
+    responses.add(responses.POST, job_url, json={"id": "750J", "state": "Closed"})
+    responses.add(
+        responses.GET,
+        f"{job_url}/batch",
+        json={"batchInfo": [{"id": "751B", "state": "InProgress"}]},
+    )
+    responses.add(
+        responses.GET,
+        f"{job_url}/batch",
+        json={
+            "batchInfo": [
+                {"id": "751B", "state": "NotProcessed"},
+                {"id": "751C1", "state": "Completed"},
+                {"id": "751C2", "state": "Completed"},
+            ]
+        },
+    )
+    responses.add(responses.GET, f"{job_url}/batch/751C1/result", json=["r1", "r2"])
+    responses.add(responses.GET, f"{job_url}/batch/751C2/result", json=["r3"])
+    pages = [
+        ("751C1", "r1", ["A", "B"]),
+        ("751C1", "r2", ["C"]),
+        ("751C2", "r3", ["D", "E"]),
+    ]
+    for batch_id, result_id, names in pages:
+        responses.add(
+            responses.GET,
+            f"{job_url}/batch/{batch_id}/result/{result_id}",
+            json=[
+                {"attributes": {"type": "Account"}, "Name": name, "Owner": None}
+                for name in names
+            ],
+        )
+
+
+def get_bulk_type():
+    return SFBulkType(
+        "Account", BULK_URL, {"X-SFDC-Session": "session"}, requests.Session()
+    )
+
+
+@responses.activate
+def test_query_pages_with_pk_chunking():
+    add_pk_chunked_query_responses()
+
+    pages = get_bulk_type().query_pages(
+        "SELECT Name FROM Account", pk_chunking=True, chunk_size=2, wait=0
+    )
+
+    names = [[record["Name"] for record in page] for page in pages]
+    assert names == [["A", "B"], ["C"], ["D", "E"]]
+    assert responses.calls[0].request.headers["Sforce-Enable-PKChunking"] == (
+        "chunkSize=2"
+    )
+
+
+@responses.activate
+def test_query_to_file(tmp_path):
+    add_pk_chunked_query_responses()
+
+    path = tmp_path / "accounts.csv"
+    count = get_bulk_type().query_to_file(
+        "SELECT Name FROM Account", path, file_format="csv", pk_chunking=True, wait=0
+    )
+
+    assert count == 5
+    with open(path) as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert [row["Name"] for row in rows] == ["A", "B", "C", "D", "E"]
+    assert "attributes" not in rows[0]
+
+
+@mock_salesforce
+def test_bulk_batches_are_sized(monkeypatch):
+    monkeypatch.setattr(salesforce_client, "BULK_BATCH_MAX_BYTES", 100)
+    salesforce = get_client()
+    bulk_type = salesforce.bulk.Account
+    added_batches = list()
+    add_batch = bulk_type._add_batch
+
+    def spy(job_id, data, operation):
+        added_batches.append(len(data))
+        return add_batch(job_id, data, operation)
+
+    monkeypatch.setattr(bulk_type, "_add_batch", spy)
+
+    data = [{"Name": f"Account {i}", "External_Id__c": str(i)} for i in range(10)]
+    results = bulk_type.upsert(data, "External_Id__c", batch_size=4)
+
+    assert len(results) == len(data)
+    assert all(result["success"] for result in results)
+    assert sum(added_batches) == len(data)
+    # two records fit in 100 bytes, so the size limit kicks in before batch_size
+    assert added_batches == [2, 2, 2, 2, 2]
+
+    assert bulk_type.insert([]) == []
+
+
+@mock_salesforce
+def test_bulk_upsert_with_limiter():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=2, latency_tolerance=None)
+    salesforce = get_client(bulk_limiter=limiter)
+
+    data = [{"Name": f"Account {i}", "External_Id__c": str(i)} for i in range(10)]
+    results = salesforce.bulk.Account.upsert(data, "External_Id__c", batch_size=2)
+
+    assert len(results) == len(data)
+    assert all(result["success"] for result in results)
+    assert salesforce.bulk.Account.limiter is limiter
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+@mock_salesforce
+def test_bulk_upsert_groups_by_parent(monkeypatch):
+    salesforce = get_client()
+    bulk_type = salesforce.bulk.Account
+    added_batches = list()
+    add_batch = bulk_type._add_batch
+
+    def spy(job_id, data, operation):
+        added_batches.append([record["Parent__c"] for record in data])
+        return add_batch(job_id, data, operation)
+
+    monkeypatch.setattr(bulk_type, "_add_batch", spy)
+
+    parents = "ABACBCAAD"
+    data = [
+        {"Name": f"Account {i}", "External_Id__c": str(i), "Parent__c": parent}
+        for i, parent in enumerate(parents)
+    ]
+    results = bulk_type.upsert(
+        data, "External_Id__c", batch_size=4, parent_key=lambda r: r["Parent__c"]
+    )
+
+    assert added_batches == [["A"] * 4, ["B", "B", "C", "C"], ["D"]]
+    assert all(result["success"] for result in results)
+
+    # the results are in the order of data, not of the batches
+    ids = {
+        record["External_Id__c"]: record["Id"]
+        for record in salesforce.query_all("SELECT Id, External_Id__c FROM Account")[
+            "records"
+        ]
+    }
+    assert [result["id"] for result in results] == [
+        ids[record["External_Id__c"]] for record in data
+    ]
+
+
+@mock_salesforce
+def test_bulk_upsert_pushes_oversized_parents_serially(monkeypatch):
+    salesforce = get_client()
+    bulk_type = salesforce.bulk.Account
+    jobs = list()
+    create_job = bulk_type._create_job
+    add_batch = bulk_type._add_batch
+
+    def create_job_spy(operation, use_serial, external_id_field=None):
+        jobs.append((use_serial, list()))
+        return create_job(operation, use_serial, external_id_field)
+
+    def add_batch_spy(job_id, data, operation):
+        jobs[-1][1].append([record["Parent__c"] for record in data])
+        return add_batch(job_id, data, operation)
+
+    monkeypatch.setattr(bulk_type, "_create_job", create_job_spy)
+    monkeypatch.setattr(bulk_type, "_add_batch", add_batch_spy)
+
+    parents = "AABAAACAA"
+    data = [
+        {"Name": f"Account {i}", "External_Id__c": str(i), "Parent__c": parent}
+        for i, parent in enumerate(parents)
+    ]
+    results = bulk_type.upsert(
+        data, "External_Id__c", batch_size=4, parent_key=lambda r: r["Parent__c"]
+    )
+
+    # A's seven children don't fit in a batch, so they're pushed after the
+    # others, in a serial job
+    assert jobs == [(False, [["B", "C"]]), (True, [["A"] * 4, ["A"] * 3])]
+    assert all(result["success"] for result in results)
+    ids = {
+        record["External_Id__c"]: record["Id"]
+        for record in salesforce.query_all("SELECT Id, External_Id__c FROM Account")[
+            "records"
+        ]
+    }
+    assert [result["id"] for result in results] == [
+        ids[record["External_Id__c"]] for record in data
+    ]
+
+
+def test_lock_errors_are_pushed_again(monkeypatch):
+    bulk_type = get_bulk_type()
+    locked = {"success": False, "errors": [{"statusCode": "UNABLE_TO_LOCK_ROW"}]}
+    invalid = {"success": False, "errors": [{"statusCode": "INVALID_FIELD"}]}
+    writes = list()
+
+    def write_batches(operation, data, use_serial, *args):
+        writes.append(([record["Name"] for record in data], use_serial))
+        if len(writes) == 1:
+            return [{"success": True}, locked, invalid, locked]
+        # B goes through, D stays locked
+        return [{"success": True}, locked][-len(data) :]
+
+    monkeypatch.setattr(bulk_type, "_write_batches", write_batches)
+
+    data = [{"Name": name} for name in "ABCD"]
+    results = bulk_type.upsert(data, "Name")
+
+    # B went through on the first retry, D never did
+    assert writes == [
+        (["A", "B", "C", "D"], False),
+        (["B", "D"], True),
+        (["D"], True),
+    ]
+    assert results == [{"success": True}, {"success": True}, invalid, locked]
@@ -1,4 +1,9 @@
-from kicksaw_integration_utils.sfdc_helpers import extract_errors_from_results
+from kicksaw_integration_utils.sfdc_helpers import (
+    extract_errors_from_results,
+    parse_bulk_upsert_results,
+    has_lock_errors,
+    split_lock_errors,
+)
 
 
 def test_extract_errors_from_results():
@@ -12,3 +17,33 @@ def test_extract_errors_from_results():
 
     assert len(errors) == 2
     assert errors == [1, 2]
+
+
+def test_has_lock_errors():
+    locked = {
+        "success": False,
+        "errors": [{"statusCode": "UNABLE_TO_LOCK_ROW", "message": "locked"}],
+    }
+    other = {"success": False, "errors": [{"statusCode": "REQUIRED_FIELD_MISSING"}]}
+
+    assert has_lock_errors([{"success": True, "errors": []}, locked])
+    assert not has_lock_errors([{"success": True, "errors": []}, other])
+    assert not has_lock_errors([])
+
+
+def test_split_lock_errors():
+    data = [{"Key": "1"}, {"Key": "2"}, {"Key": "3"}]
+    results = [
+        {"success": True, "errors": []},
+        {"success": False, "errors": [{"statusCode": "UNABLE_TO_LOCK_ROW"}]},
+        {"success": False, "errors": [{"statusCode": "REQUIRED_FIELD_MISSING"}]},
+    ]
+
+    successes, errors = parse_bulk_upsert_results(results, data, "Contact", "Key")
+    assert len(successes) == 1
+    assert len(errors) == 2
+
+    errors, locked = split_lock_errors(errors)
+    assert [error["upsert_key_value"] for error in errors] == ["3"]
+    assert [error["upsert_key_value"] for error in locked] == ["2"]
+    assert locked[0]["code"] == "UNABLE_TO_LOCK_ROW"
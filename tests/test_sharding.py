@@ -0,0 +1,183 @@
+import csv
+import os
+
+import boto3
+import pytest
+
+from moto import mock_s3
+
+from kicksaw_integration_utils.orchestrator import Orchestrator
+from kicksaw_integration_utils.parquet_helpers import create_parquet_error_report
+from kicksaw_integration_utils.s3_helpers import upload_file
+from kicksaw_integration_utils.sharding import (
+    Shard,
+    ShardResult,
+    download_shard,
+    get_shard_file_name,
+    plan_shards,
+    run_shards,
+)
+
+BUCKET_NAME = "a-bucket"
+
+
+@pytest.fixture(scope="function")
+def bucket():
+    with mock_s3():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket=BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+        )
+        yield s3_client
+
+
+def put_csv(s3_client, s3_key, rows):
+    lines = ["ID,Name"] + [f"{idx},{name}" for idx, name in rows]
+    s3_client.put_object(Bucket=BUCKET_NAME, Key=s3_key, Body="\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("shard_size", [1, 10, 37, 100, 10_000])
+def test_plan_and_download_shards(bucket, shard_size):
+    rows = [(idx, f"Person number {idx}") for idx in range(50)]
+    put_csv(bucket, "origin/big.csv", rows)
+
+    shards = plan_shards("origin/big.csv", BUCKET_NAME, shard_size=shard_size)
+
+    assert shards[0].header == "ID,Name\n"
+    assert [shard.index for shard in shards] == list(range(len(shards)))
+    assert all(left.end == right.start for left, right in zip(shards, shards[1:]))
+
+    read_rows = []
+    for shard in shards:
+        path = download_shard(shard)
+        assert path.name == get_shard_file_name("big.csv", shard.index)
+        with open(path, newline="") as shard_file:
+            read_rows += [
+                (int(row["ID"]), row["Name"]) for row in csv.DictReader(shard_file)
+            ]
+        os.remove(path)
+    assert read_rows == rows
+
+
+def process_shard(shard: Shard) -> ShardResult:
+    return ShardResult(index=shard.index, error_count=shard.end - shard.start)
+
+
+def test_run_shards():
+    shards = [
+        Shard(
+            s3_object_key="big.csv",
+            bucket_name=BUCKET_NAME,
+            index=index,
+            start=index * 10,
+            end=index * 10 + index,
+            header="ID\n",
+        )
+        for index in range(4)
+    ]
+
+    results = run_shards(shards, process_shard, max_workers=2)
+
+    assert [result.error_count for result in results] == [0, 1, 2, 3]
+
+
+def test_merge_shards(bucket, tmp_path):
+    headers = "salesforce_object,code,message\n"
+    for index in range(2):
+        path = tmp_path / f"report-{index}.csv"
+        path.write_text(headers + f"Contact,FAIL_{index},broke\n")
+        upload_file(path, BUCKET_NAME, f"errors/report-{index}.csv")
+
+    orchestrator = Orchestrator("origin/big.csv", BUCKET_NAME, download=False)
+    orchestrator.merge_shards(
+        [
+            ShardResult(
+                index=1, error_count=1, error_report_s3_key="errors/report-1.csv"
+            ),
+            ShardResult(index=2, error_count=0),
+            ShardResult(
+                index=0, error_count=1, error_report_s3_key="errors/report-0.csv"
+            ),
+        ]
+    )
+
+    assert orchestrator.downloaded_file is None
+    assert orchestrator.error_count == 2
+    with open(orchestrator.error_report_path, newline="") as error_report:
+        rows = list(csv.DictReader(error_report))
+    assert [row["code"] for row in rows] == ["FAIL_0", "FAIL_1"]
+
+    os.remove(orchestrator.error_report_path)
+
+
+def test_merge_parquet_shards(bucket, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    for index in range(2):
+        path = tmp_path / f"report-{index}.parquet"
+        create_parquet_error_report(
+            [
+                {
+                    "salesforce_object": "Contact",
+                    "code": f"FAIL_{index}",
+                    "message": "broke",
+                    "upsert_key": "ID",
+                    "upsert_key_value": index,
+                    "object_json": {"ID": index},
+                }
+            ],
+            path,
+        )
+        upload_file(path, BUCKET_NAME, f"errors/report-{index}.parquet")
+
+    orchestrator = Orchestrator(
+        "origin/big.csv", BUCKET_NAME, download=False, report_format="parquet"
+    )
+    orchestrator.merge_shards(
+        [
+            ShardResult(
+                index=1, error_count=1, error_report_s3_key="errors/report-1.parquet"
+            ),
+            ShardResult(
+                index=0, error_count=1, error_report_s3_key="errors/report-0.parquet"
+            ),
+        ]
+    )
+    orchestrator.close_error_report()
+
+    assert orchestrator.error_count == 2
+    rows = pq.read_table(str(orchestrator.error_report_path)).to_pylist()
+    assert [row["code"] for row in rows] == ["FAIL_0", "FAIL_1"]
+
+    os.remove(orchestrator.error_report_path)
+
+
+class ShardOrchestrator(Orchestrator):
+    def serialize(self, rows):
+        yield rows, "Contact", "ID"
+
+    def push(self, data, salesforce_object, upsert_key):
+        return [
+            {
+                "success": False,
+                "errors": [{"statusCode": "DIDNT_WORK", "message": row["Name"]}],
+            }
+            for row in data
+        ]
+
+
+def test_orchestrator_processes_a_shard(bucket):
+    rows = [(idx, f"Person number {idx}") for idx in range(10)]
+    put_csv(bucket, "origin/big.csv", rows)
+    shard = plan_shards("origin/big.csv", BUCKET_NAME, shard_size=50)[1]
+
+    orchestrator = ShardOrchestrator.from_shard(shard)
+    result = orchestrator.run()
+
+    assert result.index == 1
+    assert result.error_count > 0
+    assert result.error_report_s3_key.endswith("-shard-0001.csv")
+    bucket.head_object(Bucket=BUCKET_NAME, Key=result.error_report_s3_key)
+
+    os.remove(orchestrator.downloaded_file)
+    os.remove(orchestrator.error_report_path)